@@ -0,0 +1,571 @@
+# analytics.py
+
+"""Series de tiempo de gastos y viajes sobre una copia columnar de las tablas.
+
+Las consultas de tendencias (gasto por tipo y mes, viajes por ruta y semana)
+no van a la base: se calculan con numpy sobre una copia de `gastos` y `viajes`
+guardada por columnas, con las fechas como días, los textos repetidos
+(moneda, camión, origen, destino, estado) como códigos enteros y los montos
+como float64.
+
+Cada tabla tiene dos partes:
+
+- un segmento base, guardado en `directory` como archivos .npy y abierto con
+  memmap (no se carga en memoria hasta que se lee, y lo comparten los
+  procesos que lo abran), ordenado por id y con una máscara de filas vigentes;
+- las filas creadas o modificadas después, en memoria.
+
+La copia se actualiza con la versión de sincronización (ver sync.py): cada
+commit que escribe gastos o viajes la marca como desactualizada (`mark_stale`,
+registrado con on_commit) y la consulta siguiente lee sólo las filas con
+versión posterior y los tombstones, sin volver a leer las tablas. Las
+escrituras de otros procesos se detectan cada `ttl` segundos. Cuando las
+filas recientes o las eliminadas del segmento base pasan un umbral, se
+escribe un segmento base nuevo. Si la versión guardada es anterior al piso del
+historial (reset de la base o tombstones purgados), se reconstruye completa.
+
+Las agregaciones se hacen con bincount sobre índices de período y de grupo,
+por segmento, así que no se copia el segmento base.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+from sqlalchemy import func, select
+
+from data_versions import get_versions
+from database import Gasto, Tombstone, TipoDeCambio, Viaje
+from exchange import BASE_CURRENCY, ExchangeRates
+from sync import current_state
+
+FREQUENCIES = ('day', 'week', 'month', 'year')
+# by -> columna de agrupación
+GASTO_GROUPS = ('tipo', 'moneda', 'camion')
+VIAJE_GROUPS = ('ruta', 'camion', 'chofer', 'estado')
+DEFAULT_TTL = 5
+# Filas recientes a partir de las cuales se escribe un segmento base nuevo
+COMPACT_ROWS = 50_000
+# Fracción de filas eliminadas del segmento base a partir de la cual se reescribe
+COMPACT_DEAD_FRACTION = 0.2
+FETCH_BATCH_SIZE = 50_000
+# Máximo de celdas (períodos x grupos) que se agregan con un array denso
+MAX_DENSE_BINS = 4_000_000
+
+# columna -> (expresión, tipo): int (int64, -1 = NULL), float, date (datetime64[D]), code (int32 + diccionario)
+GASTO_COLUMNS = {
+    'id': (Gasto.id, 'int'),
+    'fecha': (Gasto.fecha, 'date'),
+    'tipo': (Gasto.tipo_id, 'int'),
+    'moneda': (Gasto.moneda, 'code'),
+    'monto': (Gasto.monto, 'float'),
+    'viaje': (Gasto.viaje_id, 'int'),
+}
+VIAJE_COLUMNS = {
+    'id': (Viaje.id, 'int'),
+    'inicio': (Viaje.fecha_inicio, 'date'),
+    'fin': (Viaje.fecha_fin, 'date'),
+    'origen': (Viaje.origen, 'code'),
+    'destino': (Viaje.destino, 'code'),
+    'chofer': (Viaje.chofer_id, 'int'),
+    'camion': (Viaje.camion_dominio, 'code'),
+    'estado': (Viaje.estado, 'code'),
+}
+_TOMBSTONES = Tombstone.__table__
+_RATES_TABLE = TipoDeCambio.__tablename__
+
+
+class ColumnTable:
+    """Columnas de una tabla: segmento base (memmap) más filas recientes."""
+
+    def __init__(self, model, columns):
+        self.model = model
+        self.name = model.__tablename__
+        self.columns = columns
+        self.clear()
+
+    def clear(self):
+        # código -> valor y valor -> código de cada columna 'code'
+        self.values = {name: [] for name, (_, kind) in self.columns.items() if kind == 'code'}
+        self._codes = {name: {} for name in self.values}
+        self.base = None
+        self.base_alive = None
+        self.base_dead = 0
+        self.recent = {}
+        self._recent_arrays = None
+
+    def query(self):
+        return select(*[func.date(expr) if kind == 'date' else expr
+                        for expr, kind in self.columns.values()])
+
+    def set_values(self, values):
+        self.values = {name: list(items) for name, items in values.items()}
+        self._codes = {name: {value: code for code, value in enumerate(items)}
+                       for name, items in self.values.items()}
+
+    def _encode(self, name, value):
+        if value is None:
+            return -1
+        codes = self._codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.values[name])
+            self.values[name].append(value)
+        return code
+
+    def to_arrays(self, rows):
+        columns = list(zip(*rows)) if rows else [()] * len(self.columns)
+        arrays = {}
+        for (name, (_, kind)), values in zip(self.columns.items(), columns):
+            if kind == 'code':
+                arrays[name] = np.fromiter((self._encode(name, v) for v in values),
+                                           dtype=np.int32, count=len(values))
+            elif kind == 'date':
+                arrays[name] = np.array(values, dtype='datetime64[D]')
+            elif kind == 'float':
+                arrays[name] = np.array(values, dtype=np.float64)
+            else:
+                arrays[name] = np.array([-1 if v is None else v for v in values], dtype=np.int64)
+        return arrays
+
+    def set_base(self, arrays):
+        self.base = arrays
+        self.base_alive = np.ones(len(arrays['id']), dtype=bool)
+        self.base_dead = 0
+        self.recent = {}
+        self._recent_arrays = None
+
+    def apply(self, rows, deleted):
+        """Aplica filas nuevas o modificadas (tuplas en el orden de `columns`) y claves eliminadas."""
+        changed = [row[0] for row in rows] + list(deleted)
+        if self.base is not None and changed and len(self.base['id']):
+            ids = self.base['id']
+            keys = np.asarray(changed, dtype=np.int64)
+            pos = np.minimum(np.searchsorted(ids, keys), len(ids) - 1)
+            hit = pos[ids[pos] == keys]
+            hit = hit[self.base_alive[hit]]
+            if len(hit):
+                # Copia: las consultas en curso siguen usando la máscara anterior.
+                alive = self.base_alive.copy()
+                alive[hit] = False
+                self.base_alive = alive
+                self.base_dead += len(hit)
+        for key in deleted:
+            self.recent.pop(key, None)
+        for row in rows:
+            self.recent[row[0]] = row
+        self._recent_arrays = None
+
+    def segments(self):
+        """[(columnas, máscara de filas vigentes o None)] para agregar."""
+        if self._recent_arrays is None:
+            self._recent_arrays = self.to_arrays(list(self.recent.values()))
+        segments = []
+        if self.base is not None:
+            segments.append((self.base, self.base_alive if self.base_dead else None))
+        segments.append((self._recent_arrays, None))
+        return segments
+
+    def needs_compaction(self):
+        base_rows = len(self.base['id']) if self.base is not None else 0
+        return (len(self.recent) >= COMPACT_ROWS
+                or (base_rows and self.base_dead >= COMPACT_DEAD_FRACTION * base_rows))
+
+    def merged(self):
+        """Todas las filas vigentes en un solo juego de columnas, ordenado por id."""
+        parts = [{name: array[mask] if mask is not None else np.asarray(array) for name, array in arrays.items()}
+                 for arrays, mask in self.segments()]
+        merged = {name: np.concatenate([part[name] for part in parts]) for name in self.columns}
+        order = np.argsort(merged['id'], kind='stable')
+        return {name: array[order] for name, array in merged.items()}
+
+
+class AnalyticsSnapshot:
+    """Estado de la copia en un momento dado; no cambia después de creado."""
+
+    def __init__(self, version, tables, rates):
+        self.version = version
+        self.rates = rates
+        # nombre -> (segmentos, {columna: valores de los códigos})
+        self.tables = {table.name: (table.segments(), {name: tuple(items) for name, items in table.values.items()})
+                       for table in tables}
+
+
+class AnalyticsStore:
+    def __init__(self, directory, ttl=DEFAULT_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self.tables = [ColumnTable(Gasto, GASTO_COLUMNS), ColumnTable(Viaje, VIAJE_COLUMNS)]
+        self.version = None
+        self._generation = None
+        self._rates = None
+        self._rates_version = None
+        self._snapshot = None
+        self._checked_at = 0.0
+        # Commits vistos por mark_stale y los ya incorporados a la copia
+        self._changes = 0
+        self._synced_changes = 0
+        self._lock = threading.Lock()
+
+    def mark_stale(self, changes=None):
+        """Callback de on_commit: la próxima consulta lee los cambios."""
+        if changes is None or any(change['entity'] in ('gastos', 'viajes') for change in changes):
+            self._changes += 1
+
+    def invalidate(self):
+        """Descarta la copia (después de un reset de la base)."""
+        with self._lock:
+            self.version = None
+            self._snapshot = None
+            for table in self.tables:
+                table.clear()
+            self._remove_files()
+
+    def snapshot(self, session, max_age=None):
+        """Devuelve la copia vigente, leyendo antes los cambios si hace falta.
+        `max_age` (segundos, por defecto `ttl`) es cuánto puede pasar sin verificar la versión."""
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            seen = self._changes
+            now = time.monotonic()
+            if (self._snapshot is not None and seen == self._synced_changes
+                    and now - self._checked_at < max_age):
+                return self._snapshot
+            version, floor = current_state(session)
+            if self.version is None:
+                self._load_files()
+            if self.version is None or self.version < floor or self.version > version:
+                self._build(session, version)
+            elif version > self.version:
+                self._apply_changes(session, self.version)
+                self.version = version
+                if any(table.needs_compaction() for table in self.tables):
+                    self._write_files({table.name: table.merged() for table in self.tables})
+            rates_version = get_versions(session, [_RATES_TABLE])[_RATES_TABLE]
+            if rates_version != self._rates_version or self._rates is None:
+                self._rates, self._rates_version = ExchangeRates.load(session), rates_version
+            self._snapshot = AnalyticsSnapshot(self.version, self.tables, self._rates)
+            self._checked_at, self._synced_changes = now, seen
+            return self._snapshot
+
+    # --- Lectura de la base ---
+
+    def _build(self, session, version):
+        merged = {}
+        for table in self.tables:
+            table.clear()
+            parts = []
+            result = session.execute(table.query().order_by(table.model.id),
+                                     execution_options={'yield_per': FETCH_BATCH_SIZE})
+            for rows in result.partitions():
+                parts.append(table.to_arrays(rows))
+            if not parts:
+                parts.append(table.to_arrays([]))
+            merged[table.name] = {name: np.concatenate([part[name] for part in parts]) for name in table.columns}
+        self.version = version
+        self._write_files(merged)
+
+    def _apply_changes(self, session, since):
+        for table in self.tables:
+            rows = session.execute(table.query().where(table.model.version > since)).all()
+            deleted = session.execute(
+                select(_TOMBSTONES.c.row_key)
+                .where(_TOMBSTONES.c.table_name == table.name, _TOMBSTONES.c.version > since)).scalars()
+            table.apply([tuple(row) for row in rows], [int(key) for key in deleted])
+
+    # --- Archivos ---
+
+    def _meta_path(self):
+        return os.path.join(self.directory, 'meta.json')
+
+    def _write_files(self, merged):
+        generation = uuid.uuid4().hex
+        meta = {'version': self.version, 'generation': generation, 'tables': {}}
+        for table in self.tables:
+            path = os.path.join(self.directory, table.name, generation)
+            os.makedirs(path, exist_ok=True)
+            for name, array in merged[table.name].items():
+                np.save(os.path.join(path, f'{name}.npy'), array)
+            meta['tables'][table.name] = {'rows': len(merged[table.name]['id']), 'values': table.values}
+        tmp = f'{self._meta_path()}.{generation}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._meta_path())
+        previous, self._generation = self._generation, generation
+        self._open_generation(generation)
+        if previous is not None:
+            # Los memmaps ya abiertos siguen siendo válidos aunque se borre el archivo.
+            for table in self.tables:
+                shutil.rmtree(os.path.join(self.directory, table.name, previous), ignore_errors=True)
+
+    def _open_generation(self, generation):
+        for table in self.tables:
+            path = os.path.join(self.directory, table.name, generation)
+            table.set_base({name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+                            for name in table.columns})
+
+    def _load_files(self):
+        """Abre el segmento base guardado (por este u otro proceso), si existe."""
+        try:
+            with open(self._meta_path(), encoding='utf-8') as f:
+                meta = json.load(f)
+            for table in self.tables:
+                table.set_values(meta['tables'][table.name]['values'])
+            self._open_generation(meta['generation'])
+        except (OSError, ValueError, KeyError):
+            for table in self.tables:
+                table.clear()
+            return
+        self.version, self._generation = meta['version'], meta['generation']
+
+    def _remove_files(self):
+        self._generation = None
+        try:
+            os.remove(self._meta_path())
+        except FileNotFoundError:
+            pass
+        for table in self.tables:
+            shutil.rmtree(os.path.join(self.directory, table.name), ignore_errors=True)
+
+
+# --- Consultas ---
+
+def _periods(days, freq):
+    """Índice entero del período de cada día (NaT no permitido)."""
+    days = days.astype(np.int64)
+    if freq == 'day':
+        return days
+    if freq == 'week':
+        # 1970-01-01 fue jueves: las semanas empiezan el lunes.
+        return (days + 3) // 7
+    if not len(days):
+        return days
+    # Convertir a meses o años con numpy es lento; se arma la tabla día -> período
+    # del rango de fechas y se indexa.
+    first = int(days.min())
+    calendar = np.arange(first, int(days.max()) + 1).astype('datetime64[D]')
+    calendar = calendar.astype('datetime64[M]' if freq == 'month' else 'datetime64[Y]').astype(np.int64)
+    return calendar[days - first]
+
+
+def _period_start(index, freq):
+    if freq == 'day':
+        return np.datetime64(int(index), 'D')
+    if freq == 'week':
+        return np.datetime64(int(index) * 7 - 3, 'D')
+    unit = 'M' if freq == 'month' else 'Y'
+    return np.datetime64(int(index), unit).astype('datetime64[D]')
+
+
+def _date_mask(days, mask, desde, hasta):
+    valid = ~np.isnat(days)
+    if mask is not None:
+        valid &= mask
+    if desde is not None:
+        valid &= days >= np.datetime64(desde, 'D')
+    if hasta is not None:
+        valid &= days <= np.datetime64(hasta, 'D')
+    return valid
+
+
+def _aggregate(parts, ngroups):
+    """Suma por (período, grupo). `parts`: [(períodos, grupos, {nombre: pesos})].
+    Devuelve [(período, grupo, {'cantidad': n, nombre: suma, ...})] ordenado."""
+    parts = [part for part in parts if len(part[0])]
+    if not parts:
+        return []
+    first = min(int(periods.min()) for periods, _, _ in parts)
+    last = max(int(periods.max()) for periods, _, _ in parts)
+    nbins = (last - first + 1) * ngroups
+    names = list(parts[0][2])
+    if nbins <= MAX_DENSE_BINS:
+        keys = [(periods - first) * ngroups + groups for periods, groups, _ in parts]
+        counts = sum(np.bincount(k, minlength=nbins) for k in keys)
+        sums = {name: sum(np.bincount(k, weights=weights[name], minlength=nbins)
+                          for k, (_, _, weights) in zip(keys, parts)) for name in names}
+        present = np.flatnonzero(counts)
+        counts = counts[present]
+        sums = {name: values[present] for name, values in sums.items()}
+    else:
+        # Demasiados grupos para un array denso: se agrupa ordenando.
+        keys = np.concatenate([(periods - first) * ngroups + groups for periods, groups, _ in parts])
+        present, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse)
+        sums = {name: np.bincount(inverse, weights=np.concatenate([w[name] for _, _, w in parts]))
+                for name in names}
+    result = []
+    for i, key in enumerate(present):
+        period, group = divmod(int(key), ngroups)
+        values = {'cantidad': int(counts[i])}
+        values.update((name, float(sums[name][i])) for name in names)
+        result.append((period + first, group, values))
+    return result
+
+
+def _top_groups(rows, top):
+    totals = {}
+    for _, group, values in rows:
+        totals[group] = totals.get(group, 0) + values['cantidad']
+    keep = set(sorted(totals, key=lambda g: (-totals[g], g))[:top])
+    return [row for row in rows if row[1] in keep]
+
+
+def _rate_table(rates, monedas, target):
+    """Factores de conversión a `target` por (código de moneda, día).
+
+    Devuelve (tabla, primer día, cantidad de días del calendario): la columna 0
+    es para los días anteriores al calendario y la última para los posteriores
+    (vale la última cotización)."""
+    rates.check_currency(target)
+    span = rates.date_range()
+    start, end = span if span is not None else (np.datetime64('today', 'D'),) * 2
+    ndays = int((end - start).astype(np.int64)) + 1
+    days = np.concatenate([[start - 1], start + np.arange(ndays), [end]]).astype('datetime64[D]')
+    target_rates = rates.rates_at(target, days)
+    table = np.full((max(len(monedas), 1), len(days)), np.nan)
+    for code, moneda in enumerate(monedas):
+        table[code] = rates.rates_at(moneda, days) / target_rates
+    return table, start, ndays
+
+
+def _factors(table, start, ndays, monedas, days):
+    index = np.clip((days - start).astype(np.int64) + 1, 0, ndays + 1)
+    return table[monedas, index]
+
+
+def _camion_by_viaje(snapshot):
+    """(tabla id de viaje -> código de camión + 1, dominios); 0 = viaje sin camión.
+    Los ids son autoincrementales: una tabla densa evita buscar cada gasto."""
+    segments, values = snapshot.tables['viajes']
+    ids = [arrays['id'][mask] if mask is not None else arrays['id'] for arrays, mask in segments]
+    camiones = [arrays['camion'][mask] if mask is not None else arrays['camion'] for arrays, mask in segments]
+    size = max([int(part.max()) + 1 for part in ids if len(part)] or [0])
+    table = np.zeros(size + 1, dtype=np.int64)
+    for part_ids, part_camiones in zip(ids, camiones):
+        table[part_ids] = part_camiones.astype(np.int64) + 1
+    return table, values['camion']
+
+
+def _camion_groups(table, viajes):
+    # Viajes inexistentes (fuera de la tabla) van a la última posición, que vale 0.
+    return table[np.where((viajes >= 0) & (viajes < len(table) - 1), viajes, len(table) - 1)]
+
+
+def gasto_series(snapshot, freq='month', by=None, desde=None, hasta=None,
+                 target=BASE_CURRENCY, tipo_nombres=None):
+    """Cantidad y total (convertido a `target` con la cotización de cada día) de
+    los gastos por período y, opcionalmente, por tipo, moneda o camión."""
+    segments, values = snapshot.tables['gastos']
+    monedas = values['moneda']
+    table, start, ndays = _rate_table(snapshot.rates, monedas, target)
+    if by == 'camion':
+        camion_table, labels = _camion_by_viaje(snapshot)
+        ngroups = len(labels) + 1
+    elif by == 'tipo':
+        ngroups = max([int(arrays['tipo'].max()) + 1 for arrays, _ in segments if len(arrays['tipo'])] or [1])
+    elif by == 'moneda':
+        ngroups = max(len(monedas), 1)
+    else:
+        ngroups = 1
+
+    parts, scanned, sin_fecha = [], 0, 0
+    for arrays, mask in segments:
+        fechas = arrays['fecha']
+        scanned += len(fechas) if mask is None else int(mask.sum())
+        if desde is None and hasta is None:
+            undated = np.isnat(fechas) if mask is None else np.isnat(fechas) & mask
+            sin_fecha += int(undated.sum())
+        valid = _date_mask(fechas, mask, desde, hasta)
+        days = fechas[valid]
+        codes = arrays['moneda'][valid]
+        montos = arrays['monto'][valid]
+        converted = montos * _factors(table, start, ndays, codes, days)
+        missing = np.isnan(converted)
+        if by == 'camion':
+            groups = _camion_groups(camion_table, arrays['viaje'][valid])
+        elif by == 'tipo':
+            groups = arrays['tipo'][valid]
+        elif by == 'moneda':
+            groups = codes
+        else:
+            groups = np.zeros(len(days), dtype=np.int64)
+        weights = {'total': np.where(missing, 0.0, converted), 'sinCotizacion': missing.astype(np.float64)}
+        if by == 'moneda':
+            weights['totalMoneda'] = montos
+        parts.append((_periods(days, freq), groups.astype(np.int64), weights))
+
+    series = []
+    for period, group, sums in _aggregate(parts, ngroups):
+        item = {'periodo': str(_period_start(period, freq))}
+        if by == 'tipo':
+            item.update(tipoId=group, tipo=(tipo_nombres or {}).get(group))
+        elif by == 'moneda':
+            item['moneda'] = monedas[group]
+        elif by == 'camion':
+            item['camionDominio'] = labels[group - 1] if group else None
+        item.update(cantidad=sums['cantidad'], total=sums['total'], sinCotizacion=int(sums['sinCotizacion']))
+        if by == 'moneda':
+            item['totalMoneda'] = sums['totalMoneda']
+        series.append(item)
+    return {'version': snapshot.version, 'freq': freq, 'by': by, 'monedaReporte': target,
+            'filas': scanned, 'sinFecha': sin_fecha, 'series': series}
+
+
+def viaje_series(snapshot, freq='month', by=None, desde=None, hasta=None, top=None):
+    """Cantidad de viajes (por fecha de inicio) y días de viaje de los
+    terminados, por período y, opcionalmente, por ruta, camión, chofer o estado.
+    `top` deja sólo los `top` grupos con más viajes."""
+    segments, values = snapshot.tables['viajes']
+    norigen = max(len(values['origen']), 1)
+    if by == 'ruta':
+        ngroups = norigen * max(len(values['destino']), 1)
+    elif by in ('camion', 'estado'):
+        ngroups = len(values[by]) + 1
+    elif by == 'chofer':
+        ngroups = max([int(arrays['chofer'].max()) + 2 for arrays, _ in segments if len(arrays['chofer'])] or [1])
+    else:
+        ngroups = 1
+
+    parts, scanned = [], 0
+    for arrays, mask in segments:
+        inicio = arrays['inicio']
+        scanned += len(inicio) if mask is None else int(mask.sum())
+        valid = _date_mask(inicio, mask, desde, hasta)
+        days = inicio[valid]
+        if by == 'ruta':
+            groups = arrays['origen'][valid] + arrays['destino'][valid].astype(np.int64) * norigen
+        elif by in ('camion', 'estado', 'chofer'):
+            # +1: el grupo 0 son los viajes sin valor
+            groups = arrays[by][valid].astype(np.int64) + 1
+        else:
+            groups = np.zeros(len(days), dtype=np.int64)
+        fin = arrays['fin'][valid]
+        terminado = ~np.isnat(fin)
+        duracion = np.where(terminado, (fin - days).astype(np.int64), 0).astype(np.float64)
+        parts.append((_periods(days, freq), groups,
+                      {'terminados': terminado.astype(np.float64), 'diasDeViaje': duracion}))
+
+    rows = _aggregate(parts, ngroups)
+    if top:
+        rows = _top_groups(rows, top)
+    series = []
+    for period, group, sums in rows:
+        item = {'periodo': str(_period_start(period, freq))}
+        if by == 'ruta':
+            destino, origen = divmod(group, norigen)
+            item.update(origen=values['origen'][origen] if values['origen'] else None,
+                        destino=values['destino'][destino] if values['destino'] else None)
+        elif by == 'camion':
+            item['camionDominio'] = values['camion'][group - 1] if group else None
+        elif by == 'estado':
+            item['estado'] = values['estado'][group - 1] if group else None
+        elif by == 'chofer':
+            item['choferId'] = group - 1 if group else None
+        item.update(cantidad=sums['cantidad'], terminados=int(sums['terminados']),
+                    diasDeViaje=sums['diasDeViaje'])
+        series.append(item)
+    return {'version': snapshot.version, 'freq': freq, 'by': by, 'filas': scanned, 'series': series}
@@ -5,6 +5,14 @@
 
 const API_URL = 'http://127.0.0.1:5001/api';
 
+// Las fotos se guardan en el servidor por clave de contenido; el campo `foto`
+// de un camión contiene esa clave (o null).
+export const photoUrl = (key: string | null, thumbnail = false) =>
+    key ? `${API_URL}/fotos/${key}${thumbnail ? '?size=thumb' : ''}` : null;
+
+// Server-Sent Events con los cambios confirmados en el servidor.
+export const EVENTS_URL = `${API_URL}/events`;
+
 const handleResponse = async (response: Response) => {
     if (!response.ok) {
         const errorText = await response.text();
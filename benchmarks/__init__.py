@@ -0,0 +1 @@
+"""Benchmarks de la API con datos sintéticos (ver dataset.py, bench.py y loadgen.py)."""
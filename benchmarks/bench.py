@@ -0,0 +1,404 @@
+# benchmarks/bench.py
+
+"""Benchmark de los endpoints de la API sobre una base sintética (dataset.py).
+
+Cada caso llama a un endpoint en el mismo proceso con el cliente de pruebas de
+Flask, varias veces, y registra:
+
+- latencia de cada llamada, leyendo el cuerpo completo (también en streaming):
+  la primera por separado (cachés fríos) y min/p50/p95/max/media del resto;
+- tamaño de la respuesta en bytes y cantidad de consultas SQL de la última llamada;
+- pico de memoria residente. En Linux y macOS cada caso corre en un proceso
+  hijo (fork) y el pico es el del hijo, así un caso no hereda la memoria que
+  dejó otro; `rssExtraMb` es lo que creció sobre la memoria al empezar.
+
+El benchmark trabaja sobre una copia temporal de la base, así que las
+escrituras (altas, bajas, importaciones) no alteran la base generada; los
+informes, cachés y la copia columnar también van a un directorio temporal.
+Los informes se miden generándolos cada vez (un caché nuevo por llamada) y,
+por separado, servidos desde el caché.
+
+No se incluyen /api/events (conexión abierta), /api/reset ni los informes
+asíncronos (corren en otros procesos).
+
+El resultado se guarda en JSON; con --baseline se compara con uno anterior y
+el comando sale con 1 si algún caso empeoró más que la tolerancia.
+
+    python -m benchmarks.bench 100k --output resultados.json
+    python -m benchmarks.bench 100k --baseline base.json --tolerance 0.25
+    python -m benchmarks.bench 1k --only informes,gastos --repeat 5
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+from benchmarks.dataset import END, SCALES, ensure
+
+REPEAT = 20
+HEAVY_REPEAT = 3
+# Una regresión de latencia tiene que superar la tolerancia relativa y también esta diferencia absoluta.
+MIN_DELTA_MS = 2.0
+MIN_DELTA_RSS_MB = 16.0
+TOLERANCE = 0.25
+
+
+class Case:
+    """Un endpoint a medir. `prepare(client, i)` puede devolver (url, body)
+    distintos en cada llamada (por ejemplo, el id a eliminar)."""
+
+    def __init__(self, name, method, url, body=None, repeat=REPEAT, prepare=None, fresh_reports=False,
+                 multipart=False):
+        self.name = name
+        self.method = method
+        self.url = url
+        self.body = body
+        self.repeat = repeat
+        self.prepare = prepare
+        self.fresh_reports = fresh_reports
+        self.multipart = multipart
+
+    def request(self, client, i):
+        """(url, body) de la llamada `i`; el prepare no se mide."""
+        return self.prepare(client, i) if self.prepare else (self.url, self.body)
+
+
+def _sample(session):
+    """Ids y fechas del dataset para armar los parámetros de los casos."""
+    from sqlalchemy import func, select
+
+    from database import Camion, GastoPorViaje, Viaje
+
+    viaje_id = session.execute(select(GastoPorViaje.viaje_id).group_by(GastoPorViaje.viaje_id)
+                               .order_by(func.sum(GastoPorViaje.cantidad).desc()).limit(1)).scalar()
+    return {
+        'viaje_id': viaje_id,
+        'camion': session.execute(select(Camion.dominio).order_by(Camion.dominio).limit(1)).scalar(),
+        'ultimo_viaje': session.execute(select(func.max(Viaje.id))).scalar(),
+        'desde': (END - timedelta(days=90)).isoformat(),
+        'hasta': END.isoformat(),
+    }
+
+
+def build_cases(sample):
+    s = sample
+    periodo = f"desde={s['desde']}&hasta={s['hasta']}"
+    cases = [
+        Case('viajes: listado completo', 'GET', '/api/viajes', repeat=HEAVY_REPEAT),
+        Case('viajes: página', 'GET', '/api/viajes?limit=100'),
+        Case('viajes: página por camión', 'GET', f"/api/viajes?camion_dominio={s['camion']}&limit=100"),
+        Case('viajes: página por estado', 'GET', '/api/viajes?estado=En%20Curso&limit=100'),
+        Case('gastos: listado completo', 'GET', '/api/gastos', repeat=HEAVY_REPEAT),
+        Case('gastos: listado completo NDJSON', 'GET', '/api/gastos?format=ndjson', repeat=HEAVY_REPEAT),
+        Case('gastos: página', 'GET', '/api/gastos?limit=100'),
+        Case('gastos: página por período', 'GET', f'/api/gastos?{periodo}&limit=100'),
+        Case('gastos: de un viaje', 'GET', f"/api/gastos?viaje_id={s['viaje_id']}"),
+        Case('gastos: totales', 'GET', '/api/gastos/totales?moneda_reporte=USD', repeat=HEAVY_REPEAT),
+        Case('gastos: totales del período', 'GET', f'/api/gastos/totales?{periodo}&moneda_reporte=USD'),
+        Case('gastos: resumen del período', 'GET', f'/api/gastos/resumen?{periodo}&moneda_reporte=USD'),
+        Case('gastos: resumen de un camión', 'GET', f"/api/gastos/resumen?camion_dominio={s['camion']}"),
+        Case('gastos: resumen de un viaje', 'GET', f"/api/gastos/resumen?viaje_id={s['viaje_id']}"),
+        Case('choferes', 'GET', '/api/choferes'),
+        Case('camiones', 'GET', '/api/camiones'),
+        Case('acoplados', 'GET', '/api/acoplados'),
+        Case('pólizas', 'GET', '/api/polizas'),
+        Case('tipos de gasto', 'GET', '/api/tiposDeGasto'),
+        Case('tipos de cambio', 'GET', '/api/tiposDeCambio'),
+        Case('monedas', 'GET', '/api/currencies'),
+        Case('estados de vehículo', 'GET', '/api/vehiculoEstados'),
+        Case('estados de viaje', 'GET', '/api/viajeEstados'),
+        Case('bootstrap', 'GET', '/api/bootstrap'),
+        Case('dashboard', 'GET', '/api/dashboard'),
+        Case('búsqueda', 'GET', '/api/search?q=Scania'),
+        Case('disponibilidad', 'GET', f"/api/disponibilidad?desde={s['hasta']}&hasta={s['hasta']}T23:59"),
+        Case('coberturas: por vencer', 'GET', f"/api/coberturas/por-vencer?fecha={s['hasta']}&dias=90"),
+        Case('coberturas: sin seguro', 'GET', f"/api/coberturas/sin-seguro?fecha={s['desde']}"),
+        Case('coberturas: viajes sin cobertura', 'GET', '/api/coberturas/viajes-sin-cobertura?limit=100'),
+        Case('analytics: gastos por mes y tipo', 'GET', '/api/analytics/gastos?freq=month&by=tipo&moneda_reporte=USD'),
+        Case('analytics: viajes por semana y ruta', 'GET', '/api/analytics/viajes?freq=week&by=ruta&top=10'),
+        Case('métricas', 'GET', '/api/metrics'),
+        Case('informes: viajes', 'GET', '/api/informes/viajes-excel', repeat=HEAVY_REPEAT, fresh_reports=True),
+        Case('informes: viajes (caché)', 'GET', '/api/informes/viajes-excel'),
+        Case('informes: gastos de un viaje', 'GET', f"/api/informes/gastos-viaje-excel/{s['viaje_id']}?moneda_reporte=USD",
+             fresh_reports=True),
+        Case('informes: gastos del período', 'GET',
+             f"/api/informes/gastos-periodo-excel?fecha_inicio={s['desde']}&fecha_fin={s['hasta']}&moneda_reporte=USD",
+             repeat=HEAVY_REPEAT, fresh_reports=True),
+    ]
+
+    # Escrituras al final: modifican la copia de trabajo.
+    def gasto(i):
+        return {'monto': 1000 + i, 'viajeId': s['viaje_id'], 'tipoId': 1, 'moneda': 'PYG', 'fecha': s['hasta']}
+
+    def delete_gasto(client, i):
+        response = client.post('/api/gastos', json=gasto(i))
+        return f"/api/gastos/{response.get_json()['id']}", None
+
+    csv = 'monto,viaje_id,tipo,moneda,fecha\n' + ''.join(
+        f"{1000 + i},{s['viaje_id']},Peaje,PYG,{s['hasta']}\n" for i in range(1000))
+    cases += [
+        Case('alta de gasto', 'POST', '/api/gastos', prepare=lambda client, i: ('/api/gastos', gasto(i))),
+        Case('modificación de gasto', 'PUT', '/api/gastos/1',
+             prepare=lambda client, i: ('/api/gastos/1', {'monto': 500 + i})),
+        Case('baja de gasto', 'DELETE', '/api/gastos/<id>', prepare=delete_gasto),
+        Case('alta de viaje', 'POST', '/api/viajes', prepare=lambda client, i: ('/api/viajes', {
+            'origen': 'Asunción', 'destino': 'Encarnación', 'fechaInicio': f"{s['hasta']}T{i % 24:02d}:00",
+            'estado': 'Programado'})),
+        Case('lote de 10 altas', 'POST', '/api/batch', body={'operations': [
+            {'op': 'create', 'entity': 'gastos', 'data': gasto(i)} for i in range(10)]}),
+        Case('importación de 1000 gastos', 'POST', '/api/gastos/import', body=csv, repeat=HEAVY_REPEAT,
+             multipart=True),
+    ]
+    return cases
+
+
+# ----------------- Medición -----------------
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _rss_mb(kilobytes_or_bytes):
+    # ru_maxrss está en KiB en Linux y en bytes en macOS.
+    return kilobytes_or_bytes / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def _current_rss_mb():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        return _rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def run_case(app, engine, case, repeat_factor, report_dir):
+    """Ejecuta un caso y devuelve sus mediciones (sin la memoria)."""
+    from sqlalchemy import event
+
+    queries = [0]
+
+    def count_query(*args):
+        queries[0] += 1
+
+    event.listen(engine, 'after_cursor_execute', count_query)
+    client = app.test_client()
+    timings, status, size, error = [], None, 0, None
+    try:
+        for i in range(max(1, round(case.repeat * repeat_factor))):
+            if case.fresh_reports:
+                app.config['REPORT_CACHE_DIR'] = os.path.join(report_dir, f'{case.name}-{i}')
+            else:
+                app.config['REPORT_CACHE_DIR'] = os.path.join(report_dir, 'compartido')
+            url, body = case.request(client, i)
+            queries[0] = 0
+            started = time.perf_counter()
+            response = _open(client, case, url, body)
+            body = response.get_data()
+            response.close()
+            timings.append((time.perf_counter() - started) * 1000)
+            status, size = response.status_code, len(body)
+            if status >= 400 and error is None:
+                error = body[:300].decode('utf-8', 'replace')
+    finally:
+        event.remove(engine, 'after_cursor_execute', count_query)
+    rest = timings[1:] or timings
+    result = {
+        'metodo': case.method,
+        'url': case.url,
+        'status': status,
+        'n': len(timings),
+        'primeraMs': round(timings[0], 2),
+        'minMs': round(min(rest), 2),
+        'p50Ms': round(_percentile(rest, 0.5), 2),
+        'p95Ms': round(_percentile(rest, 0.95), 2),
+        'maxMs': round(max(rest), 2),
+        'mediaMs': round(sum(rest) / len(rest), 2),
+        'bytes': size,
+        'consultas': queries[0],
+    }
+    if error:
+        result['error'] = error
+    return result
+
+
+def _open(client, case, url, body):
+    if case.multipart:
+        data = {'file': (io.BytesIO(body.encode('utf-8')), 'gastos.csv')}
+        return client.open(url, method=case.method, data=data, content_type='multipart/form-data')
+    return client.open(url, method=case.method, json=body)
+
+
+def isolated(function, engine):
+    """Corre `function()` en un proceso hijo y agrega el pico de memoria del hijo.
+    Sin fork (Windows) corre en este proceso y el pico es el del proceso."""
+    if not hasattr(os, 'fork'):
+        result = function()
+        result['picoRssMb'] = round(_rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss), 1)
+        return result
+    baseline = _current_rss_mb()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            # Las conexiones del padre no se comparten con el hijo.
+            engine.dispose(close=False)
+            payload = json.dumps(function())
+        except BaseException as e:
+            payload = json.dumps({'error': f'{type(e).__name__}: {e}'})
+        with os.fdopen(write_fd, 'w') as pipe:
+            pipe.write(payload)
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        payload = pipe.read()
+    _, _, usage = os.wait4(pid, 0)
+    result = json.loads(payload) if payload else {'error': 'el proceso del caso terminó sin resultado'}
+    peak = _rss_mb(usage.ru_maxrss)
+    result['picoRssMb'] = round(peak, 1)
+    result['rssExtraMb'] = round(max(0.0, peak - baseline), 1)
+    return result
+
+
+# ----------------- Comparación -----------------
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """[(caso, métrica, valor base, valor actual, regresión)] de los casos en ambos archivos."""
+    rows = []
+    for name, current in results['casos'].items():
+        base = baseline.get('casos', {}).get(name)
+        # Un caso que cambió de URL no es comparable.
+        if base is None or base.get('url') != current.get('url') or 'p50Ms' not in base or 'p50Ms' not in current:
+            continue
+        checks = [
+            ('p50Ms', MIN_DELTA_MS), ('p95Ms', MIN_DELTA_MS),
+            ('rssExtraMb', MIN_DELTA_RSS_MB), ('bytes', 0), ('consultas', 0),
+        ]
+        for metric, min_delta in checks:
+            if metric not in base or metric not in current:
+                continue
+            old, new = base[metric], current[metric]
+            if metric == 'consultas':
+                worse = new > old
+            else:
+                worse = new > old * (1 + tolerance) and new - old > min_delta
+            rows.append((name, metric, old, new, worse))
+    return rows
+
+
+def _print_comparison(rows):
+    for name, metric, old, new, worse in rows:
+        if metric not in ('p50Ms', 'bytes', 'consultas') and not worse:
+            continue
+        change = f'{(new - old) / old * 100:+.0f}%' if old else ''
+        flag = 'PEOR' if worse else 'ok  '
+        print(f'{flag} {name:45} {metric:11} {old:>12} -> {new:>12} {change}')
+
+
+# ----------------- Línea de comandos -----------------
+
+def _environment():
+    return {
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def run(scale, seed=0, only=None, repeat_factor=1.0, isolate=True, verbose=True):
+    source = ensure(scale, seed, verbose=verbose)
+    workdir = tempfile.mkdtemp(prefix='cargoflow-bench-')
+    try:
+        database = os.path.join(workdir, 'cargoflow.db')
+        shutil.copyfile(source, database)
+        # server.py lee la configuración del entorno al importarse.
+        os.environ['CARGOFLOW_DATABASE_URI'] = f'sqlite:///{database}'
+        for name, folder in (('PHOTO_DIR', 'fotos'), ('REPORT_JOBS_DIR', 'report_jobs'),
+                             ('REPORT_CACHE_DIR', 'report_cache'), ('ANALYTICS_DIR', 'analytics_data')):
+            os.environ[f'CARGOFLOW_{name}'] = os.path.join(workdir, folder)
+        from server import app, db
+
+        with app.app_context():
+            sample = _sample(db.session)
+            db.session.remove()
+            engine = db.engine
+        cases = build_cases(sample)
+        if only:
+            cases = [case for case in cases if any(term in case.name for term in only)]
+        results = {
+            'escala': scale,
+            'semilla': seed,
+            'gastos': SCALES[scale],
+            'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'entorno': _environment(),
+            'casos': {},
+        }
+        report_dir = os.path.join(workdir, 'informes')
+        for case in cases:
+            def measure(case=case):
+                with app.app_context():
+                    try:
+                        return run_case(app, engine, case, repeat_factor, report_dir)
+                    finally:
+                        db.session.remove()
+
+            result = isolated(measure, engine) if isolate else {
+                **measure(), 'picoRssMb': round(_rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss), 1)}
+            results['casos'][case.name] = result
+            if verbose:
+                if 'p50Ms' in result:
+                    print(f"{case.name:45} {result['status']} p50 {result['p50Ms']:9.2f} ms  "
+                          f"p95 {result['p95Ms']:9.2f} ms  primera {result['primeraMs']:9.2f} ms  "
+                          f"{result['bytes']:>11} B  {result['consultas']:>4} consultas  "
+                          f"pico {result['picoRssMb']:7.1f} MB", flush=True)
+                else:
+                    print(f"{case.name:45} ERROR {result.get('error')}", flush=True)
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark de los endpoints sobre una base sintética.')
+    parser.add_argument('scale', choices=SCALES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='archivo JSON donde guardar los resultados')
+    parser.add_argument('--baseline', help='resultados anteriores (JSON) con los que comparar')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='empeoramiento relativo tolerado (0.25 = 25%%)')
+    parser.add_argument('--only', help='sólo los casos cuyo nombre contiene alguno de estos textos (separados por coma)')
+    parser.add_argument('--repeat', type=float, default=1.0, help='multiplica la cantidad de llamadas por caso')
+    parser.add_argument('--no-isolate', action='store_true', help='no usar un proceso por caso')
+    args = parser.parse_args(argv[1:])
+
+    only = [term.strip() for term in args.only.split(',')] if args.only else None
+    results = run(args.scale, args.seed, only, args.repeat, isolate=not args.no_isolate)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(results, output, ensure_ascii=False, indent=2)
+    failed = any('error' in case or (case.get('status') or 500) >= 400 for case in results['casos'].values())
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as source:
+            baseline = json.load(source)
+        rows = compare(results, baseline, args.tolerance)
+        _print_comparison(rows)
+        regressions = sum(worse for *_, worse in rows)
+        print(f'{regressions} regresiones respecto de {args.baseline}')
+        failed = failed or regressions > 0
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,304 @@
+# benchmarks/dataset.py
+
+"""Bases SQLite sintéticas de una flota, deterministas para una semilla.
+
+El tamaño se define por la cantidad de gastos (SCALES); el resto se deriva de
+ella con proporciones parecidas a las de una flota real:
+
+- Un viaje cada GASTOS_POR_VIAJE gastos, y un camión (con su chofer y su
+  acoplado fijos) cada VIAJES_POR_CAMION viajes. Los viajes de cada camión
+  están repartidos en los YEARS años que terminan en END, uno detrás de otro y
+  sin superponerse, así que también cumplen el control de scheduling.py.
+- Rutas entre ciudades de la región con pesos distintos; los viajes
+  terminados quedan Finalizados, unos pocos Cancelados y los últimos de cada
+  camión En Curso o Programados.
+- Gastos asignados a viajes al azar (cantidad por viaje ~ Poisson), con fecha
+  dentro del viaje, tipo según su frecuencia y monto log-normal por tipo. La
+  mayoría en guaraníes; el resto en USD, BRL y ARS, convertido con la
+  cotización semanal (un paseo aleatorio por moneda).
+- Pólizas anuales por vehículo, algunas con días sin cobertura entre una y
+  otra y algunas que vencen cerca de END.
+
+Las filas se insertan en bloque (como bulk_import) y al final se recalculan
+los resúmenes de gastos, las coberturas y los índices de búsqueda.
+
+    python -m benchmarks.dataset 100k            # benchmarks/data/cargoflow-100k-s0.db
+    python -m benchmarks.dataset 1m --seed 7 --output /tmp/flota.db
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import func, select
+
+import coberturas
+import rollups
+from config import create_configured_engine
+from data_versions import bump_versions
+from database import (Acoplado, Camion, Chofer, Currency, Gasto, Poliza, TableVersion, TipoDeCambio,
+                      TipoDeGasto, VehiculoEstado, Viaje, ViajeEstado, db)
+from migrations import upgrade
+from search import ensure_search_index
+from sync import stamp_rows
+
+SCALES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+END = date(2025, 12, 31)
+YEARS = 3
+GASTOS_POR_VIAJE = 8
+VIAJES_POR_CAMION = 120
+INSERT_CHUNK = 20_000
+
+CIUDADES = [
+    ('Asunción', 30), ('Ciudad del Este', 18), ('Encarnación', 12), ('Concepción', 6),
+    ('Pedro Juan Caballero', 6), ('Villarrica', 4), ('Foz do Iguaçu', 8), ('São Paulo', 6),
+    ('Buenos Aires', 5), ('Posadas', 3), ('Clorinda', 2),
+]
+# tipo -> (frecuencia relativa, mediana del monto en guaraníes, dispersión log-normal)
+TIPOS = {
+    'Combustible': (30, 1_800_000, 0.5),
+    'Peaje': (25, 35_000, 0.3),
+    'Mantenimiento': (6, 2_500_000, 0.9),
+    'Viáticos': (14, 150_000, 0.4),
+    'Hospedaje': (6, 250_000, 0.3),
+    'Aduana': (4, 900_000, 0.6),
+    'Neumáticos': (2, 4_000_000, 0.4),
+    'Estacionamiento': (7, 40_000, 0.5),
+    'Lavado': (3, 80_000, 0.3),
+    'Multas': (1, 600_000, 0.7),
+    'Reparación': (2, 3_500_000, 1.0),
+}
+# moneda -> (proporción de gastos, cotización inicial en guaraníes, deriva semanal)
+MONEDAS = {
+    'PYG': (0.70, 1.0, 0.0),
+    'USD': (0.15, 7300.0, 0.001),
+    'BRL': (0.10, 1450.0, 0.0),
+    'ARS': (0.05, 8.5, -0.01),
+}
+NOMBRES_MONEDAS = {'PYG': 'Guaraní', 'USD': 'Dólar', 'BRL': 'Real', 'ARS': 'Peso argentino'}
+NOMBRES = ['Juan', 'Carlos', 'Luis', 'Jorge', 'Miguel', 'Ramón', 'Óscar', 'Hugo', 'Ana', 'Rosa']
+APELLIDOS = ['Pérez', 'González', 'Benítez', 'Martínez', 'López', 'Giménez', 'Vera', 'Duarte', 'Ramírez']
+MARCAS = [('Scania', 'R450'), ('Volvo', 'FH540'), ('Mercedes-Benz', 'Actros'), ('Iveco', 'S-Way')]
+ASEGURADORAS = ['Mapfre', 'La Consolidada', 'Sancor', 'Patria', 'El Comercio']
+
+
+def default_path(scale, seed=0):
+    return os.path.join(DATA_DIR, f'cargoflow-{scale}-s{seed}.db')
+
+
+def _datetimes(values):
+    """datetime64 -> datetime (lo que espera la columna DateTime)."""
+    return values.astype('datetime64[us]').astype(object)
+
+
+def _insert(connection, table, rows):
+    for start in range(0, len(rows), INSERT_CHUNK):
+        chunk = rows[start:start + INSERT_CHUNK]
+        stamp_rows(connection, chunk)
+        connection.execute(table.insert(), chunk)
+
+
+def _lookups(connection):
+    connection.execute(VehiculoEstado.__table__.insert(),
+                       [{'nombre': nombre} for nombre in ('Disponible', 'En Viaje', 'En Mantenimiento')])
+    connection.execute(ViajeEstado.__table__.insert(),
+                       [{'nombre': nombre} for nombre in ('Programado', 'En Curso', 'Finalizado', 'Cancelado')])
+    connection.execute(Currency.__table__.insert(),
+                       [{'code': code, 'name': NOMBRES_MONEDAS[code]} for code in MONEDAS])
+    _insert(connection, TipoDeGasto.__table__, [{'nombre': nombre} for nombre in TIPOS])
+    return dict(connection.execute(select(TipoDeGasto.nombre, TipoDeGasto.id)).all())
+
+
+def _exchange_rates(rng, start):
+    """Cotizaciones semanales {moneda: (fechas datetime64[D], tasas)}."""
+    weeks = np.arange(start, np.datetime64(END) + 1, np.timedelta64(7, 'D'))
+    series = {}
+    for moneda, (_, inicial, deriva) in MONEDAS.items():
+        if moneda == 'PYG':
+            continue
+        steps = rng.normal(deriva, 0.01, len(weeks))
+        series[moneda] = (weeks, inicial * np.exp(np.cumsum(steps)))
+    return series
+
+
+def _fleet(rng, camiones):
+    # Patentes AAA000, AAA001, ...; los acoplados usan las mismas con R inicial.
+    dominios = [''.join(chr(65 + i // 1000 // 26 ** k % 26) for k in (2, 1, 0)) + f'{i % 1000:03d}'
+                for i in range(camiones)]
+    choferes, trucks, trailers = [], [], []
+    for i, dominio in enumerate(dominios):
+        marca, modelo = MARCAS[int(rng.integers(len(MARCAS)))]
+        choferes.append({'id': i + 1, 'nombre': NOMBRES[i % len(NOMBRES)], 'apellido': APELLIDOS[i % len(APELLIDOS)],
+                         'nacionalidad': 'PY', 'identificacion': f'{1_000_000 + i}',
+                         'identificacion_laboral': f'LAB{i:06d}', 'telefono': f'+5959{i:08d}',
+                         'email': f'chofer{i}@example.com'})
+        trucks.append({'dominio': dominio, 'marca': marca, 'modelo': modelo, 'año': int(rng.integers(2010, 2025)),
+                       'color': 'Blanco', 'tipo': 'Tractor', 'chasis': f'CH{i:08d}',
+                       'estado': 'En Mantenimiento' if rng.random() < 0.05 else 'Disponible'})
+        trailers.append({'dominio': 'R' + dominio[1:], 'marca': 'Randon', 'modelo': 'Sider',
+                         'año': int(rng.integers(2010, 2025)), 'color': 'Gris', 'tipo': 'Caja',
+                         'chasis': f'AC{i:08d}', 'estado': 'Disponible'})
+    return choferes, trucks, trailers
+
+
+def _viajes(rng, count, trucks, start):
+    """Viajes consecutivos por camión, sin superposiciones."""
+    per_truck = -(-count // len(trucks))
+    span_minutes = (np.datetime64(END) + 1 - start).astype('timedelta64[m]').astype(np.int64)
+    slot = span_minutes // per_truck
+    truck_index = np.arange(count) // per_truck
+    position = np.arange(count) % per_truck
+    duration = np.minimum(rng.uniform(0.5, 4.0, count) * 1440, slot * 0.6).astype(np.int64)
+    offset = (rng.uniform(0, 1, count) * (slot - duration)).astype(np.int64)
+    inicio = start + (position * slot + offset).astype('timedelta64[m]')
+    fin = inicio + duration.astype('timedelta64[m]')
+    ciudades, pesos = zip(*CIUDADES)
+    pesos = np.asarray(pesos, dtype=np.float64) / sum(pesos)
+    origen = rng.choice(len(ciudades), count, p=pesos)
+    destino = (origen + 1 + rng.choice(len(ciudades) - 1, count)) % len(ciudades)
+    # Los últimos viajes de cada camión todavía no terminaron.
+    last = position >= per_truck - 2
+    estado = np.where(rng.random(count) < 0.02, 'Cancelado', 'Finalizado').astype(object)
+    estado[last] = np.where(position[last] == per_truck - 1, 'Programado', 'En Curso')
+    inicio_dt, fin_dt = _datetimes(inicio), _datetimes(fin)
+    rows = []
+    for i in range(count):
+        truck = trucks[truck_index[i]]
+        rows.append({
+            'id': i + 1, 'origen': ciudades[origen[i]], 'destino': ciudades[destino[i]],
+            'fecha_inicio': inicio_dt[i], 'fecha_fin': None if estado[i] == 'Programado' else fin_dt[i],
+            'chofer_id': int(truck_index[i]) + 1, 'camion_dominio': truck['dominio'],
+            'acoplado_dominio': 'R' + truck['dominio'][1:], 'estado': estado[i],
+        })
+    return rows, inicio, fin
+
+
+def _gastos(rng, count, viaje_inicio, viaje_fin, tipo_ids, rates):
+    viaje = rng.integers(0, len(viaje_inicio), count)
+    length = (viaje_fin[viaje] - viaje_inicio[viaje]).astype(np.int64)
+    fecha = viaje_inicio[viaje] + (rng.uniform(0, 1, count) * length).astype('timedelta64[m]')
+    nombres = list(TIPOS)
+    frecuencias = np.asarray([TIPOS[nombre][0] for nombre in nombres], dtype=np.float64)
+    tipo = rng.choice(len(nombres), count, p=frecuencias / frecuencias.sum())
+    medianas = np.asarray([TIPOS[nombre][1] for nombre in nombres], dtype=np.float64)
+    sigmas = np.asarray([TIPOS[nombre][2] for nombre in nombres])
+    monto_pyg = medianas[tipo] * np.exp(rng.normal(0, 1, count) * sigmas[tipo])
+    codes = list(MONEDAS)
+    moneda = rng.choice(len(codes), count, p=[MONEDAS[code][0] for code in codes])
+    monto = monto_pyg.copy()
+    dias = fecha.astype('datetime64[D]')
+    for index, code in enumerate(codes):
+        if code not in rates:
+            continue
+        mask = moneda == index
+        weeks, tasas = rates[code]
+        vigente = np.clip(np.searchsorted(weeks, dias[mask], side='right') - 1, 0, len(tasas) - 1)
+        monto[mask] = monto_pyg[mask] / tasas[vigente]
+    monto = np.round(monto, 2)
+    fecha_dt = _datetimes(fecha)
+    return [{'monto': float(monto[i]), 'fecha': fecha_dt[i], 'descripcion': None if i % 3 else f'{nombres[tipo[i]]} #{i}',
+             'viaje_id': int(viaje[i]) + 1, 'tipo_id': tipo_ids[nombres[tipo[i]]], 'moneda': codes[moneda[i]]}
+            for i in range(count)]
+
+
+def _polizas(rng, dominios, start):
+    rows = []
+    first_year = start.astype(object).year
+    for dominio in dominios:
+        aseguradora = ASEGURADORAS[int(rng.integers(len(ASEGURADORAS)))]
+        inicio = date(first_year, 1, 1) + timedelta(days=int(rng.integers(0, 60)))
+        while inicio <= END:
+            fin = inicio + timedelta(days=364)
+            rows.append({'aseguradora': aseguradora, 'asegurado': 'CargoFlow S.A.', 'vehiculo_dominio': dominio,
+                         'inicio_vigencia': inicio, 'fin_vigencia': fin})
+            # Algunas renovaciones llegan tarde y dejan días sin cobertura.
+            inicio = fin + timedelta(days=1 + (int(rng.integers(1, 30)) if rng.random() < 0.05 else 0))
+    return rows
+
+
+def generate(path, gastos, seed=0, verbose=True):
+    """Crea en `path` una base con `gastos` gastos. Devuelve la cantidad de filas por tabla."""
+    if os.path.exists(path):
+        os.remove(path)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    rng = np.random.default_rng(seed)
+    start = np.datetime64(END) - np.timedelta64(365 * YEARS, 'D')
+    viajes = max(10, gastos // GASTOS_POR_VIAJE)
+    camiones = max(3, viajes // VIAJES_POR_CAMION)
+    engine = create_configured_engine(f'sqlite:///{os.path.abspath(path)}')
+    started = time.time()
+
+    def log(message):
+        if verbose:
+            print(f'[{time.time() - started:6.1f}s] {message}', flush=True)
+
+    upgrade(engine)
+    with engine.begin() as connection:
+        tipo_ids = _lookups(connection)
+        rates = _exchange_rates(rng, start)
+        _insert(connection, TipoDeCambio.__table__,
+                [{'moneda': moneda, 'fecha': fecha, 'tasa': float(tasa)}
+                 for moneda, (fechas, tasas) in rates.items()
+                 for fecha, tasa in zip(fechas.astype(object), tasas)])
+        choferes, trucks, trailers = _fleet(rng, camiones)
+        _insert(connection, Chofer.__table__, choferes)
+        _insert(connection, Camion.__table__, trucks)
+        _insert(connection, Acoplado.__table__, trailers)
+        _insert(connection, Poliza.__table__,
+                _polizas(rng, [row['dominio'] for row in trucks + trailers], start))
+        log(f'{camiones} camiones, acoplados y choferes')
+        viaje_rows, inicio, fin = _viajes(rng, viajes, trucks, start)
+        _insert(connection, Viaje.__table__, viaje_rows)
+        log(f'{viajes} viajes')
+        for offset in range(0, gastos, 200_000):
+            # Por bloques, para no tener todos los dicts en memoria a la vez.
+            _insert(connection, Gasto.__table__,
+                    _gastos(rng, min(200_000, gastos - offset), inicio, fin, tipo_ids, rates))
+            log(f'{min(gastos, offset + 200_000)} gastos')
+    with engine.begin() as connection:
+        # Tablas derivadas, como después de una importación o una migración.
+        rollups.rebuild(connection)
+        coberturas.rebuild(connection)
+        bump_versions(connection, [name for name in db.metadata.tables if name != TableVersion.__tablename__])
+    ensure_search_index(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql('ANALYZE')
+        counts = {table.name: connection.execute(select(func.count()).select_from(table)).scalar()
+                  for table in (Chofer.__table__, Camion.__table__, Viaje.__table__, Gasto.__table__,
+                                Poliza.__table__, TipoDeCambio.__table__)}
+    with engine.connect() as connection:
+        connection.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+    engine.dispose()
+    log(f'listo: {path}')
+    return counts
+
+
+def ensure(scale, seed=0, path=None, verbose=True):
+    """Ruta de la base de la escala `scale`, generándola si todavía no existe."""
+    path = path or default_path(scale, seed)
+    if not os.path.exists(path):
+        generate(path, SCALES[scale], seed, verbose)
+    return path
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Genera una base sintética para los benchmarks.')
+    parser.add_argument('scale', choices=SCALES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='ruta de la base (por defecto, benchmarks/data/)')
+    args = parser.parse_args(argv[1:])
+    counts = generate(args.output or default_path(args.scale, args.seed), SCALES[args.scale], args.seed)
+    for table, count in counts.items():
+        print(f'{table}: {count}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,572 @@
+# benchmarks/loadgen.py
+
+"""Prueba de carga: muchos clientes concurrentes con una mezcla de lecturas,
+escrituras e informes contra un servidor real.
+
+Sin --url levanta el servidor (benchmarks/serve.py, o --server-cmd) en otro
+proceso, sobre una copia temporal de la base sintética (dataset.py) o de
+--database, con los informes y cachés en un directorio temporal. Con --url
+carga un servidor ya levantado (¡las escrituras quedan en esa base!).
+
+Cada cliente es un hilo con su propia conexión HTTP/1.1 que elige una
+operación de la mezcla según su peso, completa los marcadores ({viaje},
+{fecha}, ...) con valores tomados del servidor al empezar, espera la
+respuesta completa y repite (con --think, después de una pausa aleatoria).
+La mezcla por defecto (MIX) simula despachantes que cargan viajes y gastos
+mientras contabilidad consulta y baja informes; --categorias cambia la
+proporción de cada tipo y --mix la reemplaza por una de un archivo JSON.
+
+Perfiles:
+- constante: --clients N durante --duration segundos.
+- rampa: --ramp 1,2,4,8,16,32 con --step-duration segundos por etapa. Los
+  clientes de una etapa siguen en la siguiente. La saturación es la última
+  etapa antes de la primera que no sube el throughput al menos GAIN_MIN,
+  supera --max-error-rate de errores o, con --slo-p95, ese p95.
+
+Por etapa y por operación se informan pedidos, throughput, p50/p95/p99 y los
+errores clasificados: databaseLocked (503 de SQLite ocupado), timeout,
+conexion, conflicto (409), http4xx y http5xx. Cada pedido cuenta en la etapa
+en que empezó; los primeros --warmup segundos no cuentan.
+
+    python -m benchmarks.loadgen 100k --clients 16 --duration 60
+    python -m benchmarks.loadgen 100k --ramp 1,2,4,8,16,32,64 --step-duration 20 --output carga.json
+    python -m benchmarks.loadgen 100k --ramp 4,8,16 --env CARGOFLOW_SQLITE_BUSY_TIMEOUT=1000
+    python -m benchmarks.loadgen --url http://127.0.0.1:5001 --clients 8 --categorias lectura=1
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import platform
+import random
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+from benchmarks.dataset import SCALES, ensure
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LECTURA, ESCRITURA, INFORME = 'lectura', 'escritura', 'informe'
+CATEGORIES = (LECTURA, ESCRITURA, INFORME)
+# Una etapa de la rampa tiene que subir el throughput al menos esto respecto de la anterior.
+GAIN_MIN = 0.05
+MAX_ERROR_RATE = 0.01
+TIMEOUT = 30.0
+READY_TIMEOUT = 60.0
+SAMPLE_SIZE = 500
+PERIOD_DAYS = 30
+
+
+def _op(nombre, categoria, peso, url, metodo='GET', cuerpo=None, csv=None):
+    op = {'nombre': nombre, 'categoria': categoria, 'peso': peso, 'metodo': metodo, 'url': url}
+    if cuerpo is not None:
+        op['cuerpo'] = cuerpo
+    if csv is not None:
+        op['csv'] = csv  # cantidad de filas de gastos a importar
+    return op
+
+
+_GASTO = {'monto': '{monto}', 'viajeId': '{viaje}', 'tipoId': '{tipo}', 'moneda': 'PYG', 'fecha': '{fecha}'}
+
+MIX = [
+    _op('viajes: página', LECTURA, 20, '/api/viajes?limit=50'),
+    _op('viajes: por camión', LECTURA, 8, '/api/viajes?camion_dominio={camion}&limit=50'),
+    _op('gastos: página por período', LECTURA, 10, '/api/gastos?desde={desde}&hasta={hasta}&limit=100'),
+    _op('gastos: de un viaje', LECTURA, 12, '/api/gastos?viaje_id={viaje}'),
+    _op('gastos: resumen del período', LECTURA, 5, '/api/gastos/resumen?desde={desde}&hasta={hasta}&moneda_reporte=USD'),
+    _op('dashboard', LECTURA, 5, '/api/dashboard'),
+    _op('bootstrap', LECTURA, 2, '/api/bootstrap'),
+    _op('disponibilidad', LECTURA, 5, '/api/disponibilidad?desde={fecha}&hasta={fecha}T23:59'),
+    _op('búsqueda', LECTURA, 3, '/api/search?q={camion}'),
+    _op('alta de gasto', ESCRITURA, 12, '/api/gastos', 'POST', _GASTO),
+    _op('modificación de gasto', ESCRITURA, 5, '/api/gastos/{gasto}', 'PUT', {'monto': '{monto}'}),
+    _op('alta de viaje', ESCRITURA, 3, '/api/viajes', 'POST', {
+        'origen': 'Asunción', 'destino': 'Ciudad del Este', 'fechaInicio': '{fecha}T08:00', 'estado': 'Programado'}),
+    _op('lote de 10 gastos', ESCRITURA, 1, '/api/batch', 'POST', {
+        'operations': [{'op': 'create', 'entity': 'gastos', 'data': _GASTO}] * 10}),
+    _op('importación de 200 gastos', ESCRITURA, 1, '/api/gastos/import', 'POST', csv=200),
+    _op('informe: gastos de un viaje', INFORME, 3, '/api/informes/gastos-viaje-excel/{viaje}?moneda_reporte=USD'),
+    _op('informe: gastos del período', INFORME, 1,
+        '/api/informes/gastos-periodo-excel?fecha_inicio={desde}&fecha_fin={hasta}&moneda_reporte=USD'),
+    _op('informe: viajes', INFORME, 0.5, '/api/informes/viajes-excel'),
+]
+
+
+def with_categories(mix, fractions):
+    """Reescala los pesos para que cada categoría sume su fracción; las que no
+    aparecen en `fractions` (o valen 0) se quitan."""
+    totals = {c: sum(op['peso'] for op in mix if op['categoria'] == c) for c in CATEGORIES}
+    wanted = sum(fractions.values())
+    scaled = []
+    for op in mix:
+        fraction = fractions.get(op['categoria'], 0)
+        if fraction > 0 and totals[op['categoria']] > 0:
+            scaled.append({**op, 'peso': op['peso'] / totals[op['categoria']] * fraction / wanted})
+    return scaled
+
+
+# ----------------- Valores para los marcadores -----------------
+
+class Sampler:
+    """Ids y fechas existentes, tomados por la API, para completar la mezcla."""
+
+    def __init__(self, viajes, camiones, gastos, tipos, fechas):
+        if not (viajes and gastos and tipos and fechas):
+            raise RuntimeError('La base no tiene viajes, gastos o tipos de gasto para armar la mezcla')
+        self.viajes = viajes
+        self.camiones = camiones or ['AAA000']
+        self.gastos = gastos
+        self.tipos = tipos
+        self.first, self.last = min(fechas), max(fechas)
+        self.counter = itertools.count()
+
+    @classmethod
+    def from_api(cls, connect):
+        def get(path):
+            connection = connect()
+            try:
+                status, body = _request(connection, 'GET', path)
+            finally:
+                connection.close()
+            if status != 200:
+                raise RuntimeError(f'GET {path} respondió {status}: {body[:200]!r}')
+            return json.loads(body)
+
+        viajes = get(f'/api/viajes?limit={SAMPLE_SIZE}')['items']
+        gastos = get(f'/api/gastos?limit={SAMPLE_SIZE}')['items']
+        fechas = [date.fromisoformat(v['fechaInicio'][:10]) for v in viajes if v.get('fechaInicio')]
+        return cls(viajes=[v['id'] for v in viajes],
+                   camiones=sorted({v['camionDominio'] for v in viajes if v.get('camionDominio')}),
+                   gastos=[g['id'] for g in gastos],
+                   tipos=[t['id'] for t in get('/api/tiposDeGasto')],
+                   fechas=fechas)
+
+    def values(self, rng):
+        """Marcadores de un pedido: {desde}/{hasta} es el período de PERIOD_DAYS
+        que termina en {fecha} y {n} es distinto en cada pedido."""
+        day = self.first + timedelta(days=rng.randint(0, (self.last - self.first).days))
+        return {
+            'viaje': rng.choice(self.viajes),
+            'camion': rng.choice(self.camiones),
+            'gasto': rng.choice(self.gastos),
+            'tipo': rng.choice(self.tipos),
+            'monto': rng.randint(10_000, 2_000_000),
+            'fecha': day.isoformat(),
+            'desde': (day - timedelta(days=PERIOD_DAYS)).isoformat(),
+            'hasta': day.isoformat(),
+            'n': next(self.counter),
+        }
+
+
+def _fill(template, values):
+    # Un texto que es sólo un marcador conserva el tipo del valor (ids numéricos en el JSON).
+    if isinstance(template, str):
+        if template.startswith('{') and template.endswith('}') and template[1:-1] in values:
+            return values[template[1:-1]]
+        return template.format_map(values)
+    if isinstance(template, list):
+        return [_fill(item, values) for item in template]
+    if isinstance(template, dict):
+        return {key: _fill(value, values) for key, value in template.items()}
+    return template
+
+
+def render(op, sampler, rng):
+    """(método, path, cuerpo, cabeceras) de un pedido de la operación `op`."""
+    values = sampler.values(rng)
+    path = _fill(op['url'], values)
+    if op.get('csv'):
+        lines = ['monto,viaje_id,tipo_id,moneda,fecha']
+        for _ in range(op['csv']):
+            row = sampler.values(rng)
+            lines.append(f"{row['monto']},{row['viaje']},{row['tipo']},PYG,{row['fecha']}")
+        return op['metodo'], path, ('\n'.join(lines) + '\n').encode('utf-8'), {'Content-Type': 'text/csv'}
+    if 'cuerpo' in op:
+        body = json.dumps(_fill(op['cuerpo'], values)).encode('utf-8')
+        return op['metodo'], path, body, {'Content-Type': 'application/json'}
+    return op['metodo'], path, None, {}
+
+
+# ----------------- Clientes -----------------
+
+def classify(status, body):
+    """Tipo de error de una respuesta, o None si salió bien."""
+    if b'database is locked' in body:
+        return 'databaseLocked'
+    if status == 409:
+        return 'conflicto'
+    if status >= 500:
+        return 'http5xx'
+    if status >= 400:
+        return 'http4xx'
+    return None
+
+
+def _request(connection, method, path, body=None, headers=None):
+    connection.request(method, path, body=body, headers=headers or {})
+    response = connection.getresponse()
+    data = response.read()
+    if response.will_close:
+        connection.close()
+    return response.status, data
+
+
+class Client(threading.Thread):
+    """Un cliente: pedidos uno detrás de otro hasta que se le pide parar.
+    Cada resultado es (etapa, operación, ms, status, error, bytes)."""
+
+    def __init__(self, index, connect, mix, sampler, run, think, seed):
+        super().__init__(name=f'cliente-{index}', daemon=True)
+        self.connect = connect
+        self.mix = mix
+        self.weights = list(itertools.accumulate(op['peso'] for op in mix))
+        self.sampler = sampler
+        self.run_state = run
+        self.think = think
+        self.rng = random.Random(seed * 100_003 + index)
+        self.stop = threading.Event()
+        self.results = []
+
+    def run(self):
+        connection = None
+        while not self.stop.is_set() and not self.run_state.done.is_set():
+            op = self.rng.choices(self.mix, cum_weights=self.weights)[0]
+            method, path, body, headers = render(op, self.sampler, self.rng)
+            stage = self.run_state.stage
+            status, error, size = None, None, 0
+            started = time.perf_counter()
+            try:
+                if connection is None:
+                    connection = self.connect()
+                status, data = _request(connection, method, path, body, headers)
+                size = len(data)
+                error = classify(status, data)
+            except (socket.timeout, TimeoutError):
+                error = 'timeout'
+            except (OSError, http.client.HTTPException):
+                error = 'conexion'
+            if error in ('timeout', 'conexion') and connection is not None:
+                connection.close()
+                connection = None
+            elapsed = (time.perf_counter() - started) * 1000
+            if stage is not None:
+                self.results.append((stage, op['nombre'], elapsed, status, error, size))
+            if self.think:
+                self.stop.wait(self.rng.expovariate(1000 / self.think))
+        if connection is not None:
+            connection.close()
+
+
+class RunState:
+    def __init__(self):
+        self.stage = None  # None durante el calentamiento
+        self.done = threading.Event()
+
+
+# ----------------- Resultados -----------------
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, max(0, int(fraction * len(ordered) + 0.5) - 1))], 2)
+
+
+def _latency(results, seconds):
+    ordered = sorted(r[2] for r in results)
+    errors = {}
+    for r in results:
+        if r[4] is not None:
+            errors[r[4]] = errors.get(r[4], 0) + 1
+    failed = sum(errors.values())
+    return {
+        'pedidos': len(results),
+        'throughput': round(len(results) / seconds, 2) if seconds else None,
+        'okPorSegundo': round((len(results) - failed) / seconds, 2) if seconds else None,
+        'errores': failed,
+        'tasaError': round(failed / len(results), 4) if results else 0,
+        'erroresPorTipo': errors,
+        'p50Ms': _percentile(ordered, 0.50),
+        'p95Ms': _percentile(ordered, 0.95),
+        'p99Ms': _percentile(ordered, 0.99),
+        'maxMs': round(ordered[-1], 2) if ordered else None,
+        'bytes': sum(r[5] for r in results),
+    }
+
+
+def summarize_stage(clients, seconds, results, cpu_seconds):
+    by_op = {}
+    for r in results:
+        by_op.setdefault(r[1], []).append(r)
+    return {
+        'clientes': clients,
+        'duracionS': round(seconds, 2),
+        **_latency(results, seconds),
+        # Un solo proceso de Python: cerca del 100% el generador puede estar limitando la carga.
+        'cpuClientePct': round(cpu_seconds / seconds * 100, 1) if seconds else None,
+        'operaciones': {name: _latency(rows, seconds) for name, rows in sorted(by_op.items())},
+    }
+
+
+def find_saturation(stages, max_error_rate=MAX_ERROR_RATE, slo_p95=None):
+    """Última etapa sana antes de la primera que ya no escala, con el motivo."""
+    previous = None
+    for stage in stages:
+        reason = None
+        if stage['tasaError'] > max_error_rate:
+            reason = f"tasa de errores {stage['tasaError']:.1%}"
+        elif slo_p95 is not None and (stage['p95Ms'] or 0) > slo_p95:
+            reason = f"p95 {stage['p95Ms']} ms > {slo_p95} ms"
+        elif previous is not None and stage['okPorSegundo'] < previous['okPorSegundo'] * (1 + GAIN_MIN):
+            reason = f"throughput {stage['okPorSegundo']}/s sin mejora sobre {previous['okPorSegundo']}/s"
+        if reason:
+            return {
+                'clientes': previous['clientes'] if previous else None,
+                'throughput': previous['okPorSegundo'] if previous else None,
+                'p95Ms': previous['p95Ms'] if previous else None,
+                'etapaSaturada': stage['clientes'],
+                'motivo': reason,
+            }
+        previous = stage
+    return None
+
+
+# ----------------- Servidor local -----------------
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database, workdir, port, command=None, env_overrides=None, log_path=None):
+    """Levanta el servidor sobre `database`; devuelve (proceso, archivo de log)."""
+    env = dict(os.environ)
+    env['CARGOFLOW_DATABASE_URI'] = f'sqlite:///{database}'
+    for name, folder in (('PHOTO_DIR', 'fotos'), ('REPORT_JOBS_DIR', 'report_jobs'),
+                         ('REPORT_CACHE_DIR', 'report_cache'), ('ANALYTICS_DIR', 'analytics_data')):
+        env[f'CARGOFLOW_{name}'] = os.path.join(workdir, folder)
+    env.update(env_overrides or {})
+    if command:
+        argv = [part.format(port=port, python=sys.executable) for part in shlex.split(command)]
+    else:
+        argv = [sys.executable, '-m', 'benchmarks.serve', '--port', str(port)]
+    log_path = log_path or os.path.join(workdir, 'server.log')
+    log = open(log_path, 'wb')
+    process = subprocess.Popen(argv, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    return process, log_path
+
+
+def wait_ready(connect, process=None, log_path=None, timeout=READY_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'El servidor terminó con código {process.returncode}:\n{_tail(log_path)}')
+        try:
+            if _request(connect(), 'GET', '/api/viajeEstados')[0] == 200:
+                return
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'El servidor no respondió en {timeout:.0f} s:\n{_tail(log_path)}')
+
+
+def _tail(path, lines=20):
+    if not path or not os.path.exists(path):
+        return ''
+    with open(path, encoding='utf-8', errors='replace') as log:
+        return ''.join(log.readlines()[-lines:])
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# ----------------- Ejecución -----------------
+
+def run_load(connect, mix, sampler, levels, step_seconds, warmup=0.0, think=0.0, seed=0, verbose=True):
+    """Corre las etapas (cantidad de clientes, una por elemento de `levels`) y devuelve sus resúmenes."""
+    state = RunState()
+    clients = []
+
+    def scale_to(count):
+        while len(clients) < count:
+            client = Client(len(clients), connect, mix, sampler, state, think, seed)
+            clients.append(client)
+            client.start()
+        # Si la rampa baja, paran los últimos clientes.
+        for client in clients[count:]:
+            client.stop.set()
+
+    stages = []
+    try:
+        if warmup > 0:
+            scale_to(levels[0])
+            time.sleep(warmup)
+        for index, level in enumerate(levels):
+            scale_to(level)
+            state.stage = index
+            started, cpu_started = time.perf_counter(), time.process_time()
+            time.sleep(step_seconds)
+            seconds = time.perf_counter() - started
+            cpu = time.process_time() - cpu_started
+            # Los pedidos de esta etapa que todavía están en curso se anotan al terminar.
+            state.stage = index + 1 if index + 1 < len(levels) else None
+            stages.append((level, seconds, cpu))
+            if verbose:
+                done = sum(1 for c in clients for r in list(c.results) if r[0] == index)
+                print(f'etapa {index + 1}/{len(levels)}: {level} clientes, {done} pedidos en {seconds:.1f} s',
+                      flush=True)
+    finally:
+        state.done.set()
+        for client in clients:
+            client.join(TIMEOUT + 5)
+    results = [r for c in clients for r in c.results]
+    return [summarize_stage(level, seconds, [r for r in results if r[0] == index], cpu)
+            for index, (level, seconds, cpu) in enumerate(stages)]
+
+
+def _print_stage(stage):
+    errors = ', '.join(f'{k} {v}' for k, v in sorted(stage['erroresPorTipo'].items())) or 'sin errores'
+    print(f"{stage['clientes']:>4} clientes  {stage['throughput']:>8.1f} ped/s  "
+          f"p50 {stage['p50Ms'] or 0:>8.1f}  p95 {stage['p95Ms'] or 0:>8.1f}  p99 {stage['p99Ms'] or 0:>8.1f} ms  "
+          f"errores {stage['tasaError']:.2%} ({errors})  cpu cliente {stage['cpuClientePct']}%")
+
+
+def _print_operations(stage):
+    print(f"\nPor operación con {stage['clientes']} clientes:")
+    for name, op in stage['operaciones'].items():
+        errors = ', '.join(f'{k} {v}' for k, v in sorted(op['erroresPorTipo'].items()))
+        print(f"  {name:32} {op['pedidos']:>7} ped  {op['throughput']:>7.1f}/s  p50 {op['p50Ms']:>8.1f}  "
+              f"p95 {op['p95Ms']:>8.1f}  p99 {op['p99Ms']:>8.1f} ms  {errors}")
+
+
+def _parse_pairs(items, cast=str):
+    pairs = {}
+    for item in items:
+        key, sep, value = item.partition('=')
+        if not sep:
+            raise SystemExit(f'Se esperaba CLAVE=VALOR: {item}')
+        pairs[key.strip()] = cast(value.strip())
+    return pairs
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Prueba de carga concurrente de la API.')
+    parser.add_argument('scale', nargs='?', choices=SCALES, help='base sintética (ver dataset.py)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database', help='base SQLite a copiar en lugar de la sintética')
+    parser.add_argument('--url', help='servidor ya levantado (no se levanta uno local)')
+    parser.add_argument('--server-cmd', help='comando del servidor local; {port} y {python} se reemplazan '
+                                             '(por defecto: python -m benchmarks.serve --port {port})')
+    parser.add_argument('--env', action='append', default=[], metavar='CLAVE=VALOR',
+                        help='variable de entorno del servidor local (repetible)')
+    parser.add_argument('--server-log', help='guardar aquí la salida del servidor local')
+    parser.add_argument('--clients', type=int, default=8, help='clientes del perfil constante')
+    parser.add_argument('--duration', type=float, default=30, help='segundos del perfil constante')
+    parser.add_argument('--ramp', help='rampa: clientes por etapa, separados por coma (p. ej. 1,2,4,8,16)')
+    parser.add_argument('--step-duration', type=float, default=20, help='segundos por etapa de la rampa')
+    parser.add_argument('--warmup', type=float, default=5, help='segundos iniciales que no se cuentan')
+    parser.add_argument('--think', type=float, default=0, help='pausa media entre pedidos de un cliente (ms)')
+    parser.add_argument('--timeout', type=float, default=TIMEOUT, help='segundos por pedido')
+    parser.add_argument('--mix', help='archivo JSON con la mezcla (lista de operaciones como MIX)')
+    parser.add_argument('--categorias', help='proporción por categoría, p. ej. lectura=70,escritura=25,informe=5')
+    parser.add_argument('--max-error-rate', type=float, default=MAX_ERROR_RATE)
+    parser.add_argument('--slo-p95', type=float, help='p95 máximo aceptable (ms) para la saturación')
+    parser.add_argument('--output', help='archivo JSON donde guardar los resultados')
+    args = parser.parse_args(argv[1:])
+    if not (args.url or args.database or args.scale):
+        parser.error('indicar una escala, --database o --url')
+
+    mix = MIX
+    if args.mix:
+        with open(args.mix, encoding='utf-8') as source:
+            mix = json.load(source)
+    if args.categorias:
+        unknown = set(_parse_pairs(args.categorias.split(','))) - set(CATEGORIES)
+        if unknown:
+            parser.error(f'categorías desconocidas: {", ".join(sorted(unknown))}')
+        mix = with_categories(mix, _parse_pairs(args.categorias.split(','), float))
+    if not mix:
+        parser.error('la mezcla no tiene operaciones')
+    levels = [int(level) for level in args.ramp.split(',')] if args.ramp else [args.clients]
+    step_seconds = args.step_duration if args.ramp else args.duration
+
+    workdir = tempfile.mkdtemp(prefix='cargoflow-carga-')
+    process = None
+    try:
+        if args.url:
+            target = urlsplit(args.url)
+            host, port = target.hostname, target.port or 80
+        else:
+            source = args.database or ensure(args.scale, args.seed)
+            database = os.path.join(workdir, 'cargoflow.db')
+            shutil.copyfile(source, database)
+            host, port = '127.0.0.1', _free_port()
+            process, log_path = start_server(database, workdir, port, args.server_cmd,
+                                             _parse_pairs(args.env), args.server_log)
+
+        def connect():
+            return http.client.HTTPConnection(host, port, timeout=args.timeout)
+
+        wait_ready(connect, process, None if args.url else log_path)
+        sampler = Sampler.from_api(connect)
+        print(f'Cargando http://{host}:{port} con {len(mix)} operaciones; etapas: {levels}', flush=True)
+        stages = run_load(connect, mix, sampler, levels, step_seconds, args.warmup, args.think, args.seed)
+    finally:
+        if process is not None:
+            stop_server(process)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    for stage in stages:
+        _print_stage(stage)
+    saturation = find_saturation(stages, args.max_error_rate, args.slo_p95) if len(stages) > 1 else None
+    detail = stages[-1]
+    if saturation and saturation['clientes'] is None:
+        print(f"\nSaturado desde la primera etapa ({saturation['etapaSaturada']} clientes: {saturation['motivo']})")
+        detail = stages[0]
+    elif saturation:
+        print(f"\nSaturación: {saturation['clientes']} clientes, {saturation['throughput']} ped/s "
+              f"({saturation['etapaSaturada']} clientes: {saturation['motivo']})")
+        detail = next((s for s in stages if s['clientes'] == saturation['clientes']), detail)
+    elif len(stages) > 1:
+        print('\nSin saturación en la rampa.')
+    _print_operations(detail)
+
+    if args.output:
+        results = {
+            'objetivo': args.url or f'local ({args.server_cmd or "benchmarks.serve"})',
+            'escala': args.scale,
+            'semilla': args.seed,
+            'base': args.database,
+            'entorno': {'python': platform.python_version(), 'plataforma': platform.platform(),
+                        'cpus': os.cpu_count(), 'variables': _parse_pairs(args.env)},
+            'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'perfil': {'etapas': levels, 'segundosPorEtapa': step_seconds, 'calentamientoS': args.warmup,
+                       'pausaMs': args.think, 'timeoutS': args.timeout},
+            'mezcla': mix,
+            'etapas': stages,
+            'saturacion': saturation,
+        }
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(results, output, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
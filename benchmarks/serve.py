@@ -0,0 +1,36 @@
+# benchmarks/serve.py
+
+"""Levanta la API para las pruebas de carga (ver loadgen.py).
+
+Es el mismo servidor de `python server.py`, pero sin depurador ni recargador,
+sin registrar cada pedido y con el puerto y la cantidad de procesos como
+parámetros. La base y los directorios se toman del entorno (CARGOFLOW_*).
+
+    CARGOFLOW_DATABASE_URI=sqlite:////tmp/flota.db python -m benchmarks.serve --port 5055
+"""
+
+import argparse
+import logging
+import sys
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Servidor de la API para pruebas de carga.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--processes', type=int, default=1,
+                        help='procesos del servidor (con 1, un hilo por pedido)')
+    parser.add_argument('--access-log', action='store_true', help='registrar cada pedido')
+    args = parser.parse_args(argv[1:])
+
+    from server import app
+
+    if not args.access_log:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    app.run(host=args.host, port=args.port, debug=False, use_reloader=False,
+            threaded=args.processes == 1, processes=args.processes)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
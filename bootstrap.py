@@ -0,0 +1,74 @@
+# bootstrap.py
+
+"""Carga inicial de la aplicación en una sola respuesta (`/api/bootstrap`).
+
+Reúne los datos de referencia completos y la primera página de cada listado
+principal, leídos en una única transacción de lectura para que todo
+corresponda al mismo momento:
+
+    {'version': N,
+     'currencies': [...], 'vehiculoEstados': [...], 'viajeEstados': [...], 'tiposDeGasto': [...],
+     'choferes': {'items': [...], 'nextCursor': ...}, ..., 'gastos': {...}}
+
+`version` es la versión de sincronización (ver sync.py): el cliente continúa
+con `?since=<version>` en cada listado y con `?cursor=` para las páginas
+siguientes. El ETag se calcula con los contadores de cambios de las tablas
+involucradas (ver data_versions.py), así que una recarga sin cambios se
+responde con 304 sin leer las filas.
+"""
+
+import hashlib
+
+from data_versions import get_versions
+from database import Acoplado, Camion, Chofer, Gasto, Poliza, Viaje
+from lookups import LOOKUP_TABLES, lookup_cache
+from pagination import keyset_page
+from serialization import project, rows_to_dicts
+from sync import current_state
+
+# nombre -> (modelo, columna de orden, clave, descendente); el mismo orden que los listados de server.py
+MAIN_LISTS = {
+    'choferes': (Chofer, Chofer.id, Chofer.id, False),
+    'camiones': (Camion, Camion.dominio, Camion.dominio, False),
+    'acoplados': (Acoplado, Acoplado.dominio, Acoplado.dominio, False),
+    'viajes': (Viaje, Viaje.fecha_inicio, Viaje.id, True),
+    'polizas': (Poliza, Poliza.fin_vigencia, Poliza.id, False),
+    'gastos': (Gasto, Gasto.fecha, Gasto.id, True),
+}
+BOOTSTRAP_TABLES = sorted(model.__tablename__ for model, *_ in
+                          [*MAIN_LISTS.values(), *LOOKUP_TABLES.values()])
+
+
+def begin_snapshot(session):
+    """Abre la transacción de lectura de la sesión.
+
+    pysqlite no emite BEGIN antes de un SELECT, de modo que cada consulta vería
+    su propia foto de la base; en SQLite se abre a mano. En los demás motores se
+    pide REPEATABLE READ. Debe llamarse antes de cualquier otra consulta de la
+    sesión; la transacción termina con el commit o rollback de la sesión.
+    """
+    if session.get_bind().dialect.name != 'sqlite':
+        session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+        return
+    connection = session.connection()
+    if not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN')
+
+
+def bootstrap_etag(session, limit):
+    """Etiqueta (para un ETag débil) de la carga inicial con `limit` filas por página."""
+    versions = get_versions(session, BOOTSTRAP_TABLES)
+    key = repr((limit, sorted(versions.items()))).encode('utf-8')
+    return hashlib.sha1(key).hexdigest()
+
+
+def compute_bootstrap(session, limit):
+    """Datos de referencia y primera página de cada listado principal."""
+    payload = {'version': current_state(session)[0]}
+    # Verificado contra los contadores de la misma transacción: coincide con el resto.
+    payload.update(lookup_cache.get(session, max_age=0).data)
+    for name, (model, sort_col, key_col, descending) in MAIN_LISTS.items():
+        keys, query = project(session.query(model), model)
+        rows, next_cursor = keyset_page(query, sort_col, key_col, limit, descending=descending)
+        payload[name] = {'items': rows_to_dicts(keys, rows), 'nextCursor': next_cursor}
+    return payload
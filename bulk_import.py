@@ -0,0 +1,426 @@
+# bulk_import.py
+
+"""Importación masiva de gastos y viajes desde CSV o XLSX.
+
+El archivo se lee fila por fila (csv.reader o openpyxl en modo read-only),
+cada fila se valida contra búsquedas cacheadas (tipos de gasto, monedas,
+viajes, choferes, camiones, acoplados) y las filas válidas se insertan en
+lotes con un único executemany por transacción. Las filas rechazadas no
+detienen la importación: se informan con su número y los motivos.
+"""
+
+import codecs
+import csv
+import io
+import shutil
+import tempfile
+import unicodedata
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+
+from dateutil.parser import parse as parse_date
+from sqlalchemy import select
+
+from data_versions import bump_versions
+from database import Acoplado, Camion, Chofer, Gasto, Viaje
+from lookups import lookup_cache
+from rollups import add_inserted_rows
+from scheduling import find_conflicts
+from sync import record_change, stamp_rows
+
+# Filas insertadas por transacción
+BATCH_SIZE = 5000
+# Cantidad máxima de filas rechazadas que se detallan en la respuesta
+MAX_REPORTED_ERRORS = 1000
+# Cantidad máxima de claves por consulta IN al verificar referencias
+_LOOKUP_CHUNK = 500
+# Codificaciones de CSV que se prueban en orden: UTF-8 (con o sin BOM) y las
+# de las planillas exportadas en Windows; latin-1 acepta cualquier byte.
+CSV_ENCODINGS = ('utf-8-sig', 'cp1252', 'latin-1')
+_SCAN_CHUNK = 64 * 1024
+
+
+class ImportFileError(ValueError):
+    """El archivo no se puede importar (formato desconocido, encabezados faltantes...).
+    `inserted` son las filas ya confirmadas cuando el error aparece a mitad del archivo."""
+
+    def __init__(self, message, inserted=0):
+        super().__init__(message)
+        self.inserted = inserted
+
+
+# --- Lectura del archivo ---
+
+def _normalize_header(name):
+    name = unicodedata.normalize('NFKD', str(name or '')).encode('ascii', 'ignore').decode('ascii')
+    return name.strip().lower().replace(' ', '').replace('_', '')
+
+
+def detect_format(filename, mimetype, explicit=None):
+    fmt = (explicit or '').lower()
+    if not fmt:
+        name = (filename or '').lower()
+        if name.endswith('.xlsx') or 'spreadsheetml' in (mimetype or ''):
+            fmt = 'xlsx'
+        elif name.endswith('.csv') or 'csv' in (mimetype or '') or (mimetype or '').startswith('text/'):
+            fmt = 'csv'
+    if fmt not in ('csv', 'xlsx'):
+        raise ImportFileError('Formato no reconocido: envíe un archivo .csv o .xlsx (o use ?format=csv|xlsx)')
+    return fmt
+
+
+def _seekable(stream):
+    if stream.seekable():
+        return stream
+    copy = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    shutil.copyfileobj(stream, copy)
+    copy.seek(0)
+    return copy
+
+
+def detect_encoding(stream):
+    """Primera codificación de CSV_ENCODINGS que decodifica todo el archivo.
+    Se recorre en bloques antes de importar, así un error de codificación no
+    aparece después de haber confirmado los primeros lotes."""
+    for encoding in CSV_ENCODINGS:
+        stream.seek(0)
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            while chunk := stream.read(_SCAN_CHUNK):
+                decoder.decode(chunk)
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            continue
+        stream.seek(0)
+        return encoding
+    raise ImportFileError('No se pudo leer el archivo: codificación desconocida')
+
+
+def iter_rows(stream, fmt):
+    """Devuelve (encabezados, iterador de filas) sin cargar el archivo completo."""
+    if fmt == 'csv':
+        stream = _seekable(stream)
+        text = io.TextIOWrapper(stream, encoding=detect_encoding(stream), newline='')
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(text, dialect)
+        try:
+            headers = next(reader, None)
+        except csv.Error as e:
+            raise ImportFileError(f'Fila 1: {e}')
+        if headers is None:
+            raise ImportFileError('El archivo está vacío')
+        return headers, reader
+
+    from openpyxl import load_workbook
+    try:
+        wb = load_workbook(stream, read_only=True, data_only=True)
+    except Exception:
+        raise ImportFileError('El archivo no es un XLSX válido')
+    rows = wb.worksheets[0].iter_rows(values_only=True)
+    headers = next(rows, None)
+    if headers is None:
+        wb.close()
+        raise ImportFileError('El archivo está vacío')
+
+    def _rows():
+        try:
+            yield from rows
+        finally:
+            wb.close()
+    return list(headers), _rows()
+
+
+# --- Conversión de valores ---
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _to_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    value = str(value).strip()
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return parse_date(value)
+
+
+def _to_float(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(str(value).strip().replace(',', '.'))
+
+
+def _to_int(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return int(str(value).strip())
+
+
+def _to_str(value):
+    return str(value).strip()
+
+
+class _KeyLookup:
+    """Verifica la existencia de claves de una tabla, consultando la base sólo
+    por las claves que todavía no vio."""
+
+    def __init__(self, session, column):
+        self.session = session
+        self.column = column
+        self.known = set()
+        self.missing = set()
+
+    def prefetch(self, keys):
+        pending = [k for k in set(keys) if k not in self.known and k not in self.missing]
+        for i in range(0, len(pending), _LOOKUP_CHUNK):
+            chunk = pending[i:i + _LOOKUP_CHUNK]
+            found = {k for (k,) in self.session.execute(select(self.column).where(self.column.in_(chunk)))}
+            self.known.update(found)
+            self.missing.update(set(chunk) - found)
+
+    def __contains__(self, key):
+        return key in self.known
+
+
+# --- Definición de cada importación ---
+
+class _Importer(ABC):
+    """Convierte filas en diccionarios listos para insertar en `table`."""
+
+    model = None
+    # nombre normalizado del encabezado -> columna de la tabla
+    aliases = {}
+    required = ()
+
+    def __init__(self, session):
+        self.session = session
+        self.table = self.model.__table__
+
+    def map_headers(self, headers):
+        mapping = {}
+        for index, header in enumerate(headers):
+            column = self.aliases.get(_normalize_header(header))
+            if column is not None and column not in mapping.values():
+                mapping[index] = column
+        missing = [c for c in self.required if c not in mapping.values()]
+        if missing:
+            raise ImportFileError(f'Faltan columnas obligatorias: {", ".join(missing)}')
+        return mapping
+
+    @abstractmethod
+    def convert(self, raw):
+        """Devuelve (fila, errores) para un diccionario columna -> valor crudo."""
+
+    def check_references(self, rows):
+        """Verifica las claves foráneas de un lote; devuelve {índice: [errores]}."""
+        return {}
+
+
+class GastoImporter(_Importer):
+    model = Gasto
+    aliases = {
+        'monto': 'monto', 'importe': 'monto',
+        'fecha': 'fecha',
+        'descripcion': 'descripcion',
+        'viajeid': 'viaje_id', 'viaje': 'viaje_id',
+        'tipoid': 'tipo_id', 'tipo': 'tipo', 'tipodegasto': 'tipo',
+        'moneda': 'moneda',
+    }
+    required = ('monto', 'viaje_id', 'moneda')
+
+    def __init__(self, session):
+        super().__init__(session)
+        lookups = lookup_cache.get(session, max_age=0)
+        self.tipo_ids = lookups.tipo_nombres.keys()
+        self.tipos_por_nombre = lookups.tipos_por_nombre
+        self.monedas = lookups.monedas
+        self.viajes = _KeyLookup(session, Viaje.id)
+
+    def map_headers(self, headers):
+        mapping = super().map_headers(headers)
+        if 'tipo_id' not in mapping.values() and 'tipo' not in mapping.values():
+            raise ImportFileError('Faltan columnas obligatorias: tipo_id (o tipo)')
+        return mapping
+
+    def convert(self, raw):
+        row, errors = {'descripcion': None, 'fecha': None}, []
+        try:
+            row['monto'] = _to_float(raw.get('monto'))
+        except (TypeError, ValueError):
+            errors.append('monto inválido')
+        if not _blank(raw.get('fecha')):
+            try:
+                row['fecha'] = _to_datetime(raw['fecha'])
+            except (ValueError, OverflowError):
+                errors.append('fecha inválida')
+        if not _blank(raw.get('descripcion')):
+            row['descripcion'] = _to_str(raw['descripcion'])
+        try:
+            row['viaje_id'] = _to_int(raw.get('viaje_id'))
+        except (TypeError, ValueError):
+            errors.append('viaje_id inválido')
+
+        tipo_id = None
+        if not _blank(raw.get('tipo_id')):
+            try:
+                tipo_id = _to_int(raw['tipo_id'])
+            except (TypeError, ValueError):
+                pass
+        elif not _blank(raw.get('tipo')):
+            tipo_id = self.tipos_por_nombre.get(_to_str(raw['tipo']).lower())
+        if tipo_id not in self.tipo_ids:
+            errors.append('tipo de gasto inexistente')
+        row['tipo_id'] = tipo_id
+
+        moneda = None if _blank(raw.get('moneda')) else _to_str(raw['moneda']).upper()
+        if moneda not in self.monedas:
+            errors.append('moneda inexistente')
+        row['moneda'] = moneda
+        return row, errors
+
+    def check_references(self, rows):
+        self.viajes.prefetch(row['viaje_id'] for row in rows)
+        return {i: ['viaje inexistente'] for i, row in enumerate(rows) if row['viaje_id'] not in self.viajes}
+
+
+class ViajeImporter(_Importer):
+    model = Viaje
+    aliases = {
+        'origen': 'origen',
+        'destino': 'destino',
+        'fechainicio': 'fecha_inicio',
+        'fechafin': 'fecha_fin',
+        'choferid': 'chofer_id', 'chofer': 'chofer_id',
+        'camiondominio': 'camion_dominio', 'camion': 'camion_dominio',
+        'acopladodominio': 'acoplado_dominio', 'acoplado': 'acoplado_dominio',
+        'estado': 'estado',
+    }
+    required = ('origen', 'destino')
+
+    def __init__(self, session):
+        super().__init__(session)
+        self.estados = lookup_cache.get(session, max_age=0).viaje_estados
+        self.choferes = _KeyLookup(session, Chofer.id)
+        self.camiones = _KeyLookup(session, Camion.dominio)
+        self.acoplados = _KeyLookup(session, Acoplado.dominio)
+
+    def convert(self, raw):
+        row, errors = {}, []
+        for column in ('origen', 'destino'):
+            if _blank(raw.get(column)):
+                errors.append(f'{column} vacío')
+                row[column] = None
+            else:
+                row[column] = _to_str(raw[column])
+        for column in ('fecha_inicio', 'fecha_fin'):
+            row[column] = None
+            if not _blank(raw.get(column)):
+                try:
+                    row[column] = _to_datetime(raw[column])
+                except (ValueError, OverflowError):
+                    errors.append(f'{column} inválida')
+        row['chofer_id'] = None
+        if not _blank(raw.get('chofer_id')):
+            try:
+                row['chofer_id'] = _to_int(raw['chofer_id'])
+            except (TypeError, ValueError):
+                errors.append('chofer_id inválido')
+        for column in ('camion_dominio', 'acoplado_dominio'):
+            row[column] = None if _blank(raw.get(column)) else _to_str(raw[column])
+        row['estado'] = None
+        if not _blank(raw.get('estado')):
+            row['estado'] = _to_str(raw['estado'])
+            if self.estados and row['estado'] not in self.estados:
+                errors.append('estado inexistente')
+        return row, errors
+
+    def check_references(self, rows):
+        checks = (('chofer_id', self.choferes, 'chofer inexistente'),
+                  ('camion_dominio', self.camiones, 'camión inexistente'),
+                  ('acoplado_dominio', self.acoplados, 'acoplado inexistente'))
+        errors = {}
+        for column, lookup, message in checks:
+            lookup.prefetch(row[column] for row in rows if row[column] is not None)
+            for i, row in enumerate(rows):
+                if row[column] is not None and row[column] not in lookup:
+                    errors.setdefault(i, []).append(message)
+        # Superposiciones con viajes ya cargados (incluidos los lotes anteriores) y dentro del lote.
+        for i, conflicts in find_conflicts(self.session, rows).items():
+            errors.setdefault(i, []).extend(
+                f"{c['recurso']} ocupado por el viaje {c['viajeId'] if c['viajeId'] is not None else 'de otra fila'}"
+                for c in conflicts)
+        return errors
+
+
+IMPORTERS = {
+    'gastos': GastoImporter,
+    'viajes': ViajeImporter,
+}
+
+
+def run_import(session, entity, stream, fmt, batch_size=BATCH_SIZE):
+    """Importa el archivo y devuelve el resumen: insertadas, rechazadas y errores por fila.
+
+    Cada lote se inserta y se confirma en su propia transacción.
+    """
+    importer = IMPORTERS[entity](session)
+    headers, rows = iter_rows(stream, fmt)
+    mapping = importer.map_headers(headers)
+    summary = {'inserted': 0, 'rejected': 0, 'errors': []}
+
+    def reject(row_number, reasons):
+        summary['rejected'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'row': row_number, 'errors': reasons})
+
+    def flush(batch, numbers):
+        bad = importer.check_references(batch)
+        good = [row for i, row in enumerate(batch) if i not in bad]
+        for i in sorted(bad):
+            reject(numbers[i], bad[i])
+        if good:
+            version = stamp_rows(session.connection(), good)
+            session.execute(importer.table.insert(), good)
+            record_change(session, version, entity, None, 'import')
+            if importer.model is Gasto:
+                add_inserted_rows(session.connection(), good)
+            bump_versions(session.connection(), [importer.table.name])
+            session.commit()
+            summary['inserted'] += len(good)
+
+    batch, numbers = [], []
+    # La fila 1 es el encabezado.
+    row_number = 1
+    try:
+        for row_number, values in enumerate(rows, start=2):
+            if not values or all(_blank(v) for v in values):
+                continue
+            raw = {column: values[index] for index, column in mapping.items() if index < len(values)}
+            row, errors = importer.convert(raw)
+            if errors:
+                reject(row_number, errors)
+                continue
+            batch.append(row)
+            numbers.append(row_number)
+            if len(batch) >= batch_size:
+                flush(batch, numbers)
+                batch, numbers = [], []
+    except (csv.Error, UnicodeDecodeError) as e:
+        # Los lotes anteriores ya están confirmados: se informa cuántas filas entraron.
+        session.rollback()
+        raise ImportFileError(f'Fila {row_number + 1}: no se pudo leer ({e}); '
+                              f'se importaron {summary["inserted"]} filas antes del error',
+                              inserted=summary['inserted'])
+    if batch:
+        flush(batch, numbers)
+    summary['errorsTruncated'] = summary['rejected'] > len(summary['errors'])
+    return summary
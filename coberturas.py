@@ -0,0 +1,229 @@
+# coberturas.py
+
+"""Índice de cobertura de seguros por vehículo.
+
+La tabla `coberturas` guarda, para cada `vehiculo_dominio`, los períodos
+continuos cubiertos por sus pólizas: las vigencias [inicio, fin] (días
+inclusive) superpuestas o contiguas se unen en un solo período. Así una
+póliza renovada a tiempo no aparece como "por vencer", y un vehículo está
+cubierto en un día si y sólo si un único período lo contiene.
+
+Cada flush que crea, modifica o elimina pólizas recalcula los períodos de los
+vehículos afectados en la misma transacción (son pocas pólizas por vehículo).
+`rebuild` recalcula todos.
+
+Como los períodos de un vehículo no se superponen, "¿está cubierto entre a y
+b?" se responde con el último período que empieza a más tardar en `a`: el
+vehículo está cubierto si ese período termina en `b` o después. Es una
+búsqueda en el índice (vehiculo_dominio, inicio), por vehículo o por viaje,
+en lugar de comparar todas las pólizas con todos los viajes:
+
+- `expiring`: coberturas vigentes que terminan en los próximos N días.
+- `uninsured`: camiones y acoplados sin cobertura en una fecha.
+- `uncovered_viajes_query`: viajes con camión o acoplado sin cobertura
+  durante todo el viaje (del día de inicio al día de fin, o sólo el de
+  inicio si no tiene fin).
+"""
+
+from datetime import date, timedelta
+
+from sqlalchemy import and_, event, func, literal, or_, select, union_all
+from sqlalchemy.orm import Session
+
+from dashboard import POR_VENCER_DIAS
+from database import Acoplado, Camion, Cobertura, Poliza, Viaje
+
+SIN_INICIO = date.min
+SIN_VENCIMIENTO = date.max
+VIAJE_CANCELADO = 'Cancelado'
+_COBERTURAS = Cobertura.__table__
+_POLIZAS = Poliza.__table__
+_DOMINIOS_KEY = 'coverage_dominios'
+
+
+def merge_intervals(vigencias):
+    """Une las vigencias (inicio, fin) superpuestas o contiguas.
+    Devuelve [(inicio, fin, cantidad de pólizas)] ordenado por inicio."""
+    merged = []
+    for inicio, fin in sorted((inicio or SIN_INICIO, fin or SIN_VENCIMIENTO) for inicio, fin in vigencias):
+        if fin < inicio:
+            continue  # vigencia inválida: no cubre nada
+        if merged and (merged[-1][1] == SIN_VENCIMIENTO or inicio <= merged[-1][1] + timedelta(days=1)):
+            last = merged[-1]
+            merged[-1] = (last[0], max(last[1], fin), last[2] + 1)
+        else:
+            merged.append((inicio, fin, 1))
+    return merged
+
+
+def refresh_vehicles(connection, dominios):
+    """Recalcula los períodos de cobertura de los vehículos `dominios`."""
+    dominios = sorted(dominio for dominio in set(dominios) if dominio is not None)
+    for start in range(0, len(dominios), 500):
+        chunk = dominios[start:start + 500]
+        vigencias = {dominio: [] for dominio in chunk}
+        for dominio, inicio, fin in connection.execute(
+                select(_POLIZAS.c.vehiculo_dominio, _POLIZAS.c.inicio_vigencia, _POLIZAS.c.fin_vigencia)
+                .where(_POLIZAS.c.vehiculo_dominio.in_(chunk))):
+            vigencias[dominio].append((inicio, fin))
+        connection.execute(_COBERTURAS.delete().where(_COBERTURAS.c.vehiculo_dominio.in_(chunk)))
+        rows = [{'vehiculo_dominio': dominio, 'inicio': inicio, 'fin': fin, 'polizas': polizas}
+                for dominio, items in vigencias.items() for inicio, fin, polizas in merge_intervals(items)]
+        if rows:
+            connection.execute(_COBERTURAS.insert(), rows)
+
+
+def rebuild(connection):
+    """Recalcula la tabla completa. Devuelve la cantidad de períodos."""
+    connection.execute(_COBERTURAS.delete())
+    dominios = connection.execute(select(_POLIZAS.c.vehiculo_dominio).distinct()).scalars().all()
+    refresh_vehicles(connection, dominios)
+    return connection.execute(select(func.count()).select_from(_COBERTURAS)).scalar()
+
+
+def _dominios(connection, ids):
+    ids = list(ids)
+    dominios = set()
+    for start in range(0, len(ids), 500):
+        dominios.update(connection.execute(select(_POLIZAS.c.vehiculo_dominio)
+                                           .where(_POLIZAS.c.id.in_(ids[start:start + 500]))).scalars())
+    return dominios
+
+
+@event.listens_for(Session, 'before_flush')
+def _read_old_dominios(session, flush_context, instances):
+    # Valores todavía no escritos: lo que hay en la base es el vehículo anterior.
+    polizas = [obj.id for obj in (*session.dirty, *session.deleted)
+               if isinstance(obj, Poliza) and obj.id is not None]
+    if not polizas and not any(isinstance(obj, Poliza) for obj in session.new):
+        return
+    session.info.setdefault(_DOMINIOS_KEY, set()).update(_dominios(session.connection(), polizas))
+
+
+@event.listens_for(Session, 'after_flush')
+def _refresh_coverage(session, flush_context):
+    dominios = session.info.pop(_DOMINIOS_KEY, None)
+    if dominios is None:
+        return
+    # new/dirty/deleted todavía reflejan lo que se acaba de escribir.
+    current = [obj.id for obj in (*session.new, *session.dirty)
+               if isinstance(obj, Poliza) and obj not in session.deleted]
+    connection = session.connection()
+    refresh_vehicles(connection, dominios | _dominios(connection, current))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_state(session):
+    session.info.pop(_DOMINIOS_KEY, None)
+
+
+def _iso(value, sentinel):
+    return None if value is None or value == sentinel else value.isoformat()
+
+
+def cobertura_to_dict(dominio, inicio, fin, polizas=None):
+    item = {'vehiculoDominio': dominio, 'inicio': _iso(inicio, SIN_INICIO), 'fin': _iso(fin, SIN_VENCIMIENTO)}
+    if polizas is not None:
+        item['polizas'] = polizas
+    return item
+
+
+def coverage_periods(session, dominio=None):
+    query = select(_COBERTURAS.c.vehiculo_dominio, _COBERTURAS.c.inicio, _COBERTURAS.c.fin, _COBERTURAS.c.polizas)
+    if dominio is not None:
+        query = query.where(_COBERTURAS.c.vehiculo_dominio == dominio)
+    rows = session.execute(query.order_by(_COBERTURAS.c.vehiculo_dominio, _COBERTURAS.c.inicio))
+    return [cobertura_to_dict(*row) for row in rows]
+
+
+def expiring_query(hoy, dias=POR_VENCER_DIAS):
+    return (select(_COBERTURAS.c.vehiculo_dominio, _COBERTURAS.c.inicio, _COBERTURAS.c.fin)
+            .where(_COBERTURAS.c.fin.between(hoy, hoy + timedelta(days=dias)), _COBERTURAS.c.inicio <= hoy)
+            .order_by(_COBERTURAS.c.fin, _COBERTURAS.c.vehiculo_dominio))
+
+
+def expiring(session, hoy=None, dias=POR_VENCER_DIAS):
+    """Coberturas vigentes hoy que terminan en los próximos `dias` días (la
+    póliza puede haberse renovado: cuenta el fin del período unido)."""
+    hoy = hoy or date.today()
+    rows = session.execute(expiring_query(hoy, dias))
+    return [{**cobertura_to_dict(*row), 'diasRestantes': (row.fin - hoy).days} for row in rows]
+
+
+def last_period_query(dominio, day):
+    """Fin del último período del vehículo que empieza a más tardar en `day`
+    (`dominio` puede ser una columna, para usarla como subconsulta correlacionada)."""
+    return (select(_COBERTURAS.c.fin)
+            .where(_COBERTURAS.c.vehiculo_dominio == dominio, _COBERTURAS.c.inicio <= day)
+            .order_by(_COBERTURAS.c.inicio.desc()).limit(1))
+
+
+def _last_period(dominio_col, day):
+    return last_period_query(dominio_col, day).scalar_subquery()
+
+
+def _next_start(dominio_col, day):
+    return (select(_COBERTURAS.c.inicio)
+            .where(_COBERTURAS.c.vehiculo_dominio == dominio_col, _COBERTURAS.c.inicio > day)
+            .order_by(_COBERTURAS.c.inicio).limit(1).scalar_subquery())
+
+
+def uninsured(session, hoy=None):
+    """Camiones y acoplados sin cobertura en `hoy`, con el fin de su última
+    cobertura y el inicio de la próxima (si ya hay una póliza cargada)."""
+    hoy = hoy or date.today()
+    vehicles = union_all(
+        select(Camion.dominio.label('dominio'), literal('camion').label('tipo'), Camion.estado.label('estado')),
+        select(Acoplado.dominio.label('dominio'), literal('acoplado').label('tipo'), Acoplado.estado.label('estado')),
+    ).subquery()
+    last_end = _last_period(vehicles.c.dominio, hoy)
+    rows = session.execute(
+        select(vehicles.c.dominio, vehicles.c.tipo, vehicles.c.estado, last_end.label('hasta'),
+               _next_start(vehicles.c.dominio, hoy).label('desde'))
+        .where(or_(last_end.is_(None), last_end < hoy))
+        .order_by(vehicles.c.tipo, vehicles.c.dominio))
+    return [{'dominio': row.dominio, 'tipo': row.tipo, 'estado': row.estado,
+             'coberturaHasta': _iso(row.hasta, SIN_VENCIMIENTO),
+             'proximaCobertura': _iso(row.desde, SIN_INICIO)} for row in rows]
+
+
+def _covered(dominio_col, inicio, fin):
+    # Cubierto si el último período que empieza a más tardar el día de inicio llega al día de fin.
+    return func.coalesce(_last_period(dominio_col, inicio) >= fin, False)
+
+
+def uncovered_viajes_query(session, desde=None, hasta=None):
+    """Consulta de los viajes (no cancelados) cuyo camión o acoplado no tuvo
+    cobertura durante todo el viaje, con una columna por vehículo que indica
+    si estaba cubierto. Filtros opcionales por fecha de inicio."""
+    inicio = func.date(Viaje.fecha_inicio)
+    fin = func.coalesce(func.date(Viaje.fecha_fin), inicio)
+    camion_ok = _covered(Viaje.camion_dominio, inicio, fin)
+    acoplado_ok = _covered(Viaje.acoplado_dominio, inicio, fin)
+    query = session.query(Viaje.id, Viaje.fecha_inicio, Viaje.fecha_fin, Viaje.camion_dominio,
+                          Viaje.acoplado_dominio, Viaje.estado,
+                          camion_ok.label('camion_cubierto'), acoplado_ok.label('acoplado_cubierto'))
+    query = query.filter(
+        Viaje.fecha_inicio.isnot(None),
+        or_(Viaje.estado.is_(None), Viaje.estado != VIAJE_CANCELADO),
+        or_(and_(Viaje.camion_dominio.isnot(None), ~camion_ok),
+            and_(Viaje.acoplado_dominio.isnot(None), ~acoplado_ok)))
+    if desde is not None:
+        query = query.filter(Viaje.fecha_inicio >= desde)
+    if hasta is not None:
+        query = query.filter(Viaje.fecha_inicio <= hasta)
+    return query
+
+
+def uncovered_viaje_to_dict(row):
+    sin_cobertura = []
+    if row.camion_dominio is not None and not row.camion_cubierto:
+        sin_cobertura.append('camion')
+    if row.acoplado_dominio is not None and not row.acoplado_cubierto:
+        sin_cobertura.append('acoplado')
+    return {
+        'id': row.id, 'fechaInicio': row.fecha_inicio.isoformat(),
+        'fechaFin': row.fecha_fin.isoformat() if row.fecha_fin else None,
+        'camionDominio': row.camion_dominio, 'acopladoDominio': row.acoplado_dominio,
+        'estado': row.estado, 'sinCobertura': sin_cobertura,
+    }
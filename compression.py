@@ -0,0 +1,139 @@
+# compression.py
+
+"""Compresión de respuestas (gzip y, si está instalado, brotli).
+
+Se aplica a todas las respuestas de la API después de generarlas
+(`compress_response`, registrado como after_request en server.py):
+
+- Sólo a los tipos de contenido que se comprimen bien (JSON, NDJSON, CSV);
+  no a las fotos ni a los .xlsx, que ya vienen comprimidos, ni al stream de
+  eventos, que se entrega mensaje a mensaje.
+- Las respuestas armadas en memoria menores que `min_size` se envían tal cual.
+- Las respuestas en streaming se comprimen bloque a bloque, sin esperar al final.
+- Si la respuesta es un GET con ETag, el cuerpo comprimido se guarda en un
+  caché (ruta, ETag, codificación), de modo que los pedidos repetidos no
+  vuelven a comprimir. El ETag pasa a ser débil: el cuerpo comprimido es otra
+  representación del mismo contenido.
+"""
+
+import gzip
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional; sin él sólo se ofrece gzip
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = frozenset(['application/json', 'application/x-ndjson', 'text/csv'])
+MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Los cuerpos que van al caché se comprimen una sola vez: vale la pena comprimir más.
+CACHED_GZIP_LEVEL = 9
+CACHED_BROTLI_QUALITY = 9
+CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+
+def available_encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def choose_encoding(accept_encodings):
+    """Codificación a usar según Accept-Encoding, o None para no comprimir."""
+    return accept_encodings.best_match(available_encodings())
+
+
+def compress(body, encoding, cached=False):
+    if encoding == 'br':
+        return brotli.compress(body, quality=CACHED_BROTLI_QUALITY if cached else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=CACHED_GZIP_LEVEL if cached else GZIP_LEVEL)
+
+
+def iter_compressed(chunks, encoding):
+    """Comprime un cuerpo en streaming; cada bloque sale apenas se genera."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: formato gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class CompressedBodyCache:
+    """Cuerpos comprimidos por (ruta, ETag, codificación), con un máximo de bytes
+    (se descartan los usados hace más tiempo)."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+def compress_response(response, request, cache=None, min_size=MIN_SIZE):
+    """Comprime `response` si corresponde y devuelve la respuesta."""
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or response.direct_passthrough or 'Content-Encoding' in response.headers):
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = iter_compressed(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+        etag, weak = response.get_etag()
+        cacheable = cache is not None and etag is not None and request.method == 'GET'
+        key = (request.path, etag, encoding)
+        compressed = cache.get(key) if cacheable else None
+        if compressed is None:
+            compressed = compress(body, encoding, cached=cacheable)
+            if cacheable:
+                cache.put(key, compressed)
+        response.set_data(compressed)
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+    response.headers['Content-Encoding'] = encoding
+    return response
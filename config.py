@@ -0,0 +1,99 @@
+# config.py
+
+"""Perfil del motor de base de datos.
+
+La URI y el ajuste del motor se leen del entorno, de modo que el mismo código
+sirve con el archivo SQLite local o con una base de datos servidor:
+
+- `CARGOFLOW_DATABASE_URI`: URI de SQLAlchemy (por defecto `sqlite:///cargoflow.db`,
+  que Flask-SQLAlchemy ubica dentro de `instance/`).
+- `CARGOFLOW_DB_POOL_SIZE`, `CARGOFLOW_DB_MAX_OVERFLOW`, `CARGOFLOW_DB_POOL_TIMEOUT`,
+  `CARGOFLOW_DB_POOL_RECYCLE`: tamaño y tiempos del pool de conexiones.
+- `CARGOFLOW_SQLITE_<PRAGMA>`: valor de cada PRAGMA de SQLITE_PRAGMAS (por
+  ejemplo `CARGOFLOW_SQLITE_JOURNAL_MODE=DELETE`); un valor vacío lo omite.
+
+En SQLite los PRAGMA se aplican en cada conexión nueva. WAL permite que los
+informes lean mientras otra conexión escribe, y busy_timeout hace que un
+escritor espere el lock en lugar de fallar con "database is locked".
+"""
+
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+DEFAULT_DATABASE_URI = 'sqlite:///cargoflow.db'
+
+# PRAGMA -> valor por defecto
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',        # seguro con WAL; sólo se sincroniza en los checkpoints
+    'busy_timeout': '5000',         # milisegundos
+    'mmap_size': str(256 * 1024 * 1024),
+    'cache_size': str(-64 * 1024),  # negativo: KiB (64 MB por conexión)
+    'temp_store': 'MEMORY',
+}
+
+
+def database_uri():
+    return os.environ.get('CARGOFLOW_DATABASE_URI') or DEFAULT_DATABASE_URI
+
+
+def _is_sqlite_memory(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def sqlite_pragmas():
+    """PRAGMA a aplicar, con los valores del entorno."""
+    pragmas = {}
+    for name, default in SQLITE_PRAGMAS.items():
+        value = os.environ.get(f'CARGOFLOW_SQLITE_{name.upper()}', default)
+        if value:
+            pragmas[name] = value
+    return pragmas
+
+
+def engine_options(uri):
+    """Opciones de create_engine (y de SQLALCHEMY_ENGINE_OPTIONS) para `uri`."""
+    url = make_url(uri)
+    if _is_sqlite_memory(url):
+        # Base en memoria: SQLAlchemy usa un pool propio de una conexión por hilo.
+        return {}
+    options = {
+        'pool_size': int(os.environ.get('CARGOFLOW_DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('CARGOFLOW_DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.environ.get('CARGOFLOW_DB_POOL_TIMEOUT', 30)),
+    }
+    if url.get_backend_name() == 'sqlite':
+        # El lock lo maneja busy_timeout; el del driver queda alineado con él.
+        busy_ms = int(sqlite_pragmas().get('busy_timeout', 5000))
+        options['connect_args'] = {'timeout': busy_ms / 1000}
+    else:
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = int(os.environ.get('CARGOFLOW_DB_POOL_RECYCLE', 1800))
+    return options
+
+
+def install_sqlite_pragmas(engine, pragmas=None):
+    """Registra los PRAGMA para cada conexión nueva de `engine` (no hace nada
+    si el motor no es SQLite)."""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = sqlite_pragmas() if pragmas is None else pragmas
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+def create_configured_engine(uri):
+    """Crea un motor con el mismo perfil que el de la aplicación (para procesos
+    que no pasan por Flask, como los trabajadores de informes)."""
+    engine = create_engine(uri, **engine_options(uri))
+    install_sqlite_pragmas(engine)
+    return engine
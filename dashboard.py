@@ -0,0 +1,117 @@
+# dashboard.py
+
+"""Indicadores del dashboard calculados en el servidor.
+
+En lugar de que el navegador descargue todos los viajes, pólizas y camiones
+para filtrarlos, `/api/dashboard` resuelve cada indicador con un COUNT sobre
+columnas indexadas (`Viaje.estado`, `Poliza.fin_vigencia`, `Camion.estado`)
+y devuelve, además, las primeras filas de cada alerta.
+
+El resultado se guarda en memoria unos segundos, con los contadores de
+`table_versions` como clave: cualquier escritura en las tablas involucradas
+lo invalida en la próxima consulta.
+"""
+
+import threading
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import func
+
+from data_versions import get_versions
+from database import Camion, Chofer, Poliza, Viaje
+
+VIAJE_ACTIVO = 'En Curso'
+CAMION_EN_MANTENIMIENTO = 'En Mantenimiento'
+POR_VENCER_DIAS = 30
+TOP_N = 5
+MAX_TOP_N = 50
+
+DASHBOARD_TABLES = ('viajes', 'choferes', 'camiones', 'polizas')
+
+
+def _poliza_alerta(poliza_id, dominio, fin):
+    return {'id': poliza_id, 'vehiculoDominio': dominio,
+            'finVigencia': fin.isoformat() if fin else None}
+
+
+def compute_dashboard(session, hoy=None, top_n=TOP_N):
+    """Calcula los indicadores del dashboard para la fecha `hoy`."""
+    hoy = hoy or date.today()
+    limite = hoy + timedelta(days=POR_VENCER_DIAS)
+
+    viajes_activos = session.query(func.count(Viaje.id)).filter(Viaje.estado == VIAJE_ACTIVO).scalar()
+    choferes_en_viaje = (session.query(func.count(func.distinct(Viaje.chofer_id)))
+                         .filter(Viaje.estado == VIAJE_ACTIVO, Viaje.chofer_id.isnot(None)).scalar())
+    total_choferes = session.query(func.count(Chofer.id)).scalar()
+
+    vencidas = Poliza.fin_vigencia < hoy
+    por_vencer = Poliza.fin_vigencia.between(hoy, limite)
+    en_mantenimiento = Camion.estado == CAMION_EN_MANTENIMIENTO
+
+    polizas_vencidas = session.query(func.count(Poliza.id)).filter(vencidas).scalar()
+    polizas_por_vencer = session.query(func.count(Poliza.id)).filter(por_vencer).scalar()
+    camiones_mantenimiento = session.query(func.count(Camion.dominio)).filter(en_mantenimiento).scalar()
+
+    # Las vencidas más recientes primero; las por vencer, las más próximas primero.
+    top_vencidas = (session.query(Poliza.id, Poliza.vehiculo_dominio, Poliza.fin_vigencia)
+                    .filter(vencidas).order_by(Poliza.fin_vigencia.desc()).limit(top_n).all())
+    top_por_vencer = (session.query(Poliza.id, Poliza.vehiculo_dominio, Poliza.fin_vigencia)
+                      .filter(por_vencer).order_by(Poliza.fin_vigencia.asc()).limit(top_n).all())
+    top_mantenimiento = (session.query(Camion.dominio, Camion.modelo)
+                         .filter(en_mantenimiento).order_by(Camion.dominio).limit(top_n).all())
+    top_viajes = (session.query(Viaje.id, Viaje.origen, Viaje.destino, Viaje.fecha_inicio)
+                  .filter(Viaje.estado == VIAJE_ACTIVO)
+                  .order_by(Viaje.fecha_inicio.desc(), Viaje.id.desc()).limit(top_n).all())
+
+    return {
+        'fecha': hoy.isoformat(),
+        'viajesActivos': viajes_activos,
+        'choferesDisponibles': total_choferes - choferes_en_viaje,
+        'polizasVencidas': polizas_vencidas,
+        'polizasPorVencer': polizas_por_vencer,
+        'camionesEnMantenimiento': camiones_mantenimiento,
+        'alertas': polizas_vencidas + polizas_por_vencer + camiones_mantenimiento,
+        'top': {
+            'viajesActivos': [
+                {'id': v.id, 'origen': v.origen, 'destino': v.destino,
+                 'fechaInicio': v.fecha_inicio.isoformat() if v.fecha_inicio else None}
+                for v in top_viajes],
+            'polizasVencidas': [_poliza_alerta(*p) for p in top_vencidas],
+            'polizasPorVencer': [_poliza_alerta(*p) for p in top_por_vencer],
+            'camionesEnMantenimiento': [{'dominio': c.dominio, 'modelo': c.modelo}
+                                        for c in top_mantenimiento],
+        },
+    }
+
+
+class DashboardCache:
+    """Guarda el último dashboard calculado por `ttl` segundos.
+
+    La clave incluye la fecha, `top_n` y las versiones de las tablas, así que
+    una escritura (o el cambio de día) fuerza un recálculo aunque no haya
+    vencido el TTL.
+    """
+
+    def __init__(self, ttl=10):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, session, top_n=TOP_N):
+        hoy = date.today()
+        versions = get_versions(session, DASHBOARD_TABLES)
+        key = (hoy, top_n, tuple(sorted(versions.items())))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(top_n)
+            if entry is not None and entry[0] == key and now - entry[1] < self.ttl:
+                return entry[2]
+        data = compute_dashboard(session, hoy, top_n)
+        with self._lock:
+            self._entries[top_n] = (key, now, data)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,78 @@
+# data_versions.py
+
+"""Contadores de cambios por tabla.
+
+Cada vez que una sesión escribe filas de una tabla, su contador en
+`table_versions` se incrementa dentro de la misma transacción. Los cachés
+(por ejemplo, el de informes) usan estos contadores como parte de su clave:
+si ninguna de las tablas involucradas cambió, el resultado guardado sigue
+siendo válido.
+
+Los contadores arrancan en un valor basado en el reloj (microsegundos), así
+que después de un reset nunca repiten un valor usado antes.
+"""
+
+import time
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from database import TableVersion, db
+
+_TABLE = TableVersion.__table__
+
+
+def _initial_version():
+    return int(time.time() * 1_000_000)
+
+
+def bump_versions(connection, tables):
+    """Incrementa el contador de cada tabla de `tables` usando `connection`
+    (para escrituras que no pasan por el ORM, como las cargas masivas)."""
+    for table in sorted(set(tables)):
+        result = connection.execute(
+            _TABLE.update().where(_TABLE.c.table_name == table)
+            .values(version=_TABLE.c.version + 1))
+        if result.rowcount == 0:
+            connection.execute(_TABLE.insert().values(table_name=table, version=_initial_version()))
+
+
+def get_versions(session, tables):
+    """Devuelve {tabla: versión} para `tables` (0 si la tabla no tiene contador)."""
+    tables = sorted(set(tables))
+    rows = session.execute(
+        select(_TABLE.c.table_name, _TABLE.c.version).where(_TABLE.c.table_name.in_(tables)))
+    versions = dict.fromkeys(tables, 0)
+    versions.update({name: version for name, version in rows})
+    return versions
+
+
+def ensure_table_versions(session):
+    """Crea los contadores que falten (bases nuevas, reseteadas o anteriores a esta tabla)."""
+    existing = {name for (name,) in session.execute(select(_TABLE.c.table_name))}
+    start = _initial_version()
+    for table in sorted(db.metadata.tables):
+        if table != _TABLE.name and table not in existing:
+            session.execute(_TABLE.insert().values(table_name=table, version=start))
+    session.commit()
+
+
+def _changed_tables(session):
+    tables = set()
+    for obj in session.new:
+        tables.add(obj.__table__.name)
+    for obj in session.deleted:
+        tables.add(obj.__table__.name)
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            tables.add(obj.__table__.name)
+    tables.discard(_TABLE.name)
+    return tables
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_changed_tables(session, flush_context):
+    # En after_flush, new/dirty/deleted todavía reflejan lo que se acaba de escribir.
+    tables = _changed_tables(session)
+    if tables:
+        bump_versions(session.connection(), tables)
@@ -17,7 +17,15 @@ db = SQLAlchemy()
 # El método to_dict() convierte un objeto del modelo a un diccionario
 # para poder enviarlo como JSON a través de la API.
 
-class Chofer(db.Model):
+class SyncMixin:
+    """Columnas de sincronización incremental (ver sync.py): `version` es el valor
+    del contador global en la última escritura de la fila. El índice sobre
+    `version` lo crea la migración 3."""
+    updated_at = db.Column(db.DateTime)
+    version = db.Column(db.BigInteger)
+
+
+class Chofer(SyncMixin, db.Model):
     __tablename__ = 'choferes'
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(255), nullable=False)
@@ -61,7 +69,7 @@ class ViajeEstado(db.Model):
     def to_dict(self):
         return {'id': self.id, 'nombre': self.nombre}
 
-class Camion(db.Model):
+class Camion(SyncMixin, db.Model):
     __tablename__ = 'camiones'
     dominio = db.Column(db.String(20), primary_key=True)
     marca = db.Column(db.String(100))
@@ -70,8 +78,10 @@ class Camion(db.Model):
     color = db.Column(db.String(50))
     tipo = db.Column(db.String(100))
     chasis = db.Column(db.String(100), unique=True)
+    # Clave de la foto en el almacén de fotos (`<sha256>.<ext>`, ver photos.py),
+    # no la imagen en sí.
     foto = db.Column(db.Text)
-    estado = db.Column(db.String(50), nullable=False)
+    estado = db.Column(db.String(50), nullable=False, index=True)
 
     def to_dict(self):
         return {
@@ -80,7 +90,7 @@ class Camion(db.Model):
             'chasis': self.chasis, 'foto': self.foto, 'estado': self.estado
         }
 
-class Acoplado(db.Model):
+class Acoplado(SyncMixin, db.Model):
     __tablename__ = 'acoplados'
     dominio = db.Column(db.String(20), primary_key=True)
     marca = db.Column(db.String(100))
@@ -98,7 +108,7 @@ class Acoplado(db.Model):
             'chasis': self.chasis, 'estado': self.estado
         }
 
-class Viaje(db.Model):
+class Viaje(SyncMixin, db.Model):
     __tablename__ = 'viajes'
     id = db.Column(db.Integer, primary_key=True)
     origen = db.Column(db.String(255), nullable=False)
@@ -144,14 +154,14 @@ class Viaje(db.Model):
             'acopladoDominio': self.acoplado_dominio, 'estado': self.estado
         }
 
-class Poliza(db.Model):
+class Poliza(SyncMixin, db.Model):
     __tablename__ = 'polizas'
     id = db.Column(db.Integer, primary_key=True)
     aseguradora = db.Column(db.String(255), nullable=False)
     asegurado = db.Column(db.String(255))
     vehiculo_dominio = db.Column(db.String(20), nullable=False)
     inicio_vigencia = db.Column(db.Date)
-    fin_vigencia = db.Column(db.Date)
+    fin_vigencia = db.Column(db.Date, index=True)
 
     @property
     def vehiculoDominio(self): return self.vehiculo_dominio
@@ -183,14 +193,14 @@ class Currency(db.Model):
     def to_dict(self):
         return {'code': self.code, 'name': self.name}
 
-class TipoDeGasto(db.Model):
+class TipoDeGasto(SyncMixin, db.Model):
     __tablename__ = 'tipos_de_gasto'
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(100), nullable=False, unique=True)
     def to_dict(self):
         return {'id': self.id, 'nombre': self.nombre}
 
-class Gasto(db.Model):
+class Gasto(SyncMixin, db.Model):
     __tablename__ = 'gastos'
     id = db.Column(db.Integer, primary_key=True)
     monto = db.Column(db.Float, nullable=False)
@@ -229,6 +239,102 @@ class Gasto(db.Model):
             'moneda': self.moneda,
         }
 
+class TipoDeCambio(db.Model):
+    """Cotización de una moneda en una fecha, expresada en la moneda base
+    (ver exchange.py): 1 `moneda` = `tasa` unidades de la moneda base."""
+    __tablename__ = 'tipos_de_cambio'
+    id = db.Column(db.Integer, primary_key=True)
+    moneda = db.Column(db.String(3), db.ForeignKey('currencies.code'), nullable=False)
+    fecha = db.Column(db.Date, nullable=False)
+    tasa = db.Column(db.Float, nullable=False)
+    __table_args__ = (db.UniqueConstraint('moneda', 'fecha', name='uq_tipos_de_cambio_moneda_fecha'),)
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'moneda': self.moneda,
+            'fecha': self.fecha.isoformat() if self.fecha else None,
+            'tasa': self.tasa,
+        }
+
+class GastoPorViaje(db.Model):
+    """Totales de gastos por viaje y moneda (ver rollups.py)."""
+    __tablename__ = 'gastos_por_viaje'
+    viaje_id = db.Column(db.Integer, primary_key=True)
+    moneda = db.Column(db.String(3), primary_key=True)
+    cantidad = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Float, nullable=False)
+
+
+class GastoPorDia(db.Model):
+    """Totales de gastos por día, tipo y moneda (ver rollups.py); `dia` es NULL
+    para los gastos sin fecha."""
+    __tablename__ = 'gastos_por_dia'
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date)
+    tipo_id = db.Column(db.Integer, nullable=False)
+    moneda = db.Column(db.String(3), nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Float, nullable=False)
+    __table_args__ = (db.Index('ix_gastos_por_dia_clave', 'dia', 'tipo_id', 'moneda', unique=True),)
+
+
+class GastoPorCamionMes(db.Model):
+    """Totales de gastos por camión (el del viaje), mes y moneda (ver rollups.py);
+    `mes` es el primer día del mes, NULL para los gastos sin fecha."""
+    __tablename__ = 'gastos_por_camion_mes'
+    id = db.Column(db.Integer, primary_key=True)
+    camion_dominio = db.Column(db.String(20), nullable=False)
+    mes = db.Column(db.Date)
+    moneda = db.Column(db.String(3), nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Float, nullable=False)
+    __table_args__ = (db.Index('ix_gastos_por_camion_mes_clave', 'camion_dominio', 'mes', 'moneda', unique=True),)
+
+
+class Cobertura(db.Model):
+    """Período continuo cubierto por las pólizas de un vehículo: las pólizas
+    superpuestas o contiguas se unen en un solo período (ver coberturas.py).
+    Sin inicio o sin fin de vigencia se guardan date.min y date.max."""
+    __tablename__ = 'coberturas'
+    id = db.Column(db.Integer, primary_key=True)
+    vehiculo_dominio = db.Column(db.String(20), nullable=False)
+    inicio = db.Column(db.Date, nullable=False)
+    fin = db.Column(db.Date, nullable=False)
+    polizas = db.Column(db.Integer, nullable=False)
+    __table_args__ = (
+        db.Index('ix_coberturas_vehiculo_inicio', 'vehiculo_dominio', 'inicio', unique=True),
+        db.Index('ix_coberturas_fin', 'fin', 'vehiculo_dominio'),
+    )
+
+
+class TableVersion(db.Model):
+    """Contador de cambios por tabla (ver data_versions.py)."""
+    __tablename__ = 'table_versions'
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False)
+    def to_dict(self):
+        return {'tableName': self.table_name, 'version': self.version}
+
+
+class Tombstone(db.Model):
+    """Registro de filas eliminadas, para que /api/<entidad>?since= informe las bajas."""
+    __tablename__ = 'tombstones'
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(64), nullable=False)
+    row_key = db.Column(db.String(255), nullable=False)
+    version = db.Column(db.BigInteger, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (db.Index('ix_tombstones_table_version', 'table_name', 'version'),)
+
+
+class SyncState(db.Model):
+    """Contador global de cambios (una sola fila). `floor` es la versión más vieja
+    desde la que el historial está completo: un `since` menor requiere recarga total."""
+    __tablename__ = 'sync_state'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False)
+    floor = db.Column(db.BigInteger, nullable=False)
+
 
 def init_db():
     """Populate the database with initial lookup data and a few sample records.
@@ -254,6 +360,9 @@ def init_db():
         for nombre in ['Combustible', 'Peaje', 'Mantenimiento']:
             db.session.add(TipoDeGasto(nombre=nombre))
 
+    if TipoDeCambio.query.count() == 0:
+        db.session.add(TipoDeCambio(moneda='USD', fecha=date.today() - timedelta(days=30), tasa=7300.0))
+
     db.session.commit()
 
     # --- Sample domain data ---
@@ -0,0 +1,157 @@
+# events.py
+
+"""Notificaciones de cambios por Server-Sent Events (`/api/events`).
+
+Cada commit que escribe entidades sincronizadas (ver sync.py) se publica
+como un evento por versión:
+
+    id: <versión>
+    event: change
+    data: {"version": <versión>, "changes": [{"entity": "viajes", "key": 3, "op": "update"}]}
+
+El reparto es en memoria, dentro del proceso: cada cliente tiene una cola
+acotada y, si no la vacía a tiempo (cliente lento o pestaña congelada), se
+lo desconecta en lugar de acumular memoria o frenar a los demás. El navegador
+reconecta solo enviando `Last-Event-ID`, y los eventos que se perdió se
+reenvían desde un buffer circular con los últimos publicados. Si lo pedido
+ya no está en el buffer se envía un evento `reset`; el cliente se pone al día
+con `?since=<Last-Event-ID>` en los listados.
+"""
+
+import json
+import queue
+import threading
+from collections import deque
+
+HEARTBEAT_SECONDS = 15
+# Reintento sugerido al navegador tras una desconexión (milisegundos)
+RETRY_MS = 3000
+
+
+class TooManySubscribers(Exception):
+    """Se alcanzó el máximo de clientes conectados."""
+
+
+def _format_event(event_id, event_type, data):
+    payload = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {event_type}', f'data: {payload}']
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+class _Subscriber:
+    def __init__(self, queue_size, backlog):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.backlog = backlog
+        self.dropped = False
+
+
+class ChangeBroadcaster:
+    """Reparte los cambios confirmados entre los clientes conectados.
+
+    `queue_size` es la cantidad de eventos pendientes que se tolera por
+    cliente, `history` la cantidad de eventos que se guardan para reanudar y
+    `max_subscribers` el máximo de conexiones abiertas.
+    """
+
+    def __init__(self, queue_size=256, history=1024, max_subscribers=500,
+                 heartbeat=HEARTBEAT_SECONDS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.heartbeat = heartbeat
+        self._history = deque(maxlen=history)
+        # Versión desde la cual el buffer tiene todos los eventos (None: todavía sin fijar)
+        self._floor = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def publish(self, changes):
+        """Publica los cambios de un commit (lista de dicts de sync.on_commit)."""
+        by_version = {}
+        for change in changes:
+            by_version.setdefault(change['version'], []).append(
+                {'entity': change['entity'], 'key': change['key'], 'op': change['op']})
+        with self._lock:
+            for version, items in by_version.items():
+                message = _format_event(version, 'change', {'version': version, 'changes': items})
+                if len(self._history) == self._history.maxlen:
+                    self._floor = self._history[0][0]
+                self._history.append((version, message))
+                for subscriber in list(self._subscribers):
+                    try:
+                        subscriber.queue.put_nowait(message)
+                    except queue.Full:
+                        # Cliente lento: se lo desconecta; al reconectar retoma desde el buffer.
+                        subscriber.dropped = True
+                        self._subscribers.discard(subscriber)
+
+    def subscribe(self, last_event_id, current_version):
+        """Registra un cliente. `current_version` es la versión actual de la base,
+        usada como punto de partida del buffer la primera vez."""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers('Demasiados clientes conectados')
+            if self._floor is None:
+                self._floor = current_version
+                if self._history:
+                    self._floor = min(self._floor, self._history[0][0] - 1)
+            backlog = []
+            if last_event_id is not None:
+                if last_event_id < self._floor:
+                    backlog.append(_format_event(None, 'reset', {'since': last_event_id,
+                                                                 'version': current_version}))
+                else:
+                    backlog.extend(message for version, message in self._history
+                                   if version > last_event_id)
+            subscriber = _Subscriber(self.queue_size, backlog)
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def stream(self, subscriber):
+        """Genera el cuerpo text/event-stream para un cliente suscripto."""
+        try:
+            yield f'retry: {RETRY_MS}\n\n'.encode('ascii')
+            for message in subscriber.backlog:
+                yield message
+            subscriber.backlog = None
+            while not subscriber.dropped:
+                try:
+                    message = subscriber.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    # Comentario SSE: mantiene viva la conexión y detecta clientes caídos.
+                    yield b': ping\n\n'
+                    continue
+                if subscriber.dropped:
+                    break
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
+
+    def reset(self):
+        """Descarta el historial y avisa a los clientes que deben recargar
+        (por ejemplo, después de /api/reset)."""
+        message = _format_event(None, 'reset', {'since': None, 'version': None})
+        with self._lock:
+            self._history.clear()
+            self._floor = None
+            for subscriber in list(self._subscribers):
+                try:
+                    subscriber.queue.put_nowait(message)
+                except queue.Full:
+                    subscriber.dropped = True
+                    self._subscribers.discard(subscriber)
+
+    def close(self):
+        """Desconecta a todos los clientes."""
+        with self._lock:
+            for subscriber in self._subscribers:
+                subscriber.dropped = True
+            self._subscribers.clear()
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
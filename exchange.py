@@ -0,0 +1,161 @@
+# exchange.py
+
+"""Conversión de montos entre monedas con la tabla `tipos_de_cambio`.
+
+Cada cotización dice cuántas unidades de la moneda base (BASE_CURRENCY) vale
+una unidad de `moneda` a partir de `fecha`. Un monto se convierte con la
+cotización vigente en su fecha (la última cargada en esa fecha o antes); los
+montos sin fecha usan la última cotización disponible. Si la moneda no tiene
+ninguna cotización hasta esa fecha, el resultado es NaN y el llamador decide
+cómo informarlo (los totales cuentan esas filas como "sin cotización").
+
+La conversión trabaja sobre arrays de numpy, sin consultas ni bucles por fila.
+Al cargar las cotizaciones se arma, por moneda, un calendario diario con la
+cotización vigente en cada día (desde la primera cotización hasta la última),
+de modo que la cotización de cada fila se obtiene indexando por la cantidad
+de días desde el inicio del calendario.
+Los totales agrupan primero en SQL por moneda y día (la cotización es diaria,
+así que el resultado es exacto) y convierten sólo los grupos.
+"""
+
+import numpy as np
+from sqlalchemy import func, select
+
+from database import Gasto, TipoDeCambio
+
+BASE_CURRENCY = 'PYG'
+# Límite del calendario diario por moneda; con más días se usa búsqueda binaria.
+MAX_CALENDAR_DAYS = 100_000
+
+
+class ExchangeRateError(ValueError):
+    """Moneda de reporte desconocida o sin cotizaciones."""
+
+
+def as_dates(values):
+    """Convierte fechas (date, datetime, 'YYYY-MM-DD' o None) a datetime64[D]; None -> NaT."""
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'M':
+        return values.astype('datetime64[D]')
+    return np.array([v.isoformat()[:10] if hasattr(v, 'isoformat') else v for v in values],
+                    dtype='datetime64[D]')
+
+
+class ExchangeRates:
+    """Cotizaciones de todas las monedas, ordenadas por fecha."""
+
+    def __init__(self, rows, base=BASE_CURRENCY):
+        """`rows`: (moneda, fecha, tasa) ordenadas por moneda y fecha."""
+        self.base = base
+        grouped = {}
+        for moneda, fecha, tasa in rows:
+            fechas, tasas = grouped.setdefault(moneda, ([], []))
+            fechas.append(fecha)
+            tasas.append(tasa)
+        grouped.pop(base, None)
+        self._series = {moneda: self._build_series(as_dates(fechas), np.asarray(tasas, dtype=np.float64))
+                        for moneda, (fechas, tasas) in grouped.items()}
+
+    @staticmethod
+    def _build_series(dates, rates):
+        """(fechas, tasas, calendario): el calendario tiene la cotización vigente en
+        cada día desde la primera fecha, o es None si el rango es demasiado largo."""
+        span = int((dates[-1] - dates[0]).astype(np.int64)) + 1
+        calendar = None
+        if span <= MAX_CALENDAR_DAYS:
+            days = dates[0] + np.arange(span)
+            calendar = rates[np.searchsorted(dates, days, side='right') - 1]
+        return dates, rates, calendar
+
+    @classmethod
+    def load(cls, session, base=BASE_CURRENCY):
+        rows = session.execute(select(TipoDeCambio.moneda, TipoDeCambio.fecha, TipoDeCambio.tasa)
+                               .order_by(TipoDeCambio.moneda, TipoDeCambio.fecha))
+        return cls(rows, base)
+
+    def currencies(self):
+        return {self.base, *self._series}
+
+    def date_range(self):
+        """(primera, última) fecha con alguna cotización, o None si no hay cotizaciones."""
+        if not self._series:
+            return None
+        return (min(dates[0] for dates, _, _ in self._series.values()),
+                max(dates[-1] for dates, _, _ in self._series.values()))
+
+    def check_currency(self, moneda):
+        if moneda not in self.currencies():
+            raise ExchangeRateError(f'No hay cotizaciones cargadas para la moneda {moneda}')
+
+    def rates_at(self, moneda, fechas):
+        """Cotización de `moneda` vigente en cada fecha de `fechas` (datetime64[D])."""
+        if moneda == self.base:
+            return np.ones(len(fechas))
+        series = self._series.get(moneda)
+        if series is None:
+            return np.full(len(fechas), np.nan)
+        dates, rates, calendar = series
+        if calendar is None:
+            index = np.searchsorted(dates, fechas, side='right') - 1
+            result = rates[np.maximum(index, 0)]
+        else:
+            index = (fechas - dates[0]).astype(np.int64)
+            result = calendar[np.clip(index, 0, len(calendar) - 1)]
+        result[index < 0] = np.nan
+        # Sin fecha: la última cotización.
+        result[np.isnat(fechas)] = rates[-1]
+        return result
+
+    def to_base(self, montos, monedas, fechas):
+        montos = np.asarray(montos, dtype=np.float64)
+        monedas = np.asarray(monedas)
+        fechas = as_dates(fechas)
+        # Una máscara por moneda con cotizaciones (son pocas); las demás quedan en NaN.
+        result = np.full(len(montos), np.nan)
+        for code in self.currencies():
+            mask = monedas == code
+            result[mask] = montos[mask] * self.rates_at(code, fechas[mask])
+        return result
+
+    def convert(self, montos, monedas, fechas, target):
+        """Convierte cada monto (en su moneda) a `target`, con la cotización de su fecha."""
+        fechas = as_dates(fechas)
+        result = self.to_base(montos, monedas, fechas)
+        if target != self.base:
+            result /= self.rates_at(target, fechas)
+        return result
+
+
+def gasto_totals(session, query, target, rates=None):
+    """Totales de los gastos de `query` (filtrada por el llamador) por moneda y
+    consolidados en `target`."""
+    if rates is None:
+        rates = ExchangeRates.load(session)
+    rates.check_currency(target)
+    groups = query.with_entities(
+        Gasto.moneda, func.date(Gasto.fecha), func.count(Gasto.id), func.sum(Gasto.monto),
+    ).group_by(Gasto.moneda, func.date(Gasto.fecha)).order_by(None).all()
+    if not groups:
+        return {'monedaReporte': target, 'cantidad': 0, 'total': 0.0, 'sinCotizacion': 0, 'porMoneda': []}
+    monedas, fechas, cantidades, montos = zip(*groups)
+    cantidades = np.asarray(cantidades)
+    montos = np.asarray(montos, dtype=np.float64)
+    convertidos = rates.convert(montos, monedas, fechas, target)
+    sin_cotizacion = np.isnan(convertidos)
+    por_moneda = []
+    monedas = np.asarray(monedas)
+    for code in sorted(set(monedas)):
+        mask = monedas == code
+        por_moneda.append({
+            'moneda': code,
+            'cantidad': int(cantidades[mask].sum()),
+            'total': float(montos[mask].sum()),
+            'totalConvertido': float(np.nansum(convertidos[mask])),
+            'sinCotizacion': int(cantidades[mask & sin_cotizacion].sum()),
+        })
+    return {
+        'monedaReporte': target,
+        'cantidad': int(cantidades.sum()),
+        'total': float(np.nansum(convertidos)),
+        'sinCotizacion': int(cantidades[sin_cotizacion].sum()),
+        'porMoneda': por_moneda,
+    }
@@ -2,9 +2,9 @@
  * @license
  * SPDX-License-Identifier: Apache-2.0
 */
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { createRoot } from 'react-dom/client';
-import { fetchData, addItem, updateItem, deleteItem } from './api.tsx';
+import { fetchData, addItem, updateItem, deleteItem, photoUrl, EVENTS_URL } from './api.tsx';
 
 // --- SVG Icons ---
 const Icon = ({ path, className = "h-6 w-6" }) => (
@@ -79,33 +79,62 @@ const App = () => {
         'gastos': setGastos,
     };
 
+    // Versión de sincronización de cada listado: después de una escritura sólo
+    // se piden los cambios desde esa versión (?since=) y se combinan con el estado.
+    const syncVersions = useRef({});
+    const endpointKeys = { camiones: 'dominio', acoplados: 'dominio' };
+
+    const mergeChanges = (current, changes, key) => {
+        if (changes.reset) return changes.items;
+        const removed = new Set(changes.deleted);
+        const changed = new Map(changes.items.map(item => [item[key], item]));
+        const kept = current.filter(item => !removed.has(item[key]));
+        const present = new Set(kept.map(item => item[key]));
+        const added = changes.items.filter(item => !present.has(item[key]));
+        return [...added, ...kept.map(item => changed.get(item[key]) ?? item)];
+    };
+
+    const refreshEndpoint = async (endpoint: string) => {
+        const setter = endpointToSetterMap[endpoint];
+        if (!setter) return;
+        const since = syncVersions.current[endpoint] ?? 0;
+        const changes = await fetchData(`${endpoint}?since=${since}`);
+        syncVersions.current[endpoint] = changes.version;
+        setter(prev => mergeChanges(prev, changes, endpointKeys[endpoint] ?? 'id'));
+    };
+
+    // Páginas restantes de un listado de la carga inicial (en segundo plano).
+    const loadRemainingPages = async (endpoint: string, cursor: string) => {
+        const setter = endpointToSetterMap[endpoint];
+        const key = endpointKeys[endpoint] ?? 'id';
+        while (cursor) {
+            const page = await fetchData(`${endpoint}?limit=1000&cursor=${encodeURIComponent(cursor)}`);
+            // Las filas que ya llegaron por ?since= se conservan.
+            setter(prev => {
+                const present = new Set(prev.map(item => item[key]));
+                return [...prev, ...page.items.filter(item => !present.has(item[key]))];
+            });
+            cursor = page.nextCursor;
+        }
+    };
+
+    // Una sola petición trae los datos de referencia y la primera página de cada listado.
     const loadAllData = async () => {
         try {
-            const [
-                choferesData, camionesData, acopladosData, viajesData, polizasData,
-                tiposDeGastoData, gastosData, currenciesData, vehiculoEstadosData, viajeEstadosData
-            ] = await Promise.all([
-                fetchData('choferes'),
-                fetchData('camiones'),
-                fetchData('acoplados'),
-                fetchData('viajes'),
-                fetchData('polizas'),
-                fetchData('tiposDeGasto'),
-                fetchData('gastos'),
-                fetchData('currencies'),
-                fetchData('vehiculoEstados'),
-                fetchData('viajeEstados'),
-            ]);
-            setChoferes(choferesData);
-            setCamiones(camionesData);
-            setAcoplados(acopladosData);
-            setViajes(viajesData);
-            setPolizas(polizasData);
-            setTiposDeGasto(tiposDeGastoData);
-            setGastos(gastosData);
-            setCurrencies(currenciesData);
-            setVehiculoEstados(vehiculoEstadosData);
-            setViajeEstados(viajeEstadosData);
+            const data = await fetchData('bootstrap?limit=1000');
+            setCurrencies(data.currencies);
+            setVehiculoEstados(data.vehiculoEstados);
+            setViajeEstados(data.viajeEstados);
+            setTiposDeGasto(data.tiposDeGasto);
+            syncVersions.current.tiposDeGasto = data.version;
+            ['choferes', 'camiones', 'acoplados', 'viajes', 'polizas', 'gastos'].forEach(endpoint => {
+                syncVersions.current[endpoint] = data.version;
+                endpointToSetterMap[endpoint](data[endpoint].items);
+                if (data[endpoint].nextCursor) {
+                    loadRemainingPages(endpoint, data[endpoint].nextCursor)
+                        .catch(error => console.error(`Error loading ${endpoint}:`, error));
+                }
+            });
         } catch (error) {
             console.error("Error loading all data:", error);
         }
@@ -115,14 +144,23 @@ const App = () => {
         loadAllData();
     }, []);
 
+    // Cambios hechos desde otras pantallas: se piden sólo los listados afectados.
+    useEffect(() => {
+        const source = new EventSource(EVENTS_URL);
+        source.addEventListener('change', (event: MessageEvent) => {
+            const { changes } = JSON.parse(event.data);
+            new Set(changes.map(change => change.entity)).forEach((endpoint: string) => refreshEndpoint(endpoint));
+        });
+        source.addEventListener('reset', () => {
+            Object.keys(endpointToSetterMap).forEach(endpoint => refreshEndpoint(endpoint));
+        });
+        return () => source.close();
+    }, []);
+
     const handleAdd = (endpoint: string, refetchEndpoint: string) => async (newItem: any) => {
         try {
             await addItem(endpoint, newItem);
-            const data = await fetchData(refetchEndpoint);
-            const setter = endpointToSetterMap[refetchEndpoint];
-            if (setter) {
-                setter(data);
-            }
+            await refreshEndpoint(refetchEndpoint);
         } catch (error) {
             console.error(`Error adding item to ${endpoint}:`, error);
         }
@@ -131,12 +169,7 @@ const App = () => {
     const handleUpdate = (endpoint: string, idKey = 'id') => async (updatedItem: any) => {
         try {
             await updateItem(endpoint, updatedItem[idKey], updatedItem);
-            const refetchEndpoint = endpoint.split('/')[0];
-            const data = await fetchData(refetchEndpoint);
-            const setter = endpointToSetterMap[refetchEndpoint];
-            if (setter) {
-                setter(data);
-            }
+            await refreshEndpoint(endpoint.split('/')[0]);
         } catch (error) {
             console.error(`Error updating item at ${endpoint}:`, error);
         }
@@ -145,11 +178,7 @@ const App = () => {
     const handleDelete = (endpoint: string, refetchEndpoint: string) => async (id: string | number) => {
         try {
             await deleteItem(endpoint, id);
-            const data = await fetchData(refetchEndpoint);
-            const setter = endpointToSetterMap[refetchEndpoint];
-            if (setter) {
-                setter(data);
-            }
+            await refreshEndpoint(refetchEndpoint);
         } catch (error) {
             console.error(`Error deleting item from ${endpoint}:`, error);
         }
@@ -254,30 +283,27 @@ const Sidebar = ({ setActiveView, activeView }) => {
 };
 
 const Dashboard = ({ viajes, choferes, camiones, polizas }) => {
-    const viajesActivos = viajes.filter(v => v.estado === 'En Curso');
-    const choferesEnViajeIds = new Set(viajesActivos.map(v => v.choferId));
-    const choferesDisponibles = choferes.length - choferesEnViajeIds.size;
+    // Los indicadores se calculan en el servidor; sólo se reciben los conteos
+    // y las primeras filas de cada alerta.
+    const [resumen, setResumen] = useState(null);
 
-    const hoy = new Date();
-    hoy.setHours(0, 0, 0, 0);
+    useEffect(() => {
+        fetchData('dashboard').then(setResumen).catch(() => setResumen(null));
+    }, [viajes, choferes, camiones, polizas]);
 
-    const polizasVencidas = polizas.filter(p => new Date(p.finVigencia) < hoy);
-    
-    const polizasPorVencer = polizas.filter(p => {
-        const fin = new Date(p.finVigencia);
-        fin.setHours(0,0,0,0);
-        const diffTime = fin.getTime() - hoy.getTime();
-        const diffDays = Math.ceil(diffTime / (1000 * 60 * 60 * 24));
-        return diffDays >= 0 && diffDays <= 30;
-    });
-    
-    const camionesEnMantenimiento = camiones.filter(c => c.estado === 'En Mantenimiento');
+    const viajesActivos = resumen ? resumen.viajesActivos : 0;
+    const choferesDisponibles = resumen ? resumen.choferesDisponibles : 0;
+    const top = resumen ? resumen.top : { polizasVencidas: [], polizasPorVencer: [], camionesEnMantenimiento: [] };
+    const totalAlertas = resumen ? resumen.alertas : 0;
 
     const alertas = [
-        ...polizasVencidas.map(p => ({ type: 'error', message: `Póliza vencida para ${p.vehiculoDominio} el ${new Date(p.finVigencia).toLocaleDateString()}.` })),
-        ...polizasPorVencer.map(p => ({ type: 'warning', message: `Póliza para ${p.vehiculoDominio} vence el ${new Date(p.finVigencia).toLocaleDateString()}.` })),
-        ...camionesEnMantenimiento.map(c => ({ type: 'info', message: `Camión ${c.dominio} (${c.modelo}) está en mantenimiento.` })),
+        ...top.polizasVencidas.map(p => ({ type: 'error', message: `Póliza vencida para ${p.vehiculoDominio} el ${new Date(p.finVigencia).toLocaleDateString()}.` })),
+        ...top.polizasPorVencer.map(p => ({ type: 'warning', message: `Póliza para ${p.vehiculoDominio} vence el ${new Date(p.finVigencia).toLocaleDateString()}.` })),
+        ...top.camionesEnMantenimiento.map(c => ({ type: 'info', message: `Camión ${c.dominio} (${c.modelo}) está en mantenimiento.` })),
     ];
+    if (totalAlertas > alertas.length) {
+        alertas.push({ type: 'info', message: `Y ${totalAlertas - alertas.length} alertas más.` });
+    }
     
     const alertConfig = {
         error:   { icon: '🚨', styles: { container: 'border-red-500 bg-red-50', text: 'text-red-800' } },
@@ -291,7 +317,7 @@ const Dashboard = ({ viajes, choferes, camiones, polizas }) => {
             <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
                 <div className="bg-white p-6 rounded-xl shadow-sm">
                     <h3 className="font-bold text-lg text-slate-600">Viajes Activos</h3>
-                    <p className="text-5xl font-bold text-indigo-600 mt-2">{viajesActivos.length}</p>
+                    <p className="text-5xl font-bold text-indigo-600 mt-2">{viajesActivos}</p>
                 </div>
                 <div className="bg-white p-6 rounded-xl shadow-sm">
                     <h3 className="font-bold text-lg text-slate-600">Choferes Disponibles</h3>
@@ -299,7 +325,7 @@ const Dashboard = ({ viajes, choferes, camiones, polizas }) => {
                 </div>
                 <div className="bg-white p-6 rounded-xl shadow-sm">
                     <h3 className="font-bold text-lg text-slate-600">Alertas Críticas</h3>
-                    <p className={`text-5xl font-bold mt-2 ${alertas.length > 0 ? 'text-red-600' : 'text-slate-600'}`}>{alertas.length}</p>
+                    <p className={`text-5xl font-bold mt-2 ${totalAlertas > 0 ? 'text-red-600' : 'text-slate-600'}`}>{totalAlertas}</p>
                 </div>
             </div>
             
@@ -570,7 +596,7 @@ const CamionesManager = ({ camiones, estados, onAdd, onUpdate, onDelete }) => {
                             {filteredCamiones.map((camion) => (
                                 <tr key={camion.dominio} className="border-b border-slate-200 hover:bg-slate-50">
                                     <td className="p-4">
-                                        {camion.foto ? <img src={camion.foto} alt={`Foto de ${camion.dominio}`} className="h-12 w-16 object-cover rounded-md" /> : <div className="h-12 w-16 bg-slate-200 rounded-md flex items-center justify-center text-slate-400"><NoImageIcon /></div>}
+                                        {camion.foto ? <img src={photoUrl(camion.foto, true)} alt={`Foto de ${camion.dominio}`} className="h-12 w-16 object-cover rounded-md" /> : <div className="h-12 w-16 bg-slate-200 rounded-md flex items-center justify-center text-slate-400"><NoImageIcon /></div>}
                                     </td>
                                     <td className="p-4 font-mono">{camion.dominio}</td>
                                     <td className="p-4"><div className="font-medium">{camion.marca}</div><div className="text-sm text-slate-500">{camion.modelo}</div></td>
@@ -596,9 +622,9 @@ const CamionesManager = ({ camiones, estados, onAdd, onUpdate, onDelete }) => {
 
 const EditTruckModal = ({ truck, estados, onClose, onSave }) => {
     const [formData, setFormData] = useState(truck);
-    const [photoPreview, setPhotoPreview] = useState(truck.foto);
+    const [photoPreview, setPhotoPreview] = useState(photoUrl(truck.foto));
 
-    useEffect(() => { setFormData(truck); setPhotoPreview(truck.foto); }, [truck]);
+    useEffect(() => { setFormData(truck); setPhotoPreview(photoUrl(truck.foto)); }, [truck]);
 
     const handleChange = (e) => setFormData(prev => ({ ...prev, [e.target.name]: e.target.value }));
 
@@ -648,7 +674,7 @@ const EditTruckModal = ({ truck, estados, onClose, onSave }) => {
 
 const PhotoViewModal = ({ truck, onClose, onSave }) => {
     const [newPhoto, setNewPhoto] = useState(null);
-    const [photoPreview, setPhotoPreview] = useState(truck.foto);
+    const [photoPreview, setPhotoPreview] = useState(photoUrl(truck.foto));
 
     const handlePhotoChange = (e) => {
         const file = e.target.files[0];
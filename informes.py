@@ -0,0 +1,398 @@
+# informes.py
+
+"""Generación de los informes Excel.
+
+Cada informe lee sus filas en lotes (`yield_per`) y las escribe directamente
+en un libro de openpyxl en modo write-only, calculando los totales del
+resumen al pasar. Así la memoria usada no depende de la cantidad de filas:
+nunca se arma una lista, un DataFrame ni el libro completo en memoria.
+
+Los constructores reciben una sesión de SQLAlchemy y un archivo de salida,
+por lo que pueden usarse tanto desde un request como desde un proceso aparte.
+"""
+
+import math
+import tempfile
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from dateutil.parser import parse as parse_date
+from openpyxl import Workbook
+
+from database import Acoplado, Camion, Chofer, Gasto, Viaje
+from exchange import BASE_CURRENCY, ExchangeRateError, ExchangeRates
+from lookups import lookup_cache
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Filas leídas de la base por lote
+FETCH_BATCH_SIZE = 2000
+# Tamaño hasta el cual el archivo generado se mantiene en memoria antes de pasar a disco
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+class ReportError(Exception):
+    """Error al generar un informe; `status` es el código HTTP a devolver."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _fmt_datetime(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
+
+
+@contextmanager
+def _write_only_workbook(fileobj):
+    """Libro write-only que se guarda en `fileobj` al salir del bloque.
+
+    Si el bloque falla (o el informe resulta vacío) se cierran las hojas para
+    liberar sus archivos temporales y no se escribe nada.
+    """
+    wb = Workbook(write_only=True)
+    try:
+        yield wb
+    except BaseException:
+        for ws in wb.worksheets:
+            try:
+                ws.close()
+            except Exception:
+                pass
+        raise
+    wb.save(fileobj)
+
+
+def _report_progress(progress, count):
+    if progress is not None and count % FETCH_BATCH_SIZE == 0:
+        progress(count)
+
+
+def _load_rates(session, moneda_reporte):
+    rates = ExchangeRates.load(session)
+    try:
+        rates.check_currency(moneda_reporte)
+    except ExchangeRateError as e:
+        raise ReportError(str(e))
+    return rates
+
+
+def _with_converted(rows, rates, target):
+    """Agrega a cada fila de gastos (id, monto, fecha, descripción, moneda, ...)
+    su monto en `target`, convirtiendo por lotes; NaN si no hay cotización."""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, FETCH_BATCH_SIZE))
+        if not batch:
+            return
+        convertidos = rates.convert([row[1] for row in batch], [row[4] for row in batch],
+                                    [row[2] for row in batch], target)
+        yield from zip(batch, convertidos.tolist())
+
+
+def _fmt_convertido(value):
+    return None if math.isnan(value) else round(value, 2)
+
+
+# --- Viajes ---
+
+VIAJES_HEADERS = [
+    'ID Viaje', 'Origen', 'Destino', 'Fecha Inicio', 'Fecha Fin',
+    'Chofer Nombre', 'Chofer Apellido', 'Chofer Nacionalidad', 'Chofer Identificación',
+    'Chofer ID Laboral', 'Chofer Teléfono', 'Chofer Email',
+    'Camión Dominio', 'Camión Marca', 'Camión Modelo', 'Camión Año', 'Camión Color',
+    'Camión Tipo', 'Camión Chasis',
+    'Acoplado Dominio', 'Acoplado Marca', 'Acoplado Modelo', 'Acoplado Año',
+    'Acoplado Color', 'Acoplado Tipo', 'Acoplado Chasis',
+]
+
+
+def viajes_report_query(session):
+    return session.query(
+        Viaje.id, Viaje.origen, Viaje.destino, Viaje.fecha_inicio, Viaje.fecha_fin,
+        Chofer.nombre, Chofer.apellido, Chofer.nacionalidad, Chofer.identificacion,
+        Chofer.identificacion_laboral, Chofer.telefono, Chofer.email,
+        Camion.dominio, Camion.marca, Camion.modelo, Camion.año, Camion.color,
+        Camion.tipo, Camion.chasis,
+        Acoplado.dominio, Acoplado.marca, Acoplado.modelo, Acoplado.año,
+        Acoplado.color, Acoplado.tipo, Acoplado.chasis,
+    ).outerjoin(Chofer, Viaje.chofer_id == Chofer.id
+    ).outerjoin(Camion, Viaje.camion_dominio == Camion.dominio
+    ).outerjoin(Acoplado, Viaje.acoplado_dominio == Acoplado.dominio
+    ).order_by(Viaje.fecha_inicio.asc())
+
+
+def write_viajes_report(session, fileobj, progress=None):
+    """Informe de viajes con los datos de chofer, camión y acoplado asociados."""
+    query = viajes_report_query(session).yield_per(FETCH_BATCH_SIZE)
+
+    with _write_only_workbook(fileobj) as wb:
+        ws = wb.create_sheet('Viajes')
+        ws.append(VIAJES_HEADERS)
+        total = con_chofer = con_camion = con_acoplado = completos = 0
+        for row in query:
+            (viaje_id, origen, destino, fecha_inicio, fecha_fin, *datos) = row
+            ws.append([viaje_id, origen, destino, _fmt_datetime(fecha_inicio), _fmt_datetime(fecha_fin)]
+                      + [value or '' for value in datos])
+            tiene_chofer, tiene_camion, tiene_acoplado = bool(datos[0]), bool(datos[7]), bool(datos[14])
+            total += 1
+            con_chofer += tiene_chofer
+            con_camion += tiene_camion
+            con_acoplado += tiene_acoplado
+            completos += tiene_chofer and tiene_camion and tiene_acoplado
+            _report_progress(progress, total)
+
+        if total == 0:
+            raise ReportError('No se encontraron viajes para generar el informe', 404)
+
+        resumen = wb.create_sheet('Resumen')
+        resumen.append(['Concepto', 'Cantidad'])
+        resumen.append(['Total Viajes', total])
+        resumen.append(['Viajes con Chofer Asignado', con_chofer])
+        resumen.append(['Viajes con Camión Asignado', con_camion])
+        resumen.append(['Viajes con Acoplado Asignado', con_acoplado])
+        resumen.append(['Viajes (con todos los datos)', completos])
+    return total
+
+
+# --- Gastos de un viaje ---
+
+GASTOS_VIAJE_HEADERS = [
+    'ID Gasto', 'Fecha', 'Tipo de Gasto', 'Descripción', 'Monto', 'Moneda',
+    'Viaje - Origen', 'Viaje - Destino', 'Chofer', 'Camión', 'Acoplado',
+]
+
+
+def gastos_viaje_report_query(session, viaje_id):
+    return session.query(
+        Gasto.id, Gasto.monto, Gasto.fecha, Gasto.descripcion, Gasto.moneda,
+        Gasto.tipo_id, Viaje.origen, Viaje.destino,
+        Chofer.nombre, Chofer.apellido,
+        Camion.dominio, Camion.marca, Camion.modelo,
+        Acoplado.dominio, Acoplado.marca, Acoplado.modelo,
+    ).join(Viaje, Gasto.viaje_id == Viaje.id
+    ).outerjoin(Chofer, Viaje.chofer_id == Chofer.id
+    ).outerjoin(Camion, Viaje.camion_dominio == Camion.dominio
+    ).outerjoin(Acoplado, Viaje.acoplado_dominio == Acoplado.dominio
+    ).filter(Gasto.viaje_id == viaje_id)
+
+
+def write_gastos_viaje_report(session, fileobj, viaje_id, moneda_reporte=BASE_CURRENCY, progress=None):
+    """Informe con los gastos de un viaje específico, con totales por moneda y
+    consolidados en `moneda_reporte`."""
+    viaje = session.get(Viaje, viaje_id)
+    if viaje is None:
+        raise ReportError('Viaje no encontrado', 404)
+
+    rates = _load_rates(session, moneda_reporte)
+    query = gastos_viaje_report_query(session, viaje_id).yield_per(FETCH_BATCH_SIZE)
+    tipos = lookup_cache.get(session, max_age=0).tipo_nombres
+
+    with _write_only_workbook(fileobj) as wb:
+        ws = wb.create_sheet('Gastos del Viaje')
+        ws.append([*GASTOS_VIAJE_HEADERS, f'Monto ({moneda_reporte})'])
+        cantidad = sin_cotizacion = 0
+        total = 0.0
+        por_moneda = {}
+        for row, convertido in _with_converted(query, rates, moneda_reporte):
+            (gasto_id, monto, fecha, descripcion, moneda, tipo_id, origen, destino,
+             chofer_nombre, chofer_apellido, camion_dominio, camion_marca, camion_modelo,
+             acoplado_dominio, acoplado_marca, acoplado_modelo) = row
+            tipo = tipos.get(tipo_id)
+            if tipo is None:
+                continue  # como el join anterior: se omiten los gastos de un tipo eliminado
+            ws.append([
+                gasto_id, _fmt_datetime(fecha), tipo, descripcion or '', monto, moneda,
+                origen, destino,
+                f"{chofer_nombre or ''} {chofer_apellido or ''}".strip(),
+                f"{camion_dominio or ''} - {camion_marca or ''} {camion_modelo or ''}".strip(),
+                f"{acoplado_dominio or ''} - {acoplado_marca or ''} {acoplado_modelo or ''}".strip(),
+                _fmt_convertido(convertido),
+            ])
+            cantidad += 1
+            por_moneda[moneda] = por_moneda.get(moneda, 0.0) + monto
+            if math.isnan(convertido):
+                sin_cotizacion += 1
+            else:
+                total += convertido
+            _report_progress(progress, cantidad)
+
+        if cantidad == 0:
+            raise ReportError('No se encontraron gastos para este viaje', 404)
+
+        resumen = wb.create_sheet('Resumen')
+        resumen.append(['Concepto', 'Valor'])
+        resumen.append(['Viaje ID', viaje_id])
+        resumen.append(['Origen', viaje.origen])
+        resumen.append(['Destino', viaje.destino])
+        for moneda in sorted(por_moneda):
+            resumen.append([f'Total Gastos en {moneda}', f'{por_moneda[moneda]:.2f}'])
+        resumen.append([f'Total Gastos ({moneda_reporte})', f'{total:.2f}'])
+        if sin_cotizacion:
+            resumen.append(['Gastos sin cotización (no incluidos en el total)', sin_cotizacion])
+        resumen.append(['Cantidad de Gastos', cantidad])
+    return cantidad
+
+
+# --- Gastos por período ---
+
+GASTOS_PERIODO_HEADERS = [
+    'ID Gasto', 'Fecha', 'Tipo de Gasto', 'Descripción', 'Monto', 'Moneda',
+    'ID Viaje', 'Origen', 'Destino', 'Chofer',
+]
+
+
+def parse_periodo(fecha_inicio, fecha_fin):
+    """Valida los parámetros del informe por período y devuelve las fechas parseadas."""
+    if not fecha_inicio or not fecha_fin:
+        raise ReportError('Se requieren fecha_inicio y fecha_fin como parámetros')
+    try:
+        return parse_date(fecha_inicio), parse_date(fecha_fin)
+    except (ValueError, OverflowError):
+        raise ReportError('Formato de fecha inválido. Use YYYY-MM-DD')
+
+
+def gastos_periodo_report_query(session, fecha_inicio_dt, fecha_fin_dt):
+    return session.query(
+        Gasto.id, Gasto.monto, Gasto.fecha, Gasto.descripcion, Gasto.moneda,
+        Gasto.tipo_id, Viaje.id, Viaje.origen, Viaje.destino,
+        Chofer.nombre, Chofer.apellido,
+    ).join(Viaje, Gasto.viaje_id == Viaje.id
+    ).outerjoin(Chofer, Viaje.chofer_id == Chofer.id
+    ).filter(
+        Gasto.fecha >= fecha_inicio_dt,
+        Gasto.fecha <= fecha_fin_dt
+    ).order_by(Gasto.fecha.desc())
+
+
+def write_gastos_periodo_report(session, fileobj, fecha_inicio, fecha_fin, moneda_reporte=BASE_CURRENCY,
+                                progress=None):
+    """Informe de gastos entre dos fechas, con resúmenes por tipo y por moneda
+    (totales consolidados en `moneda_reporte`)."""
+    fecha_inicio_dt, fecha_fin_dt = parse_periodo(fecha_inicio, fecha_fin)
+
+    rates = _load_rates(session, moneda_reporte)
+    query = gastos_periodo_report_query(session, fecha_inicio_dt, fecha_fin_dt).yield_per(FETCH_BATCH_SIZE)
+    tipos = lookup_cache.get(session, max_age=0).tipo_nombres
+
+    with _write_only_workbook(fileobj) as wb:
+        ws = wb.create_sheet('Gastos por Período')
+        ws.append([*GASTOS_PERIODO_HEADERS, f'Monto ({moneda_reporte})'])
+        # tipo -> [cantidad, total consolidado]; moneda -> [cantidad, total, total consolidado]
+        por_tipo = {}
+        por_moneda = {}
+        cantidad = sin_cotizacion = 0
+        for row, convertido in _with_converted(query, rates, moneda_reporte):
+            (gasto_id, monto, fecha, descripcion, moneda, tipo_id, viaje_id, origen, destino,
+             chofer_nombre, chofer_apellido) = row
+            tipo = tipos.get(tipo_id)
+            if tipo is None:
+                continue  # como el join anterior: se omiten los gastos de un tipo eliminado
+            ws.append([
+                gasto_id, _fmt_datetime(fecha), tipo, descripcion or '', monto, moneda,
+                viaje_id, origen, destino,
+                f"{chofer_nombre or ''} {chofer_apellido or ''}".strip(),
+                _fmt_convertido(convertido),
+            ])
+            if math.isnan(convertido):
+                sin_cotizacion += 1
+                convertido = 0.0
+            acumulado = por_tipo.setdefault(tipo, [0, 0.0])
+            acumulado[0] += 1
+            acumulado[1] += convertido
+            acumulado = por_moneda.setdefault(moneda, [0, 0.0, 0.0])
+            acumulado[0] += 1
+            acumulado[1] += monto
+            acumulado[2] += convertido
+            cantidad += 1
+            _report_progress(progress, cantidad)
+
+        if cantidad == 0:
+            raise ReportError(f'No se encontraron gastos entre {fecha_inicio} y {fecha_fin}', 404)
+
+        total = f'Total ({moneda_reporte})'
+        for title, header, groups in (('Resumen por Tipo', ['Tipo de Gasto', 'Cantidad', total], por_tipo),
+                                      ('Resumen por Moneda', ['Moneda', 'Cantidad', 'Total', total], por_moneda)):
+            sheet = wb.create_sheet(title)
+            sheet.append(header)
+            for key in sorted(groups):
+                sheet.append([key, *groups[key]])
+            sheet.append(['Total', cantidad, *[''] * (len(header) - 3), sum(g[-1] for g in groups.values())])
+            if sin_cotizacion:
+                sheet.append(['Gastos sin cotización (no incluidos en los totales)', sin_cotizacion])
+    return cantidad
+
+
+# --- Registro de informes ---
+
+# tipo -> (constructor, parámetros requeridos, parámetros opcionales, tablas que lee)
+REPORTS = {
+    'viajes': (write_viajes_report, (), (),
+               ('viajes', 'choferes', 'camiones', 'acoplados')),
+    'gastos-viaje': (write_gastos_viaje_report, ('viaje_id',), ('moneda_reporte',),
+                     ('gastos', 'tipos_de_gasto', 'tipos_de_cambio', 'viajes', 'choferes', 'camiones',
+                      'acoplados')),
+    'gastos-periodo': (write_gastos_periodo_report, ('fecha_inicio', 'fecha_fin'), ('moneda_reporte',),
+                       ('gastos', 'tipos_de_gasto', 'tipos_de_cambio', 'viajes', 'choferes')),
+}
+
+
+def report_tables(tipo):
+    return REPORTS[tipo][3]
+
+
+def report_filename(tipo, params):
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+    if tipo == 'gastos-viaje':
+        return f"Gastos por Viaje_{params['viaje_id']}_{stamp}.xlsx"
+    if tipo == 'gastos-periodo':
+        return f"Gastos por Periodo_{params['fecha_inicio']}_{params['fecha_fin']}_{stamp}.xlsx"
+    return f'viaje_{stamp}.xlsx'
+
+
+def validate_report_params(tipo, params):
+    """Comprueba el tipo de informe y sus parámetros antes de encolarlo.
+
+    Devuelve sólo los parámetros que usa el informe, ya normalizados.
+    """
+    if tipo not in REPORTS:
+        raise ReportError(f'Tipo de informe desconocido: {tipo}')
+    params = params or {}
+    if tipo == 'gastos-periodo':
+        parse_periodo(params.get('fecha_inicio'), params.get('fecha_fin'))
+    _, required, optional, _ = REPORTS[tipo]
+    missing = [name for name in required if params.get(name) in (None, '')]
+    if missing:
+        raise ReportError(f'Faltan parámetros: {", ".join(missing)}')
+    clean = {name: params[name] for name in required}
+    if 'moneda_reporte' in optional:
+        clean['moneda_reporte'] = str(params.get('moneda_reporte') or BASE_CURRENCY).strip().upper()
+    if tipo == 'gastos-viaje':
+        try:
+            clean['viaje_id'] = int(clean['viaje_id'])
+        except (TypeError, ValueError):
+            raise ReportError('viaje_id debe ser un número entero')
+    return clean
+
+
+def build_report(session, tipo, params, fileobj, progress=None):
+    """Escribe el informe `tipo` en `fileobj` y devuelve la cantidad de filas."""
+    if tipo not in REPORTS:
+        raise ReportError(f'Tipo de informe desconocido: {tipo}')
+    builder, required, optional, _ = REPORTS[tipo]
+    kwargs = {name: params[name] for name in (*required, *optional) if name in params}
+    return builder(session, fileobj, progress=progress, **kwargs)
+
+
+def build_report_spooled(session, tipo, params):
+    """Genera el informe en un archivo temporal (en memoria hasta SPOOL_MAX_SIZE)
+    y lo devuelve posicionado al inicio."""
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        build_report(session, tipo, params, spooled)
+    except BaseException:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled
@@ -0,0 +1,99 @@
+# lookups.py
+
+"""Caché en memoria de las tablas de referencia.
+
+Monedas, estados de vehículo, estados de viaje y tipos de gasto casi nunca
+cambian, así que se leen una vez y se sirven desde memoria: los endpoints de
+consulta devuelven el JSON ya codificado con su ETag, y los informes y la
+importación resuelven nombres y códigos con diccionarios en lugar de joins o
+consultas por fila.
+
+Las escrituras de este proceso invalidan el caché al confirmarse
+(`invalidate`). Para las de otros procesos (otro worker del servidor, los
+trabajadores de informes) el caché compara, cada `ttl` segundos, los
+contadores de cambios de las tablas (ver data_versions.py) y se recarga si
+alguno cambió.
+"""
+
+import hashlib
+import threading
+import time
+
+from data_versions import get_versions
+from database import Currency, TipoDeGasto, VehiculoEstado, ViajeEstado
+from serialization import dumps
+
+# nombre en la API -> (modelo, orden)
+LOOKUP_TABLES = {
+    'currencies': (Currency, None),
+    'vehiculoEstados': (VehiculoEstado, None),
+    'viajeEstados': (ViajeEstado, None),
+    'tiposDeGasto': (TipoDeGasto, TipoDeGasto.nombre),
+}
+_TABLE_NAMES = sorted(model.__tablename__ for model, _ in LOOKUP_TABLES.values())
+DEFAULT_TTL = 5
+
+
+class Lookups:
+    """Foto de las tablas de referencia; no se modifica después de creada."""
+
+    def __init__(self, data, versions):
+        self.versions = versions
+        self.data = data
+        # JSON de cada tabla y su ETag, listos para responder
+        self.bodies = {name: dumps(items) for name, items in data.items()}
+        self.etags = {name: hashlib.sha1(body).hexdigest() for name, body in self.bodies.items()}
+        self.monedas = frozenset(item['code'] for item in data['currencies'])
+        self.viaje_estados = frozenset(item['nombre'] for item in data['viajeEstados'])
+        self.tipo_nombres = {item['id']: item['nombre'] for item in data['tiposDeGasto']}
+        self.tipos_por_nombre = {item['nombre'].strip().lower(): item['id'] for item in data['tiposDeGasto']}
+
+
+def load_lookups(session):
+    versions = get_versions(session, _TABLE_NAMES)
+    data = {}
+    for name, (model, order) in LOOKUP_TABLES.items():
+        query = session.query(model)
+        if order is not None:
+            query = query.order_by(order)
+        data[name] = [obj.to_dict() for obj in query]
+    return Lookups(data, versions)
+
+
+class LookupCache:
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._lookups = None
+        self._checked_at = 0.0
+        # Se incrementa en cada invalidación: una carga empezada antes no se guarda.
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, session, max_age=None):
+        """Devuelve la foto vigente. `max_age` (segundos, por defecto `ttl`) es
+        cuánto puede pasar sin verificar los contadores; 0 verifica siempre."""
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            lookups, checked_at, generation = self._lookups, self._checked_at, self._generation
+        now = time.monotonic()
+        if lookups is not None and now - checked_at < max_age:
+            return lookups
+        if lookups is not None and get_versions(session, _TABLE_NAMES) == lookups.versions:
+            with self._lock:
+                if self._lookups is lookups:
+                    self._checked_at = now
+            return lookups
+        lookups = load_lookups(session)
+        with self._lock:
+            if self._generation == generation:
+                self._lookups, self._checked_at = lookups, now
+        return lookups
+
+    def invalidate(self):
+        with self._lock:
+            self._lookups = None
+            self._generation += 1
+
+
+# Caché del proceso, compartido por los endpoints, los informes y la importación.
+lookup_cache = LookupCache()
@@ -0,0 +1,360 @@
+# metrics.py
+
+"""Métricas de la API y de las consultas SQL, en formato de texto de Prometheus.
+
+`install` registra en la aplicación y en el motor:
+
+- Por endpoint (la regla de la ruta, p. ej. /api/viajes/<int:id>, así la
+  cantidad de series no depende de los ids): cantidad de pedidos por método y
+  status, histograma de latencia y de tamaño de la respuesta (los bytes que se
+  envían, ya comprimidos). En las respuestas en streaming la latencia y el
+  tamaño se miden cuando el servidor cierra la respuesta, al terminar de
+  enviar el cuerpo.
+- Por pedido: cantidad de consultas SQL y tiempo en la base (eventos
+  before/after_cursor_execute del motor), incluidas las que se ejecutan
+  mientras se envía una respuesta en streaming. Las consultas fuera de un
+  pedido (tareas de fondo, arranque) se cuentan con endpoint "ninguno".
+- Consultas lentas: las que superan `slow_query_ms` se registran en el logger
+  `cargoflow.sql` (y en un archivo si se configura) y quedan las últimas en
+  memoria para /api/metrics/consultas-lentas.
+
+Con `?_profile=1` el pedido se ejecuta bajo cProfile y, en lugar del cuerpo
+normal, se responde un JSON con la duración, las consultas SQL agrupadas por
+texto y las funciones con más tiempo acumulado. Se perfila un pedido a la vez.
+
+Las métricas son de este proceso: con varios workers cada uno expone las suyas.
+"""
+
+import cProfile
+import io
+import logging
+import pstats
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+from flask import g, has_request_context, jsonify, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+SLOW_QUERY_MS = 200
+SLOW_QUERY_HISTORY = 100
+PROFILE_PARAM = '_profile'
+PROFILE_TOP = 40
+PROFILE_SQL_TOP = 20
+MAX_STATEMENT_LENGTH = 1000
+NO_ENDPOINT = 'ninguno'
+UNMATCHED_ENDPOINT = 'sin_ruta'
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Conexiones abiertas mucho tiempo: no cuentan como latencia de un pedido.
+_LONG_LIVED_MIMETYPES = frozenset(['text/event-stream'])
+_QUERY_START_KEY = 'metrics_query_start'
+
+logger = logging.getLogger('cargoflow.sql')
+_profile_lock = threading.Lock()
+
+
+def _statement_text(statement):
+    return re.sub(r'\s+', ' ', statement).strip()[:MAX_STATEMENT_LENGTH]
+
+
+class Histogram:
+    """Histograma acumulativo con límites fijos (como los de Prometheus)."""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            yield bound, total
+
+
+class RequestStats:
+    """Consultas de un pedido en curso."""
+
+    __slots__ = ('method', 'endpoint', 'started', 'queries', 'db_seconds', 'slow', 'statements', 'profiler')
+
+    def __init__(self, method, endpoint):
+        self.method = method
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slow = 0
+        self.statements = None  # [(segundos, sql)] sólo al perfilar
+        self.profiler = None
+
+
+class Metrics:
+    """Contadores e histogramas del proceso, protegidos por un lock."""
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, history=SLOW_QUERY_HISTORY):
+        self.slow_query_ms = slow_query_ms
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._requests = {}       # (método, endpoint, status) -> cantidad
+        self._latency = {}        # (método, endpoint) -> Histogram
+        self._sizes = {}
+        self._queries_per_request = {}
+        self._db_queries = {}     # endpoint -> cantidad
+        self._db_seconds = {}     # endpoint -> segundos
+        self._slow_queries = {}   # endpoint -> cantidad
+        self._in_progress = 0
+        self._recent_slow = deque(maxlen=history)
+
+    def _histogram(self, table, key, bounds):
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram(bounds)
+        return histogram
+
+    def request_started(self):
+        with self._lock:
+            self._in_progress += 1
+
+    def observe_request(self, stats, status, seconds, size, long_lived=False):
+        key = (stats.method, stats.endpoint)
+        with self._lock:
+            self._in_progress -= 1
+            self._requests[(*key, status)] = self._requests.get((*key, status), 0) + 1
+            if not long_lived:
+                self._histogram(self._latency, key, LATENCY_BUCKETS).observe(seconds)
+            if size is not None:
+                self._histogram(self._sizes, key, SIZE_BUCKETS).observe(size)
+            self._histogram(self._queries_per_request, key, QUERY_BUCKETS).observe(stats.queries)
+            self._add_queries(stats.endpoint, stats.queries, stats.db_seconds, stats.slow)
+
+    def _add_queries(self, endpoint, queries, seconds, slow):
+        self._db_queries[endpoint] = self._db_queries.get(endpoint, 0) + queries
+        self._db_seconds[endpoint] = self._db_seconds.get(endpoint, 0.0) + seconds
+        if slow:
+            self._slow_queries[endpoint] = self._slow_queries.get(endpoint, 0) + slow
+
+    def observe_query(self, stats, seconds, statement):
+        """Registra una consulta; `stats` es el pedido en curso o None."""
+        slow = seconds * 1000 >= self.slow_query_ms
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += seconds
+            stats.slow += slow
+            if stats.statements is not None:
+                stats.statements.append((seconds, statement))
+        if not slow and stats is not None:
+            return
+        endpoint = stats.endpoint if stats is not None else NO_ENDPOINT
+        method = stats.method if stats is not None else ''
+        with self._lock:
+            if stats is None:
+                self._add_queries(endpoint, 1, seconds, slow)
+            if slow:
+                self._recent_slow.append({
+                    'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'), 'ms': round(seconds * 1000, 1),
+                    'metodo': method, 'endpoint': endpoint, 'sql': _statement_text(statement),
+                })
+        if slow:
+            logger.warning('Consulta lenta (%.1f ms) en %s: %s', seconds * 1000,
+                           f'{method} {endpoint}' if method else endpoint, _statement_text(statement))
+
+    def recent_slow_queries(self):
+        with self._lock:
+            return list(reversed(self._recent_slow))
+
+    def render(self):
+        """Todas las métricas en el formato de texto de Prometheus."""
+        with self._lock:
+            lines = []
+            _family(lines, 'cargoflow_http_requests_total', 'counter', 'Pedidos HTTP por endpoint y status.',
+                    (({'method': m, 'endpoint': e, 'status': str(s)}, n)
+                     for (m, e, s), n in sorted(self._requests.items())))
+            _family(lines, 'cargoflow_http_requests_in_progress', 'gauge', 'Pedidos HTTP en curso.',
+                    [({}, self._in_progress)])
+            _histogram_family(lines, 'cargoflow_http_request_duration_seconds',
+                              'Latencia de los pedidos HTTP (hasta enviar el cuerpo completo).', self._latency)
+            _histogram_family(lines, 'cargoflow_http_response_size_bytes',
+                              'Tamaño de las respuestas enviadas (ya comprimidas).', self._sizes)
+            _histogram_family(lines, 'cargoflow_db_queries_per_request', 'Consultas SQL por pedido.',
+                              self._queries_per_request)
+            _family(lines, 'cargoflow_db_queries_total', 'counter', 'Consultas SQL por endpoint.',
+                    (({'endpoint': e}, n) for e, n in sorted(self._db_queries.items())))
+            _family(lines, 'cargoflow_db_query_seconds_total', 'counter', 'Tiempo en consultas SQL por endpoint.',
+                    (({'endpoint': e}, s) for e, s in sorted(self._db_seconds.items())))
+            _family(lines, 'cargoflow_db_slow_queries_total', 'counter',
+                    f'Consultas SQL de {self.slow_query_ms} ms o más por endpoint.',
+                    (({'endpoint': e}, n) for e, n in sorted(self._slow_queries.items())))
+            _family(lines, 'cargoflow_process_start_time_seconds', 'gauge', 'Inicio del proceso (epoch).',
+                    [({}, self.started_at)])
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value) if value != int(value) or abs(value) >= 1e15 else str(int(value))
+    return str(value)
+
+
+def _family(lines, name, kind, help_text, samples):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+    for labels, value in samples:
+        lines.append(f'{name}{_labels(labels)} {_number(value)}')
+
+
+def _histogram_family(lines, name, help_text, histograms):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for (method, endpoint), histogram in sorted(histograms.items()):
+        labels = {'method': method, 'endpoint': endpoint}
+        for bound, count in histogram.cumulative():
+            lines.append(f'{name}_bucket{_labels({**labels, "le": _number(float(bound))})} {count}')
+        lines.append(f'{name}_bucket{_labels({**labels, "le": "+Inf"})} {histogram.count}')
+        lines.append(f'{name}_sum{_labels(labels)} {_number(histogram.sum)}')
+        lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+
+
+# ----------------- Registro en Flask y SQLAlchemy -----------------
+
+def _current_stats():
+    return getattr(g, '_metrics', None) if has_request_context() else None
+
+
+class _CountingBody:
+    """Cuerpo en streaming que cuenta los bytes enviados. Delega `close` para
+    que el generador original (y su contexto de pedido) se cierre como antes."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def _profile_report(stats, response, body):
+    stats.profiler.disable()
+    elapsed = time.perf_counter() - stats.started
+    output = io.StringIO()
+    pstats.Stats(stats.profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP)
+    grouped = {}
+    for seconds, statement in stats.statements:
+        text = _statement_text(statement)
+        count, total = grouped.get(text, (0, 0.0))
+        grouped[text] = (count + 1, total + seconds)
+    top = sorted(grouped.items(), key=lambda item: item[1][1], reverse=True)[:PROFILE_SQL_TOP]
+    return {
+        'metodo': stats.method,
+        'endpoint': stats.endpoint,
+        'status': response.status_code,
+        'duracionMs': round(elapsed * 1000, 1),
+        'bytes': len(body),
+        'consultas': stats.queries,
+        'consultasMs': round(stats.db_seconds * 1000, 1),
+        'sql': [{'sql': text, 'veces': count, 'ms': round(total * 1000, 1)} for text, (count, total) in top],
+        'perfil': output.getvalue(),
+    }
+
+
+def install(app, engine, metrics, profile_enabled=True, slow_query_log=None):
+    """Registra las mediciones en `app` y `engine`.
+
+    Debe llamarse antes de registrar otros after_request (como la compresión)
+    para que el tamaño medido sea el que realmente se envía."""
+    if slow_query_log and not any(getattr(handler, 'baseFilename', None) == slow_query_log
+                                  for handler in logger.handlers):
+        handler = logging.FileHandler(slow_query_log, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logger.addHandler(handler)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _query_started(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault(_QUERY_START_KEY, []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _query_finished(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info[_QUERY_START_KEY].pop()
+        metrics.observe_query(_current_stats(), time.perf_counter() - started, statement)
+
+    @event.listens_for(engine, 'handle_error')
+    def _query_failed(context):
+        starts = context.connection.info.get(_QUERY_START_KEY) if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+    @app.before_request
+    def _start_request():
+        rule = request.url_rule.rule if request.url_rule is not None else UNMATCHED_ENDPOINT
+        stats = g._metrics = RequestStats(request.method, rule)
+        metrics.request_started()
+        if profile_enabled and request.args.get(PROFILE_PARAM) == '1':
+            if not _profile_lock.acquire(blocking=False):
+                return jsonify({'error': 'Ya se está perfilando otro pedido'}), 409
+            stats.statements = []
+            stats.profiler = cProfile.Profile()
+            stats.profiler.enable()
+
+    @app.after_request
+    def _finish_request(response):
+        stats = getattr(g, '_metrics', None)
+        if stats is None:
+            return response
+        if stats.profiler is not None:
+            # Se consume el cuerpo (también el de streaming) para perfilar el pedido completo.
+            body = response.get_data()
+            report = _profile_report(stats, response, body)
+            stats.profiler = None
+            _profile_lock.release()
+            response = jsonify(report)
+        if not response.is_streamed or response.direct_passthrough or response.content_length is not None:
+            metrics.observe_request(stats, response.status_code, time.perf_counter() - stats.started,
+                                    response.content_length)
+            return response
+        # En streaming la latencia y el tamaño se conocen al terminar de enviar el cuerpo.
+        # (El callback no referencia a la respuesta: un ciclo demoraría el cierre del generador.)
+        body = response.response = _CountingBody(response.response)
+        status, long_lived = response.status_code, response.mimetype in _LONG_LIVED_MIMETYPES
+        response.call_on_close(lambda: metrics.observe_request(
+            stats, status, time.perf_counter() - stats.started, body.size, long_lived))
+        return response
+
+    @app.teardown_request
+    def _discard_profile(exc):
+        # Un pedido que terminó sin pasar por after_request no debe dejar el perfil activo.
+        stats = getattr(g, '_metrics', None)
+        if stats is not None and stats.profiler is not None:
+            stats.profiler.disable()
+            stats.profiler = None
+            _profile_lock.release()
@@ -0,0 +1,310 @@
+# migrations.py
+
+"""Migraciones versionadas del esquema.
+
+Cada migración tiene un número, un nombre y una función que recibe la conexión
+(dentro de una transacción). `upgrade` aplica, en orden, las que todavía no
+figuren en la tabla `schema_migrations`, así que una base existente se
+actualiza en el lugar al arrancar el servidor.
+
+La migración 1 crea las tablas a partir de los modelos actuales (igual que
+hacía `db.create_all()`), de modo que las siguientes deben ser idempotentes:
+en una base nueva pueden encontrarse con columnas o índices ya creados.
+
+`check_query_plans` ejecuta EXPLAIN QUERY PLAN sobre las consultas frecuentes
+(listados paginados, filtros, informes y dashboard) e informa las que todavía
+recorren una tabla completa o necesitan ordenar en una tabla temporal.
+
+Uso desde la línea de comandos:
+
+    python migrations.py upgrade   # aplica las migraciones pendientes
+    python migrations.py status    # muestra la versión actual y las pendientes
+    python migrations.py check     # verifica los planes de consulta (sale con 1 si falla)
+"""
+
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, func, inspect, select
+
+from database import Camion, Gasto, Poliza, Viaje, db
+
+_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(255), nullable=False),
+    Column('applied_at', String(32), nullable=False),
+)
+
+
+# ----------------- Migraciones -----------------
+
+def _m001_esquema_inicial(connection):
+    db.metadata.create_all(connection)
+    # create_all sólo crea los índices junto con tablas nuevas.
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+# Índices compuestos alineados con las consultas de server.py, informes.py y
+# dashboard.py: cada filtro va primero y después las columnas del orden
+# (clave de orden, id), así el recorrido del índice ya devuelve las filas
+# ordenadas y la paginación por cursor no necesita ordenar.
+QUERY_INDEXES = [
+    ('ix_viajes_fecha_inicio_id', 'viajes', ('fecha_inicio', 'id')),
+    ('ix_viajes_estado_fecha_inicio', 'viajes', ('estado', 'fecha_inicio', 'id')),
+    ('ix_viajes_chofer_fecha_inicio', 'viajes', ('chofer_id', 'fecha_inicio', 'id')),
+    ('ix_viajes_camion_fecha_inicio', 'viajes', ('camion_dominio', 'fecha_inicio', 'id')),
+    ('ix_viajes_acoplado_fecha_inicio', 'viajes', ('acoplado_dominio', 'fecha_inicio', 'id')),
+    ('ix_gastos_fecha_id', 'gastos', ('fecha', 'id')),
+    ('ix_gastos_viaje_fecha', 'gastos', ('viaje_id', 'fecha', 'id')),
+    ('ix_gastos_tipo_fecha', 'gastos', ('tipo_id', 'fecha', 'id')),
+    ('ix_gastos_moneda_fecha', 'gastos', ('moneda', 'fecha', 'id')),
+    ('ix_polizas_vehiculo_fin_vigencia', 'polizas', ('vehiculo_dominio', 'fin_vigencia')),
+]
+
+
+def _m002_indices_de_consultas(connection):
+    for name, table, columns in QUERY_INDEXES:
+        connection.exec_driver_sql(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})')
+    # Reemplazado por ix_viajes_estado_fecha_inicio, que empieza por la misma columna.
+    connection.exec_driver_sql('DROP INDEX IF EXISTS ix_viajes_estado')
+
+
+def _m003_sincronizacion(connection):
+    from database import SyncState, Tombstone
+    from sync import SYNC_MODELS, next_version
+
+    inspector = inspect(connection)
+    for model in SYNC_MODELS:
+        table = model.__table__
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for name in ('updated_at', 'version'):
+            if name not in existing:
+                column = table.c[name]
+                type_sql = column.type.compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {name} {type_sql}')
+        connection.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS ix_{table.name}_version ON {table.name} (version)')
+    Tombstone.__table__.create(connection, checkfirst=True)
+    SyncState.__table__.create(connection, checkfirst=True)
+    # Las filas existentes quedan con una versión inicial común.
+    pending = [model.__table__ for model in SYNC_MODELS
+               if connection.execute(select(func.count()).select_from(model.__table__)
+                                     .where(model.__table__.c.version.is_(None))).scalar()]
+    if pending:
+        version = next_version(connection)
+        for table in pending:
+            connection.execute(table.update().where(table.c.version.is_(None))
+                               .values(version=version, updated_at=datetime.now()))
+
+
+def _m004_tipos_de_cambio(connection):
+    from database import TipoDeCambio
+
+    TipoDeCambio.__table__.create(connection, checkfirst=True)
+
+
+def _m005_resumenes_de_gastos(connection):
+    from database import GastoPorCamionMes, GastoPorDia, GastoPorViaje
+    from rollups import rebuild
+
+    for model in (GastoPorViaje, GastoPorDia, GastoPorCamionMes):
+        model.__table__.create(connection, checkfirst=True)
+    rebuild(connection)
+
+
+def _m006_coberturas(connection):
+    from coberturas import rebuild
+    from database import Cobertura
+
+    Cobertura.__table__.create(connection, checkfirst=True)
+    rebuild(connection)
+
+
+MIGRATIONS = [
+    (1, 'esquema inicial', _m001_esquema_inicial),
+    (2, 'índices de consultas frecuentes', _m002_indices_de_consultas),
+    (3, 'columnas de sincronización y tombstones', _m003_sincronizacion),
+    (4, 'tabla de tipos de cambio', _m004_tipos_de_cambio),
+    (5, 'resúmenes de gastos', _m005_resumenes_de_gastos),
+    (6, 'índice de coberturas de seguros', _m006_coberturas),
+]
+
+
+# ----------------- Aplicación -----------------
+
+def current_version(connection):
+    schema_migrations.create(connection, checkfirst=True)
+    return connection.execute(select(func.max(schema_migrations.c.version))).scalar() or 0
+
+
+def pending_migrations(engine):
+    with engine.begin() as connection:
+        version = current_version(connection)
+    return [(number, name) for number, name, _ in MIGRATIONS if number > version]
+
+
+def upgrade(engine):
+    """Aplica las migraciones pendientes, cada una en su propia transacción.
+    Devuelve la lista de (número, nombre) aplicadas."""
+    applied = []
+    for number, name, migrate in MIGRATIONS:
+        with engine.begin() as connection:
+            if number <= current_version(connection):
+                continue
+            migrate(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=number, name=name, applied_at=time.strftime('%Y-%m-%dT%H:%M:%S')))
+        applied.append((number, name))
+    return applied
+
+
+def drop_schema(engine):
+    """Elimina todas las tablas, incluido el registro de migraciones (para /api/reset)."""
+    db.metadata.drop_all(engine)
+    _metadata.drop_all(engine)
+
+
+# ----------------- Verificación de planes de consulta -----------------
+
+def _hot_queries(session):
+    """Consultas frecuentes a verificar: (nombre, consulta, recorrido_ordenado).
+
+    `recorrido_ordenado` marca las consultas que leen la tabla entera (o sólo la
+    primera página) en el orden de un índice; en ellas un SCAN sobre el índice
+    es lo esperado. En las demás cualquier SCAN es un problema.
+    """
+    from informes import gastos_periodo_report_query, gastos_viaje_report_query, viajes_report_query
+    from coberturas import expiring_query, last_period_query, uncovered_viajes_query
+    from pagination import after_cursor_ranges, order_keyset
+    from scheduling import previous_viaje_query
+
+    desde, hasta = datetime(2024, 1, 1), datetime(2024, 12, 31, 23, 59, 59)
+    hoy = date(2024, 6, 1)
+
+    def pages(name, query, sort_col, key_col):
+        # Primera página y, por separado, cada rango que consulta la página siguiente.
+        yield f'{name}: primera página', order_keyset(query, sort_col, key_col).limit(101), True
+        for n, condition in enumerate(after_cursor_ranges(sort_col, key_col, desde, 100), 1):
+            yield (f'{name}: página siguiente ({n})',
+                   order_keyset(query.filter(condition), sort_col, key_col).limit(101), False)
+
+    def filtered(name, query, sort_col, key_col):
+        # Con filtro, también la primera página debe resolverse con una búsqueda en el índice.
+        for page_name, page_query, _ in pages(name, query, sort_col, key_col):
+            yield page_name, page_query, False
+
+    viajes, gastos = session.query(Viaje), session.query(Gasto)
+    queries = [
+        *pages('viajes', viajes, Viaje.fecha_inicio, Viaje.id),
+        *filtered('viajes por estado', viajes.filter(Viaje.estado == 'En Curso'), Viaje.fecha_inicio, Viaje.id),
+        *filtered('viajes por chofer', viajes.filter(Viaje.chofer_id == 1), Viaje.fecha_inicio, Viaje.id),
+        *filtered('viajes por camión', viajes.filter(Viaje.camion_dominio == 'ABC123'), Viaje.fecha_inicio, Viaje.id),
+        *filtered('viajes por acoplado', viajes.filter(Viaje.acoplado_dominio == 'ACP321'),
+                  Viaje.fecha_inicio, Viaje.id),
+        *filtered('viajes por período', viajes.filter(Viaje.fecha_inicio >= desde, Viaje.fecha_inicio <= hasta),
+                  Viaje.fecha_inicio, Viaje.id),
+        *pages('gastos', gastos, Gasto.fecha, Gasto.id),
+        *filtered('gastos por viaje', gastos.filter(Gasto.viaje_id == 1), Gasto.fecha, Gasto.id),
+        *filtered('gastos por tipo', gastos.filter(Gasto.tipo_id == 1), Gasto.fecha, Gasto.id),
+        *filtered('gastos por moneda', gastos.filter(Gasto.moneda == 'PYG'), Gasto.fecha, Gasto.id),
+        *filtered('gastos por período', gastos.filter(Gasto.fecha >= desde, Gasto.fecha <= hasta),
+                  Gasto.fecha, Gasto.id),
+        ('pólizas: listado', session.query(Poliza).order_by(Poliza.fin_vigencia.asc()), True),
+        ('pólizas por vehículo', session.query(Poliza).filter(Poliza.vehiculo_dominio == 'ABC123')
+            .order_by(Poliza.fin_vigencia.asc()), False),
+        ('informe: viajes', viajes_report_query(session), True),
+        ('informe: gastos de un viaje', gastos_viaje_report_query(session, 1), False),
+        ('informe: gastos por período', gastos_periodo_report_query(session, desde, hasta), False),
+        ('dashboard: viajes activos', session.query(func.count(Viaje.id)).filter(Viaje.estado == 'En Curso'), False),
+        ('dashboard: viajes activos recientes', order_keyset(
+            session.query(Viaje.id).filter(Viaje.estado == 'En Curso'), Viaje.fecha_inicio, Viaje.id).limit(5), False),
+        ('dashboard: pólizas vencidas', session.query(Poliza.id).filter(Poliza.fin_vigencia < hoy)
+            .order_by(Poliza.fin_vigencia.desc()).limit(5), False),
+        ('dashboard: pólizas por vencer', session.query(Poliza.id)
+            .filter(Poliza.fin_vigencia.between(hoy, hoy + timedelta(days=30)))
+            .order_by(Poliza.fin_vigencia.asc()).limit(5), False),
+        ('dashboard: camiones en mantenimiento', session.query(func.count(Camion.dominio))
+            .filter(Camion.estado == 'En Mantenimiento'), False),
+        ('superposición: último viaje del chofer', previous_viaje_query(Viaje.chofer_id, 1, hasta, [1]), False),
+        ('superposición: último viaje del camión', previous_viaje_query(Viaje.camion_dominio, 'ABC123', hasta), False),
+        ('superposición: último viaje del acoplado',
+            previous_viaje_query(Viaje.acoplado_dominio, 'ACP321', hasta), False),
+        ('coberturas: por vencer', expiring_query(hoy), False),
+        ('coberturas: período vigente de un vehículo', last_period_query('ABC123', hoy), False),
+        *pages('viajes sin cobertura', uncovered_viajes_query(session), Viaje.fecha_inicio, Viaje.id),
+    ]
+    return queries
+
+
+def _plan_problems(plan, ordered_walk):
+    problems = []
+    for detail in plan:
+        words = detail.split()
+        if len(words) >= 2 and words[0] == 'SCAN':
+            # "SCAN tabla" sin índice recorre la tabla completa; "SCAN tabla USING
+            # INDEX" recorre el índice entero, aceptable sólo en un recorrido ordenado.
+            if 'USING' not in words:
+                problems.append(f'recorrido completo de {words[1]}')
+            elif not ordered_walk:
+                problems.append(f'recorrido completo del índice de {words[1]}')
+        if detail.startswith('USE TEMP B-TREE'):
+            problems.append(detail.lower())
+    return problems
+
+
+def check_query_plans(session):
+    """Devuelve [(nombre, plan, problemas)] para cada consulta frecuente.
+    Sólo tiene sentido en SQLite; en otros motores devuelve una lista vacía."""
+    engine = session.get_bind()
+    if engine.dialect.name != 'sqlite':
+        return []
+    results = []
+    for name, query, ordered_walk in _hot_queries(session):
+        # Query del ORM o select de Core
+        statement = getattr(query, 'statement', query)
+        sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+        plan = [row[3] for row in session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + sql)]
+        results.append((name, plan, _plan_problems(plan, ordered_walk)))
+    return results
+
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else 'upgrade'
+    from server import app
+
+    with app.app_context():
+        if command == 'upgrade':
+            applied = upgrade(db.engine)
+            for number, name in applied:
+                print(f'Aplicada migración {number}: {name}')
+            if not applied:
+                print('El esquema ya está actualizado.')
+            return 0
+        if command == 'status':
+            with db.engine.begin() as connection:
+                print(f'Versión actual: {current_version(connection)}')
+            for number, name in pending_migrations(db.engine):
+                print(f'Pendiente {number}: {name}')
+            return 0
+        if command == 'check':
+            failed = 0
+            for name, plan, problems in check_query_plans(db.session):
+                print(f"{'FALLA' if problems else 'ok   '} {name}")
+                for detail in plan:
+                    print(f'        {detail}')
+                for problem in problems:
+                    print(f'        -> {problem}')
+                failed += bool(problems)
+            print(f'{failed} consultas con recorridos completos u ordenamientos temporales.')
+            return 1 if failed else 0
+    print(f'Comando desconocido: {command} (use upgrade, status o check)')
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,106 @@
+# pagination.py
+
+"""Paginación por cursor (keyset) para los listados de la API.
+
+En lugar de OFFSET, cada página continúa a partir del último par
+(clave de orden, id) entregado, de modo que el costo de una página depende
+sólo de su tamaño y no de la cantidad de filas de la tabla.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class QueryParamError(ValueError):
+    """Parámetro de consulta inválido (paginación o filtros)."""
+
+
+def parse_limit(raw, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Convierte el parámetro `limit` en un entero entre 1 y `maximum`."""
+    if raw is None or raw == '':
+        return default
+    try:
+        limit = int(raw)
+    except (TypeError, ValueError):
+        raise QueryParamError('El parámetro limit debe ser un número entero')
+    if limit < 1:
+        raise QueryParamError('El parámetro limit debe ser mayor que cero')
+    return min(limit, maximum)
+
+
+def encode_cursor(value, key):
+    """Codifica el último (valor de orden, id) de una página en un token opaco."""
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    payload = json.dumps([value, key], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort_col):
+    """Decodifica un cursor y convierte el valor de orden al tipo de la columna."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if value is not None:
+            python_type = sort_col.type.python_type
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is date:
+                value = date.fromisoformat(value)
+    except Exception:
+        raise QueryParamError('Cursor inválido')
+    return value, key
+
+
+def after_cursor_ranges(sort_col, key_col, value, key, descending=True):
+    """Condiciones que seleccionan las filas posteriores al cursor, en orden.
+
+    SQLite ordena los NULL como el valor más pequeño: van al final en orden
+    descendente y al principio en orden ascendente. Los NULL se piden en una
+    condición aparte porque un OR con `IS NULL` impide usar el índice como
+    rango y obliga a recorrerlo desde el principio en cada página.
+    """
+    if descending:
+        if value is None:
+            return [and_(sort_col.is_(None), key_col < key)]
+        return [or_(sort_col < value, and_(sort_col == value, key_col < key)),
+                sort_col.is_(None)]
+    if value is None:
+        return [and_(sort_col.is_(None), key_col > key), sort_col.isnot(None)]
+    return [or_(sort_col > value, and_(sort_col == value, key_col > key))]
+
+
+def order_keyset(query, sort_col, key_col, descending=True):
+    """Aplica el orden estable (clave de orden, id) usado por la paginación."""
+    if descending:
+        return query.order_by(sort_col.desc(), key_col.desc())
+    return query.order_by(sort_col.asc(), key_col.asc())
+
+
+def keyset_page(query, sort_col, key_col, limit, cursor=None, descending=True):
+    """Devuelve (filas, siguiente_cursor) para una página de `query`.
+
+    `siguiente_cursor` es None cuando no quedan más filas.
+    """
+    if not cursor:
+        rows = order_keyset(query, sort_col, key_col, descending).limit(limit + 1).all()
+    else:
+        value, key = decode_cursor(cursor, sort_col)
+        rows = []
+        for condition in after_cursor_ranges(sort_col, key_col, value, key, descending):
+            rows += order_keyset(query.filter(condition), sort_col, key_col, descending) \
+                .limit(limit + 1 - len(rows)).all()
+            if len(rows) > limit:
+                break
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_col.key), getattr(last, key_col.key))
+    return rows, next_cursor
@@ -0,0 +1,165 @@
+# photos.py
+
+"""Almacén de fotos direccionado por contenido.
+
+Las fotos se guardan en disco bajo el SHA-256 de sus bytes
+(`<raiz>/<2 primeros hex>/<hash>.<ext>`) junto con una miniatura
+pre-generada. En la base sólo queda la clave `<hash>.<ext>`, así que los
+listados no crecen con el tamaño de las imágenes y cada archivo puede
+servirse con ETag fuerte y caché de larga duración (su contenido nunca cambia).
+"""
+
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+from io import BytesIO
+
+# tipo MIME -> extensión
+ALLOWED_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+MIMETYPES = {ext: mime for mime, ext in ALLOWED_TYPES.items()}
+
+THUMBNAIL_SIZE = (160, 120)
+
+_DATA_URL_RE = re.compile(r'^data:(?P<mime>[\w/+.-]+);base64,(?P<data>.*)$', re.DOTALL)
+_KEY_RE = re.compile(r'^(?P<hash>[0-9a-f]{64})\.(?P<ext>jpg|png|gif|webp)$')
+
+
+class PhotoError(ValueError):
+    """La foto recibida no es una imagen válida o admitida."""
+
+
+def is_data_url(value):
+    return isinstance(value, str) and value.startswith('data:')
+
+
+def is_photo_key(value):
+    return isinstance(value, str) and _KEY_RE.match(value) is not None
+
+
+class PhotoStore:
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key, thumbnail=False):
+        match = _KEY_RE.match(key or '')
+        if not match:
+            raise PhotoError('Clave de foto inválida')
+        digest = match.group('hash')
+        name = f'{digest}.thumb.jpg' if thumbnail else key
+        return os.path.join(self.root, digest[:2], name)
+
+    def _write_atomic(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def save_bytes(self, data, mimetype):
+        """Guarda la imagen (si no existía ya) y devuelve su clave."""
+        ext = ALLOWED_TYPES.get(mimetype)
+        if ext is None:
+            raise PhotoError(f'Tipo de imagen no admitido: {mimetype}')
+        if not data:
+            raise PhotoError('La foto está vacía')
+        key = f'{hashlib.sha256(data).hexdigest()}.{ext}'
+        path = self._path(key)
+        if not os.path.exists(path):
+            self._write_atomic(path, data)
+        thumb_path = self._path(key, thumbnail=True)
+        if not os.path.exists(thumb_path):
+            thumb = _make_thumbnail(data)
+            if thumb is not None:
+                self._write_atomic(thumb_path, thumb)
+        return key
+
+    def save_data_url(self, data_url):
+        """Guarda una foto recibida como data URL (`data:image/png;base64,...`)."""
+        match = _DATA_URL_RE.match(data_url)
+        if not match:
+            raise PhotoError('La foto debe enviarse como data URL en base64')
+        try:
+            data = base64.b64decode(match.group('data'), validate=False)
+        except (binascii.Error, ValueError):
+            raise PhotoError('La foto no es base64 válido')
+        return self.save_bytes(data, match.group('mime'))
+
+    def locate(self, key, thumbnail=False):
+        """Devuelve (ruta, mimetype) del archivo a servir, o None si no existe.
+
+        Si se pide la miniatura y no hay una (por ejemplo, sin Pillow instalado),
+        se devuelve el original.
+        """
+        if thumbnail:
+            thumb_path = self._path(key, thumbnail=True)
+            if os.path.exists(thumb_path):
+                return thumb_path, 'image/jpeg'
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        return path, MIMETYPES[_KEY_RE.match(key).group('ext')]
+
+
+def _make_thumbnail(data):
+    """Genera una miniatura JPEG, o None si Pillow no está disponible o la imagen
+    no puede decodificarse."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image.thumbnail(THUMBNAIL_SIZE)
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            out = BytesIO()
+            image.save(out, format='JPEG', quality=80, optimize=True)
+            return out.getvalue()
+    except Exception:
+        return None
+
+
+def resolve_photo_value(store, value):
+    """Traduce el campo `foto` recibido en un POST/PUT a la clave a guardar.
+
+    - data URL: se guarda en el almacén y se devuelve la clave nueva.
+    - clave existente: se conserva tal cual (el frontend devuelve el objeto completo).
+    - vacío: se quita la foto.
+    """
+    if not value:
+        return None
+    if is_data_url(value):
+        return store.save_data_url(value)
+    if is_photo_key(value):
+        return value
+    raise PhotoError('Valor de foto inválido')
+
+
+def migrate_inline_photos(session, store, model, batch_size=100):
+    """Mueve al almacén las fotos que todavía están guardadas en base64 dentro
+    de la fila. Devuelve la cantidad de filas migradas."""
+    migrated = 0
+    while True:
+        rows = session.query(model).filter(model.foto.like('data:%')).limit(batch_size).all()
+        if not rows:
+            return migrated
+        for row in rows:
+            try:
+                row.foto = store.save_data_url(row.foto)
+            except PhotoError:
+                row.foto = None
+            migrated += 1
+        session.commit()
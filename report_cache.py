@@ -0,0 +1,89 @@
+# report_cache.py
+
+"""Caché en disco de los informes generados.
+
+La clave de cada archivo combina el tipo de informe, sus parámetros y las
+versiones (data_versions.py) de las tablas que lee, así que un informe se
+reutiliza mientras ninguna de esas tablas cambie y nunca hace falta
+invalidarlo a mano. La clave sirve también de ETag.
+
+Cuando el tamaño total supera el máximo se eliminan los archivos usados
+hace más tiempo (la fecha de modificación se actualiza en cada acierto).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+
+class ReportCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(tipo, params, versions):
+        payload = json.dumps([tipo, params, versions], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, f'{key}.xlsx')
+
+    def get(self, key):
+        """Devuelve la ruta del archivo cacheado para `key`, o None."""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, fileobj):
+        """Copia `fileobj` al caché bajo `key` y devuelve la ruta del archivo."""
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                shutil.copyfileobj(fileobj, out)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """Elimina los archivos menos usados hasta quedar por debajo de `max_bytes`."""
+        with self._lock:
+            entries = []
+            total = 0
+            with os.scandir(self.root) as it:
+                for entry in it:
+                    if not entry.name.endswith('.xlsx'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
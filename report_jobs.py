@@ -0,0 +1,227 @@
+# report_jobs.py
+
+"""Cola de informes asíncronos ejecutados en un pool de procesos.
+
+Generaliza el patrón de /api/reset (estado en memoria + lock + endpoint de
+consulta) para los informes: el cliente encola un informe, consulta su
+progreso y, cuando termina, descarga el archivo. Los informes corren en un
+ProcessPoolExecutor acotado, de modo que el trabajo de openpyxl no compite
+por el GIL del proceso que atiende la API.
+
+El proceso trabajador se comunica con el servidor mediante archivos en el
+directorio del job: `progress` (filas escritas hasta el momento) y `cancel`
+(pedido de cancelación, que el trabajador revisa en cada lote).
+"""
+
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+
+from informes import ReportError, build_report, report_filename
+
+# Estados posibles de un job
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, ERROR, CANCELLED)
+
+
+class JobQueueFull(Exception):
+    """Se alcanzó el límite de informes en cola o en ejecución."""
+
+
+class JobCancelled(Exception):
+    """El job fue cancelado mientras se generaba."""
+
+
+def _timestamp():
+    return time.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+# --- Código que corre en el proceso trabajador ---
+
+_worker_engines = {}
+
+
+def _worker_session(database_uri):
+    from sqlalchemy.orm import Session
+
+    from config import create_configured_engine
+
+    engine = _worker_engines.get(database_uri)
+    if engine is None:
+        # Mismo perfil que el servidor (pool y PRAGMA de SQLite)
+        engine = _worker_engines[database_uri] = create_configured_engine(database_uri)
+    return Session(engine)
+
+
+def run_report_job(database_uri, tipo, params, job_dir):
+    """Genera el informe dentro de `job_dir` y devuelve la cantidad de filas."""
+    progress_path = os.path.join(job_dir, 'progress')
+    cancel_path = os.path.join(job_dir, 'cancel')
+    part_path = os.path.join(job_dir, 'report.xlsx.part')
+
+    def progress(rows):
+        if os.path.exists(cancel_path):
+            raise JobCancelled()
+        with open(progress_path, 'w') as fh:
+            fh.write(str(rows))
+
+    progress(0)
+    session = _worker_session(database_uri)
+    try:
+        with open(part_path, 'wb') as out:
+            rows = build_report(session, tipo, params, out, progress=progress)
+        os.replace(part_path, os.path.join(job_dir, 'report.xlsx'))
+        progress(rows)
+        return rows
+    finally:
+        session.close()
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+
+# --- Administrador de jobs (proceso de la API) ---
+
+class ReportJobManager:
+    """Mantiene el estado de los jobs de informes y el pool que los ejecuta.
+
+    `max_workers` acota los informes que corren a la vez, `max_queued` el
+    total de jobs pendientes o en ejecución, y `ttl` (segundos) cuánto se
+    conservan los jobs terminados y sus archivos.
+    """
+
+    def __init__(self, database_uri, jobs_dir, max_workers=2, max_queued=8, ttl=3600):
+        self.database_uri = database_uri
+        self.jobs_dir = jobs_dir
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._jobs = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            # 'spawn' evita heredar el estado del servidor (conexiones, threads, locks).
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.jobs_dir, job_id)
+
+    def _expire(self):
+        """Elimina los jobs terminados hace más de `ttl` segundos (con el lock tomado)."""
+        now = time.time()
+        for job_id in [j for j, job in self._jobs.items()
+                       if job['status'] in FINISHED_STATES and now - job['_finished'] > self.ttl]:
+            del self._jobs[job_id]
+            self._futures.pop(job_id, None)
+            shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+    def _public(self, job):
+        data = {key: value for key, value in job.items() if not key.startswith('_')}
+        if job['status'] in (PENDING, RUNNING):
+            try:
+                with open(os.path.join(self._job_dir(job['id']), 'progress')) as fh:
+                    data['rows'] = int(fh.read() or 0)
+                data['status'] = RUNNING
+            except (OSError, ValueError):
+                pass
+        return data
+
+    def submit(self, tipo, params):
+        """Encola un informe y devuelve su estado inicial."""
+        with self._lock:
+            self._expire()
+            active = sum(1 for job in self._jobs.values() if job['status'] not in FINISHED_STATES)
+            if active >= self.max_queued:
+                raise JobQueueFull('Demasiados informes en cola, intente más tarde')
+            job_id = uuid.uuid4().hex
+            job_dir = self._job_dir(job_id)
+            os.makedirs(job_dir)
+            job = {
+                'id': job_id,
+                'tipo': tipo,
+                'params': params,
+                'status': PENDING,
+                'rows': 0,
+                'created_at': _timestamp(),
+                'finished_at': None,
+                'last_error': None,
+                'filename': report_filename(tipo, params),
+                '_finished': None,
+            }
+            self._jobs[job_id] = job
+            future = self._get_executor().submit(run_report_job, self.database_uri, tipo, params, job_dir)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f, job_id=job_id: self._on_done(job_id, f))
+        return self.get(job_id)
+
+    def _on_done(self, job_id, future):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            try:
+                job['rows'] = future.result()
+                job['status'] = DONE
+            except (CancelledError, JobCancelled):
+                job['status'] = CANCELLED
+            except ReportError as e:
+                job['status'] = ERROR
+                job['last_error'] = str(e)
+            except Exception as e:
+                job['status'] = ERROR
+                job['last_error'] = f'Error generando informe: {str(e)}'
+            job['finished_at'] = _timestamp()
+            job['_finished'] = time.time()
+            if job['status'] != DONE:
+                shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            return self._public(job) if job else None
+
+    def list(self):
+        with self._lock:
+            self._expire()
+            return [self._public(job) for job in self._jobs.values()]
+
+    def cancel(self, job_id):
+        """Cancela un job pendiente o en ejecución. Devuelve su estado, o None si no existe."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            future = self._futures.get(job_id)
+        if job['status'] not in FINISHED_STATES and future is not None and not future.cancel():
+            # Ya está corriendo: el trabajador lo verá en el próximo lote.
+            cancel_path = os.path.join(self._job_dir(job_id), 'cancel')
+            if os.path.isdir(self._job_dir(job_id)):
+                open(cancel_path, 'w').close()
+        return self.get(job_id)
+
+    def artifact(self, job_id):
+        """Devuelve (ruta, nombre de archivo) del informe terminado, o None."""
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] != DONE:
+                return None
+            return os.path.join(self._job_dir(job_id), 'report.xlsx'), job['filename']
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,308 @@
+# rollups.py
+
+"""Resúmenes de gastos mantenidos al escribir.
+
+Tres tablas acumulan cantidad y total de los gastos:
+
+- `gastos_por_viaje`: por viaje y moneda.
+- `gastos_por_dia`: por día, tipo de gasto y moneda.
+- `gastos_por_camion_mes`: por camión (el del viaje del gasto), mes y moneda.
+
+Cada flush que crea, modifica o elimina gastos (o cambia el camión de un
+viaje) actualiza los resúmenes en la misma transacción: antes del flush se
+leen de la base los valores anteriores de las filas afectadas y después los
+nuevos, y se aplica la diferencia. Las cargas masivas, que no pasan por el ORM,
+llaman a `add_inserted_rows`.
+
+`/api/gastos/resumen` responde con estas tablas (`period_summary`,
+`viaje_summary`, `camion_summary`) sin leer los gastos.
+
+Los resúmenes nunca se usan para escribir: si se sospecha una diferencia
+(o después de cambiar datos a mano en la base), `rebuild` los recalcula desde
+los gastos:
+
+    python rollups.py rebuild
+"""
+
+import sys
+from collections import defaultdict
+from datetime import date
+
+import numpy as np
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from database import Gasto, GastoPorCamionMes, GastoPorDia, GastoPorViaje, Viaje
+from exchange import ExchangeRates
+
+_GASTOS = Gasto.__table__
+_VIAJES = Viaje.__table__
+_POR_VIAJE = GastoPorViaje.__table__
+_POR_DIA = GastoPorDia.__table__
+_POR_CAMION_MES = GastoPorCamionMes.__table__
+# tabla -> columnas de la clave
+_KEYS = {
+    _POR_VIAJE: ('viaje_id', 'moneda'),
+    _POR_DIA: ('dia', 'tipo_id', 'moneda'),
+    _POR_CAMION_MES: ('camion_dominio', 'mes', 'moneda'),
+}
+# Estado del flush en curso, en session.info
+_OLD_KEY = 'rollup_old_rows'
+_VIAJES_KEY = 'rollup_viaje_camiones'
+
+
+def _day(fecha):
+    return fecha.date() if fecha is not None else None
+
+
+def _month(fecha):
+    return fecha.date().replace(day=1) if fecha is not None else None
+
+
+def _accumulate(deltas, rows, sign):
+    """Suma a `deltas` las filas (viaje_id, fecha, tipo_id, moneda, monto, camión)."""
+    for viaje_id, fecha, tipo_id, moneda, monto, camion in rows:
+        for table, key in ((_POR_VIAJE, (viaje_id, moneda)),
+                           (_POR_DIA, (_day(fecha), tipo_id, moneda))):
+            acumulado = deltas[table][key]
+            acumulado[0] += sign
+            acumulado[1] += sign * monto
+        if camion is not None:
+            acumulado = deltas[_POR_CAMION_MES][(camion, _month(fecha), moneda)]
+            acumulado[0] += sign
+            acumulado[1] += sign * monto
+
+
+def _new_deltas():
+    return {table: defaultdict(lambda: [0, 0.0]) for table in _KEYS}
+
+
+def _apply(connection, deltas):
+    """Aplica las diferencias acumuladas (actualiza o inserta cada clave) y
+    elimina las claves que quedaron sin gastos."""
+    for table, changes in deltas.items():
+        columns = [table.c[name] for name in _KEYS[table]]
+        for key, (cantidad, total) in changes.items():
+            if cantidad == 0 and total == 0:
+                continue
+            match = [column.is_(None) if value is None else column == value
+                     for column, value in zip(columns, key)]
+            result = connection.execute(table.update().where(*match).values(
+                cantidad=table.c.cantidad + cantidad, total=table.c.total + total))
+            if result.rowcount == 0:
+                connection.execute(table.insert().values(
+                    **dict(zip(_KEYS[table], key)), cantidad=cantidad, total=total))
+            elif cantidad < 0:
+                connection.execute(table.delete().where(*match, table.c.cantidad <= 0))
+
+
+def _gasto_rows(connection, condition):
+    """Filas (viaje_id, fecha, tipo_id, moneda, monto, camión) de los gastos que cumplen `condition`."""
+    return connection.execute(
+        select(_GASTOS.c.viaje_id, _GASTOS.c.fecha, _GASTOS.c.tipo_id, _GASTOS.c.moneda,
+               _GASTOS.c.monto, _VIAJES.c.camion_dominio)
+        .select_from(_GASTOS.outerjoin(_VIAJES, _VIAJES.c.id == _GASTOS.c.viaje_id))
+        .where(condition)).all()
+
+
+def _viaje_camiones(connection, ids):
+    rows = connection.execute(select(_VIAJES.c.id, _VIAJES.c.camion_dominio).where(_VIAJES.c.id.in_(ids)))
+    return dict(rows.all())
+
+
+@event.listens_for(Session, 'before_flush')
+def _read_old_values(session, flush_context, instances):
+    # Valores todavía no escritos: lo que hay en la base es el estado anterior.
+    gastos = [obj.id for obj in (*session.dirty, *session.deleted)
+              if isinstance(obj, Gasto) and obj.id is not None]
+    # Viajes que pueden cambiar de camión; los eliminados dejan a sus gastos sin camión.
+    viajes = [obj.id for obj in (*session.dirty, *session.deleted)
+              if isinstance(obj, Viaje) and obj.id is not None
+              and (obj in session.deleted or session.is_modified(obj, include_collections=False))]
+    if not gastos and not viajes and not any(isinstance(obj, Gasto) for obj in session.new):
+        return
+    connection = session.connection()
+    session.info[_OLD_KEY] = (set(gastos), _gasto_rows(connection, _GASTOS.c.id.in_(gastos)) if gastos else [])
+    if viajes:
+        session.info[_VIAJES_KEY] = _viaje_camiones(connection, viajes)
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_rollups(session, flush_context):
+    state = session.info.pop(_OLD_KEY, None)
+    viaje_camiones = session.info.pop(_VIAJES_KEY, None)
+    if state is None and viaje_camiones is None:
+        return
+    old_ids, old_rows = state or (set(), [])
+    connection = session.connection()
+    deltas = _new_deltas()
+    _accumulate(deltas, old_rows, -1)
+    # new/dirty/deleted todavía reflejan lo que se acaba de escribir.
+    touched = old_ids | {obj.id for obj in session.new if isinstance(obj, Gasto)}
+    current = [gasto_id for gasto_id in touched
+               if not any(obj.id == gasto_id for obj in session.deleted if isinstance(obj, Gasto))]
+    if current:
+        _accumulate(deltas, _gasto_rows(connection, _GASTOS.c.id.in_(current)), +1)
+    if viaje_camiones:
+        # Viajes que cambiaron de camión (o se eliminaron): sus demás gastos pasan al camión nuevo.
+        nuevos = _viaje_camiones(connection, list(viaje_camiones))
+        movidos = [viaje_id for viaje_id, camion in viaje_camiones.items() if nuevos.get(viaje_id) != camion]
+        if movidos:
+            rows = connection.execute(
+                select(_GASTOS.c.viaje_id, _GASTOS.c.fecha, _GASTOS.c.moneda, _GASTOS.c.monto)
+                .where(_GASTOS.c.viaje_id.in_(movidos), _GASTOS.c.id.notin_(touched))).all()
+            for viaje_id, fecha, moneda, monto in rows:
+                for camion, sign in ((viaje_camiones[viaje_id], -1), (nuevos.get(viaje_id), +1)):
+                    if camion is not None:
+                        acumulado = deltas[_POR_CAMION_MES][(camion, _month(fecha), moneda)]
+                        acumulado[0] += sign
+                        acumulado[1] += sign * monto
+    _apply(connection, deltas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_state(session):
+    session.info.pop(_OLD_KEY, None)
+    session.info.pop(_VIAJES_KEY, None)
+
+
+def add_inserted_rows(connection, rows):
+    """Suma a los resúmenes los gastos (dicts) de una inserción masiva."""
+    camiones = _viaje_camiones(connection, list({row['viaje_id'] for row in rows}))
+    deltas = _new_deltas()
+    _accumulate(deltas, [(row['viaje_id'], row['fecha'], row['tipo_id'], row['moneda'], row['monto'],
+                          camiones.get(row['viaje_id'])) for row in rows], +1)
+    _apply(connection, deltas)
+
+
+def rebuild(connection):
+    """Recalcula los tres resúmenes desde los gastos. Devuelve la cantidad de filas de cada uno."""
+    for table in _KEYS:
+        connection.execute(table.delete())
+    dia = func.date(_GASTOS.c.fecha)
+    connection.execute(_POR_VIAJE.insert().from_select(
+        ['viaje_id', 'moneda', 'cantidad', 'total'],
+        select(_GASTOS.c.viaje_id, _GASTOS.c.moneda, func.count(), func.sum(_GASTOS.c.monto))
+        .group_by(_GASTOS.c.viaje_id, _GASTOS.c.moneda)))
+    # Los días y meses se arman en Python a partir de date(): así no depende de
+    # funciones de fecha propias de cada motor.
+    deltas = _new_deltas()
+    rows = connection.execute(
+        select(dia, _GASTOS.c.tipo_id, _GASTOS.c.moneda, _VIAJES.c.camion_dominio,
+               func.count(), func.sum(_GASTOS.c.monto))
+        .select_from(_GASTOS.outerjoin(_VIAJES, _VIAJES.c.id == _GASTOS.c.viaje_id))
+        .group_by(dia, _GASTOS.c.tipo_id, _GASTOS.c.moneda, _VIAJES.c.camion_dominio))
+    for day, tipo_id, moneda, camion, cantidad, total in rows:
+        day = date.fromisoformat(str(day)) if day is not None else None
+        acumulado = deltas[_POR_DIA][(day, tipo_id, moneda)]
+        acumulado[0] += cantidad
+        acumulado[1] += total
+        if camion is not None:
+            acumulado = deltas[_POR_CAMION_MES][(camion, day.replace(day=1) if day else None, moneda)]
+            acumulado[0] += cantidad
+            acumulado[1] += total
+    for table in (_POR_DIA, _POR_CAMION_MES):
+        if deltas[table]:
+            connection.execute(table.insert(), [
+                dict(zip(_KEYS[table], key), cantidad=cantidad, total=total)
+                for key, (cantidad, total) in deltas[table].items()])
+    return {table.name: connection.execute(select(func.count()).select_from(table)).scalar()
+            for table in _KEYS}
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def _date_range(query, column, desde, hasta):
+    if desde is not None:
+        query = query.where(column >= desde)
+    if hasta is not None:
+        query = query.where(column <= hasta)
+    return query
+
+
+def period_summary(session, target, desde=None, hasta=None, rates=None, tipo_nombres=None):
+    """Totales de los gastos entre los días `desde` y `hasta` (inclusive; sin
+    límites incluye los gastos sin fecha), por moneda, tipo y día, consolidados en
+    `target`. Lee el resumen diario: el costo depende de la cantidad de días, no de gastos."""
+    if rates is None:
+        rates = ExchangeRates.load(session)
+    rates.check_currency(target)
+    tipo_nombres = tipo_nombres or {}
+    rows = session.execute(_date_range(
+        select(_POR_DIA.c.dia, _POR_DIA.c.tipo_id, _POR_DIA.c.moneda, _POR_DIA.c.cantidad, _POR_DIA.c.total),
+        _POR_DIA.c.dia, desde, hasta)).all()
+    summary = {'monedaReporte': target, 'desde': _iso(desde), 'hasta': _iso(hasta),
+               'cantidad': 0, 'total': 0.0, 'sinCotizacion': 0, 'porMoneda': [], 'porTipo': [], 'porDia': []}
+    if not rows:
+        return summary
+    dias, tipos, monedas, cantidades, totales = (np.asarray(column) for column in zip(*rows))
+    cantidades = cantidades.astype(np.int64)
+    totales = totales.astype(np.float64)
+    # El resumen es diario, igual que las cotizaciones: la conversión es exacta.
+    convertidos = rates.convert(totales, monedas, dias, target)
+    sin_cotizacion = np.isnan(convertidos)
+
+    def group(keys):
+        for key in sorted(set(keys), key=lambda k: (k is None, k)):
+            mask = keys == key
+            yield key, mask, {
+                'cantidad': int(cantidades[mask].sum()),
+                'total': float(np.nansum(convertidos[mask])),
+                'sinCotizacion': int(cantidades[mask & sin_cotizacion].sum()),
+            }
+
+    for moneda, mask, values in group(monedas):
+        summary['porMoneda'].append({'moneda': moneda, 'cantidad': values['cantidad'],
+                                     'total': float(totales[mask].sum()), 'totalConvertido': values['total'],
+                                     'sinCotizacion': values['sinCotizacion']})
+    for tipo_id, _, values in group(tipos):
+        summary['porTipo'].append({'tipoId': int(tipo_id), 'tipo': tipo_nombres.get(tipo_id), **values})
+    for dia, _, values in group(dias):
+        summary['porDia'].append({'dia': _iso(dia), **values})
+    summary.update(cantidad=int(cantidades.sum()), total=float(np.nansum(convertidos)),
+                   sinCotizacion=int(cantidades[sin_cotizacion].sum()))
+    return summary
+
+
+def viaje_summary(session, viaje_id):
+    """Cantidad y total por moneda de los gastos de un viaje."""
+    rows = session.execute(select(_POR_VIAJE.c.moneda, _POR_VIAJE.c.cantidad, _POR_VIAJE.c.total)
+                           .where(_POR_VIAJE.c.viaje_id == viaje_id).order_by(_POR_VIAJE.c.moneda))
+    return {'viajeId': viaje_id,
+            'porMoneda': [{'moneda': moneda, 'cantidad': cantidad, 'total': total}
+                          for moneda, cantidad, total in rows]}
+
+
+def camion_summary(session, camion_dominio, desde=None, hasta=None):
+    """Cantidad y total por mes y moneda de los gastos de los viajes de un camión.
+    `desde` y `hasta` se redondean al mes."""
+    query = select(_POR_CAMION_MES.c.mes, _POR_CAMION_MES.c.moneda, _POR_CAMION_MES.c.cantidad,
+                   _POR_CAMION_MES.c.total).where(_POR_CAMION_MES.c.camion_dominio == camion_dominio)
+    query = _date_range(query, _POR_CAMION_MES.c.mes,
+                        desde.replace(day=1) if desde is not None else None,
+                        hasta.replace(day=1) if hasta is not None else None)
+    rows = session.execute(query.order_by(_POR_CAMION_MES.c.mes, _POR_CAMION_MES.c.moneda))
+    return {'camionDominio': camion_dominio,
+            'porMes': [{'mes': _iso(mes), 'moneda': moneda, 'cantidad': cantidad, 'total': total}
+                       for mes, moneda, cantidad, total in rows]}
+
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else ''
+    if command != 'rebuild':
+        print('Uso: python rollups.py rebuild')
+        return 2
+    from server import app, db
+
+    with app.app_context():
+        with db.engine.begin() as connection:
+            counts = rebuild(connection)
+    for name, count in counts.items():
+        print(f'{name}: {count} filas')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,207 @@
+# scheduling.py
+
+"""Superposición de viajes por chofer, camión y acoplado.
+
+Cada viaje ocupa a su chofer, su camión y su acoplado en el intervalo
+[fecha_inicio, fecha_fin). A un viaje sin fecha_fin que no está Finalizado se
+le supone una duración de `open_trip_duration` (DEFAULT_OPEN_TRIP_HOURS, o
+CARGOFLOW_OPEN_TRIP_HOURS en server.py) en lugar de bloquear sus recursos para
+siempre; uno Finalizado sin fecha_fin termina en su inicio. Los viajes
+Cancelados o sin fecha de inicio no ocupan nada. Aumentar la duración puede
+dejar superpuestos viajes ya cargados, que este control no detecta.
+
+Como las escrituras que pasan por aquí nunca dejan dos viajes superpuestos
+para un mismo recurso, los intervalos de cada recurso están ordenados tanto
+por inicio como por fin. Para saber si [inicio, fin) está libre alcanza con
+mirar el último viaje del recurso que empieza antes de `fin`: si ese no
+termina después de `inicio`, ninguno anterior lo hace. Es una búsqueda en los
+índices (recurso, fecha_inicio, id) de viajes, O(log n) sin importar cuántos
+años de historia haya. (Los datos cargados antes de este control pueden tener
+superposiciones que esta búsqueda no detecta.)
+
+Cada flush que crea viajes o cambia sus fechas, recursos o estado se verifica
+antes de escribir (también dentro de /api/batch); si hay superposición se
+lanza `ScheduleConflict` y la API responde 409. La importación masiva rechaza
+las filas en conflicto (`find_conflicts`). `available_resources` resuelve
+/api/disponibilidad con una búsqueda por recurso.
+"""
+
+from datetime import timedelta
+
+from sqlalchemy import event, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from database import Acoplado, Camion, Chofer, Viaje
+
+VIAJE_CANCELADO = 'Cancelado'
+VIAJE_FINALIZADO = 'Finalizado'
+# recurso -> (columna de viajes, atributo)
+RESOURCES = {
+    'chofer': (Viaje.chofer_id, 'chofer_id'),
+    'camion': (Viaje.camion_dominio, 'camion_dominio'),
+    'acoplado': (Viaje.acoplado_dominio, 'acoplado_dominio'),
+}
+# nombre en la API -> (recurso, clave, campos de la respuesta) para /api/disponibilidad
+RESOURCE_MODELS = {
+    'choferes': ('chofer', Chofer.id, (Chofer.id, Chofer.nombre, Chofer.apellido)),
+    'camiones': ('camion', Camion.dominio, (Camion.dominio, Camion.marca, Camion.modelo, Camion.estado)),
+    'acoplados': ('acoplado', Acoplado.dominio, (Acoplado.dominio, Acoplado.marca, Acoplado.modelo, Acoplado.estado)),
+}
+# Ocupación supuesta de un viaje abierto (sin fecha_fin ni Finalizado).
+DEFAULT_OPEN_TRIP_HOURS = 72
+open_trip_duration = timedelta(hours=DEFAULT_OPEN_TRIP_HOURS)
+_SCHEDULE_FIELDS = ('fecha_inicio', 'fecha_fin', 'estado', 'chofer_id', 'camion_dominio', 'acoplado_dominio')
+
+
+class ScheduleConflict(Exception):
+    """Uno o más recursos ya están asignados a otro viaje en el mismo período."""
+    status = 409
+
+    def __init__(self, conflicts):
+        first = conflicts[0]
+        super().__init__(f"El {first['recurso']} {first['valor']} ya está asignado al viaje "
+                         f"{first['viajeId']} en ese período")
+        self.conflicts = conflicts
+
+
+def set_open_trip_hours(hours):
+    global open_trip_duration
+    open_trip_duration = timedelta(hours=hours)
+
+
+def occupied_until(inicio, fin, estado):
+    """Fin de la ocupación: fecha_fin, o el inicio más open_trip_duration si el viaje sigue abierto."""
+    if fin is not None:
+        return fin
+    return inicio if estado == VIAJE_FINALIZADO else inicio + open_trip_duration
+
+
+def _naive(value):
+    # La base guarda las fechas sin zona horaria.
+    return value.replace(tzinfo=None) if value is not None and value.tzinfo is not None else value
+
+
+def _overlaps(start, end, other_start, other_end):
+    # Intervalos semiabiertos; end None = sin límite (la ventana de /api/disponibilidad sin hasta).
+    return (other_end is None or start < other_end) and (end is None or other_start < end)
+
+
+def _active():
+    return or_(Viaje.estado.is_(None), Viaje.estado != VIAJE_CANCELADO)
+
+
+def previous_viaje_query(column, value, before=None, exclude_ids=()):
+    """Consulta del último viaje del recurso que empieza antes de `before` (None: el último de todos)."""
+    query = select(Viaje.id, Viaje.fecha_inicio, Viaje.fecha_fin, Viaje.estado).where(
+        column == value, Viaje.fecha_inicio.isnot(None), _active())
+    if before is not None:
+        query = query.where(Viaje.fecha_inicio < before)
+    if exclude_ids:
+        query = query.where(Viaje.id.notin_(exclude_ids))
+    return query.order_by(Viaje.fecha_inicio.desc(), Viaje.id.desc()).limit(1)
+
+
+def previous_viaje(session, column, value, before=None, exclude_ids=()):
+    """(id, inicio, fin de ocupación) del último viaje del recurso que empieza antes de `before`."""
+    row = session.execute(previous_viaje_query(column, value, before, exclude_ids)).first()
+    if row is None:
+        return None
+    return row.id, row.fecha_inicio, occupied_until(row.fecha_inicio, row.fecha_fin, row.estado)
+
+
+def _conflict(recurso, valor, viaje_id, inicio, fin):
+    return {'recurso': recurso, 'valor': valor, 'viajeId': viaje_id,
+            'fechaInicio': inicio.isoformat() if inicio else None,
+            'fechaFin': fin.isoformat() if fin else None}
+
+
+def find_conflicts(session, items, exclude_ids=()):
+    """Conflictos de los viajes `items` (dicts con id, fecha_inicio, fecha_fin,
+    estado y los recursos) con los de la base y entre sí.
+
+    `exclude_ids`: viajes cuya fila en la base no cuenta (los que se están
+    modificando o eliminando). Devuelve {posición en items: [conflictos]}."""
+    conflicts = {}
+    by_resource = {}
+    for index, item in enumerate(items):
+        start = _naive(item['fecha_inicio'])
+        if start is None or item['estado'] == VIAJE_CANCELADO:
+            continue
+        end = occupied_until(start, _naive(item['fecha_fin']), item['estado'])
+        for recurso, (column, attr) in RESOURCES.items():
+            value = item[attr]
+            if value is None:
+                continue
+            by_resource.setdefault((recurso, value), []).append((start, end, index))
+            previous = previous_viaje(session, column, value, end, exclude_ids)
+            if previous is not None and _overlaps(start, end, previous[1], previous[2]):
+                conflicts.setdefault(index, []).append(_conflict(recurso, value, *previous))
+    # Entre los viajes de `items`: ordenados por inicio, alcanza con comparar
+    # cada uno con el que termina más tarde entre los anteriores.
+    for (recurso, value), intervals in by_resource.items():
+        if len(intervals) < 2:
+            continue
+        intervals.sort(key=lambda interval: interval[0])
+        latest = None
+        for start, end, index in intervals:
+            if latest is not None and _overlaps(start, end, latest[0], latest[1]):
+                other = items[latest[2]]
+                conflicts.setdefault(index, []).append(
+                    _conflict(recurso, value, other.get('id'), latest[0], latest[1]))
+            if latest is None or latest[1] is not None and (end is None or end > latest[1]):
+                latest = (start, end, index)
+    return conflicts
+
+
+def _schedule_changed(obj):
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in _SCHEDULE_FIELDS)
+
+
+@event.listens_for(Session, 'before_flush')
+def _check_schedule(session, flush_context, instances):
+    viajes = [obj for obj in session.new if isinstance(obj, Viaje)]
+    viajes += [obj for obj in session.dirty
+               if isinstance(obj, Viaje) and obj not in session.deleted and _schedule_changed(obj)]
+    if not viajes:
+        return
+    # Las filas de la base de estos viajes (y de los eliminados) ya no valen.
+    exclude_ids = [obj.id for obj in (*viajes, *session.deleted)
+                   if isinstance(obj, Viaje) and obj.id is not None]
+    items = [{'id': obj.id, **{name: getattr(obj, name) for name in _SCHEDULE_FIELDS}} for obj in viajes]
+    conflicts = find_conflicts(session, items, exclude_ids)
+    if conflicts:
+        raise ScheduleConflict([conflict for index in sorted(conflicts) for conflict in conflicts[index]])
+
+
+def available_resources(session, desde, hasta=None, kinds=RESOURCE_MODELS):
+    """Choferes, camiones y acoplados sin viajes en [desde, hasta) (hasta None:
+    de `desde` en adelante). Una subconsulta por recurso busca su último viaje
+    que empieza antes de `hasta`; los recursos sin viaje o cuyo último viaje
+    termina antes de `desde` están libres."""
+    desde, hasta = _naive(desde), _naive(hasta)
+    result = {}
+    for kind in kinds:
+        recurso, key, fields = RESOURCE_MODELS[kind]
+        column = RESOURCES[recurso][0]
+        previous = select(Viaje.id).where(column == key, Viaje.fecha_inicio.isnot(None), _active())
+        if hasta is not None:
+            previous = previous.where(Viaje.fecha_inicio < hasta)
+        previous = previous.order_by(Viaje.fecha_inicio.desc(), Viaje.id.desc()).limit(1).scalar_subquery()
+        rows = session.execute(select(*fields, previous.label('previo')).order_by(key)).all()
+        ids = [row.previo for row in rows if row.previo is not None]
+        ends = {}
+        for start in range(0, len(ids), 500):
+            for viaje_id, inicio, fin, estado in session.execute(
+                    select(Viaje.id, Viaje.fecha_inicio, Viaje.fecha_fin, Viaje.estado)
+                    .where(Viaje.id.in_(ids[start:start + 500]))):
+                ends[viaje_id] = occupied_until(inicio, fin, estado)
+        free = []
+        for row in rows:
+            if row.previo is not None:
+                end = ends[row.previo]
+                if end is None or end > desde:
+                    continue
+            free.append({name: value for name, value in row._mapping.items() if name != 'previo'})
+        result[kind] = free
+    return result
@@ -0,0 +1,182 @@
+# search.py
+
+"""Índice de búsqueda de texto completo (SQLite FTS5).
+
+Cada entidad buscable tiene una tabla virtual FTS5 de contenido externo
+(`<tabla>_fts`) que apunta a la tabla original por rowid. Los triggers
+creados junto a la tabla virtual mantienen el índice sincronizado dentro de
+la misma transacción que hace el INSERT/UPDATE/DELETE, así que cualquier
+handler que escriba con el ORM (o con SQL directo) lo actualiza sin más.
+
+Con motores que no son SQLite se usa una búsqueda LIKE como alternativa.
+
+Las tablas FTS de camiones y acoplados se enlazan por el rowid implícito, que
+un VACUUM puede renumerar. Después de un VACUUM (o si los resultados no
+coinciden con los datos) se reconstruyen todos los índices con:
+
+    python search.py rebuild
+"""
+
+import re
+import sys
+
+from sqlalchemy import or_, text
+
+from database import Acoplado, Camion, Chofer, Poliza
+from pagination import parse_limit
+
+# entidad (nombre del endpoint) -> (modelo, columnas indexadas)
+SEARCH_INDEXES = {
+    'choferes': (Chofer, ('nombre', 'apellido', 'identificacion')),
+    'camiones': (Camion, ('dominio', 'marca', 'modelo', 'chasis')),
+    'acoplados': (Acoplado, ('dominio', 'marca', 'modelo', 'chasis')),
+    'polizas': (Poliza, ('aseguradora', 'asegurado')),
+}
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 200
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _is_sqlite(bind):
+    return bind.dialect.name == 'sqlite'
+
+
+def _fts_table(model):
+    return f'{model.__tablename__}_fts'
+
+
+def _key_column(model):
+    return model.__mapper__.primary_key[0]
+
+
+def _ddl(model, columns):
+    """Sentencias para crear la tabla FTS5 y sus triggers de sincronización."""
+    table = model.__tablename__
+    fts = _fts_table(model)
+    cols = ', '.join(columns)
+    new_vals = ', '.join(f'new.{c}' for c in columns)
+    old_vals = ', '.join(f'old.{c}' for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{cols}, content='{table}', content_rowid='rowid', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {new_vals}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.rowid, {old_vals}); END",
+        # Sólo se reindexa cuando cambia alguna columna indexada (no por estado o foto).
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.rowid, {old_vals}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {new_vals}); END",
+    ]
+
+
+def ensure_search_index(engine):
+    """Crea las tablas FTS5 y los triggers que falten.
+
+    Los índices recién creados se reconstruyen a partir de las filas que ya
+    existan en la tabla original. Es seguro llamarla en cada arranque.
+    """
+    if not _is_sqlite(engine):
+        return
+    with engine.begin() as conn:
+        existing = {row[0] for row in conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '%\\_fts' ESCAPE '\\'"))}
+        for model, columns in SEARCH_INDEXES.values():
+            for statement in _ddl(model, columns):
+                conn.execute(text(statement))
+            fts = _fts_table(model)
+            if fts not in existing:
+                conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def rebuild_search_index(engine):
+    """Reconstruye todos los índices desde cero (por ejemplo, después de un VACUUM,
+    que puede renumerar los rowid de las tablas sin clave entera)."""
+    if not _is_sqlite(engine):
+        return
+    ensure_search_index(engine)
+    with engine.begin() as conn:
+        for model, _ in SEARCH_INDEXES.values():
+            fts = _fts_table(model)
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def drop_search_index(engine):
+    """Elimina las tablas FTS5 (los triggers desaparecen con las tablas originales)."""
+    if not _is_sqlite(engine):
+        return
+    with engine.begin() as conn:
+        for model, _ in SEARCH_INDEXES.values():
+            conn.execute(text(f'DROP TABLE IF EXISTS {_fts_table(model)}'))
+
+
+def parse_search_limit(raw):
+    """Como el `limit` de los listados (400 si es inválido), con el tope de la búsqueda."""
+    return parse_limit(raw, DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT)
+
+
+def _tokens(term):
+    return _TOKEN_RE.findall(term or '')
+
+
+def build_match_query(term):
+    """Convierte el texto del usuario en una consulta FTS5 segura.
+
+    Cada palabra se cita (para neutralizar la sintaxis de FTS5) y se busca
+    como prefijo; todas las palabras deben aparecer.
+    """
+    return ' '.join(f'"{token}"*' for token in _tokens(term))
+
+
+def search(session, entity, term, limit=DEFAULT_SEARCH_LIMIT):
+    """Devuelve los objetos de `entity` que coinciden con `term`, por relevancia."""
+    model, columns = SEARCH_INDEXES[entity]
+    key = _key_column(model)
+    bind = session.get_bind()
+    if _is_sqlite(bind):
+        match = build_match_query(term)
+        if not match:
+            return []
+        fts = _fts_table(model)
+        keys = [row[0] for row in session.execute(text(
+            f'SELECT t.{key.name} FROM {fts} JOIN {model.__tablename__} t ON t.rowid = {fts}.rowid '
+            f'WHERE {fts} MATCH :match ORDER BY {fts}.rank LIMIT :limit'),
+            {'match': match, 'limit': limit})]
+        if not keys:
+            return []
+        by_key = {getattr(obj, key.key): obj
+                  for obj in session.query(model).filter(key.in_(keys))}
+        return [by_key[k] for k in keys if k in by_key]
+
+    # Alternativa sin FTS5: todas las palabras deben aparecer en alguna columna.
+    tokens = _tokens(term)
+    if not tokens:
+        return []
+    query = session.query(model)
+    for token in tokens:
+        query = query.filter(or_(*[getattr(model, c).ilike(f'%{token}%') for c in columns]))
+    return query.limit(limit).all()
+
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else ''
+    if command != 'rebuild':
+        print('Uso: python search.py rebuild')
+        return 2
+    from server import app, db
+
+    with app.app_context():
+        if not _is_sqlite(db.engine):
+            print('La búsqueda sin SQLite no usa índices FTS5; no hay nada que reconstruir.')
+            return 0
+        rebuild_search_index(db.engine)
+    for model, _ in SEARCH_INDEXES.values():
+        print(f'{_fts_table(model)}: reconstruido')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,119 @@
+# serialization.py
+
+"""Serialización rápida de listados.
+
+Los listados seleccionan sólo las columnas que se envían (tuplas, sin pasar
+por el identity map del ORM) y las codifican con orjson si está instalado.
+Las listas completas se envían en bloques: un array JSON o, si se pide,
+NDJSON (un objeto por línea), de modo que el primer byte sale antes de leer
+la última fila.
+
+Cada proyección reproduce exactamente el `to_dict()` del modelo; las fechas
+salen en ISO 8601 igual que con `isoformat()`.
+"""
+
+import json
+from datetime import date, datetime
+from itertools import islice
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional; sin él se usa json de la biblioteca estándar
+    orjson = None
+
+from database import Acoplado, Camion, Chofer, Gasto, Poliza, TipoDeGasto, Viaje
+
+JSON_MIMETYPE = 'application/json'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+CHUNK_SIZE = 1000
+
+# modelo -> ((clave JSON, columna), ...) en el mismo orden que to_dict()
+PROJECTIONS = {
+    Chofer: (
+        ('id', Chofer.id), ('nombre', Chofer.nombre), ('apellido', Chofer.apellido),
+        ('nacionalidad', Chofer.nacionalidad), ('identificacion', Chofer.identificacion),
+        ('identificacionLaboral', Chofer.identificacion_laboral),
+        ('telefono', Chofer.telefono), ('email', Chofer.email),
+    ),
+    Camion: (
+        ('dominio', Camion.dominio), ('marca', Camion.marca), ('modelo', Camion.modelo),
+        ('año', Camion.año), ('color', Camion.color), ('tipo', Camion.tipo),
+        ('chasis', Camion.chasis), ('foto', Camion.foto), ('estado', Camion.estado),
+    ),
+    Acoplado: (
+        ('dominio', Acoplado.dominio), ('marca', Acoplado.marca), ('modelo', Acoplado.modelo),
+        ('año', Acoplado.año), ('color', Acoplado.color), ('tipo', Acoplado.tipo),
+        ('chasis', Acoplado.chasis), ('estado', Acoplado.estado),
+    ),
+    Viaje: (
+        ('id', Viaje.id), ('origen', Viaje.origen), ('destino', Viaje.destino),
+        ('fechaInicio', Viaje.fecha_inicio), ('fechaFin', Viaje.fecha_fin),
+        ('choferId', Viaje.chofer_id), ('camionDominio', Viaje.camion_dominio),
+        ('acopladoDominio', Viaje.acoplado_dominio), ('estado', Viaje.estado),
+    ),
+    Poliza: (
+        ('id', Poliza.id), ('aseguradora', Poliza.aseguradora), ('asegurado', Poliza.asegurado),
+        ('vehiculoDominio', Poliza.vehiculo_dominio),
+        ('inicioVigencia', Poliza.inicio_vigencia), ('finVigencia', Poliza.fin_vigencia),
+    ),
+    TipoDeGasto: (
+        ('id', TipoDeGasto.id), ('nombre', TipoDeGasto.nombre),
+    ),
+    Gasto: (
+        ('id', Gasto.id), ('monto', Gasto.monto), ('fecha', Gasto.fecha),
+        ('descripcion', Gasto.descripcion), ('viajeId', Gasto.viaje_id),
+        ('tipoId', Gasto.tipo_id), ('moneda', Gasto.moneda),
+    ),
+}
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} no es serializable a JSON')
+
+
+def dumps(value):
+    """Codifica `value` como JSON (bytes UTF-8)."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def project(query, model):
+    """Devuelve (claves, consulta) con sólo las columnas de la proyección de `model`.
+    Los filtros y el orden de `query` se conservan."""
+    keys, columns = zip(*PROJECTIONS[model])
+    return keys, query.with_entities(*columns)
+
+
+def rows_to_dicts(keys, rows):
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_json_array(keys, rows, chunk_size=CHUNK_SIZE):
+    """Genera un array JSON en bloques de `chunk_size` filas."""
+    yield b'['
+    first = True
+    for chunk in _chunks(rows, chunk_size):
+        if not first:
+            yield b','
+        # dumps de la lista del bloque sin los corchetes
+        yield dumps(rows_to_dicts(keys, chunk))[1:-1]
+        first = False
+    yield b']'
+
+
+def iter_ndjson(keys, rows, chunk_size=CHUNK_SIZE):
+    """Genera NDJSON (un objeto por línea) en bloques de `chunk_size` filas."""
+    for chunk in _chunks(rows, chunk_size):
+        yield b''.join(dumps(item) + b'\n' for item in rows_to_dicts(keys, chunk))
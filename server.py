@@ -1,12 +1,39 @@
 # server.py
 
-from flask import Flask, request, jsonify, send_file, make_response
+from flask import Flask, Response, request, jsonify, send_file, make_response, stream_with_context
 from flask_cors import CORS
-from database import db, init_db, Chofer, Camion, Acoplado, Viaje, Poliza, Gasto, TipoDeGasto, Currency, VehiculoEstado, ViajeEstado
+from database import db, init_db, Chofer, Camion, Acoplado, Viaje, Poliza, Gasto, TipoDeGasto, TipoDeCambio
+from compression import CompressedBodyCache, compress_response
+from metrics import PROMETHEUS_MIMETYPE, Metrics, install as install_metrics
+from config import database_uri, engine_options, install_sqlite_pragmas
+from bulk_import import ImportFileError, detect_format, run_import
+from bootstrap import begin_snapshot, bootstrap_etag, compute_bootstrap
+from dashboard import MAX_TOP_N, POR_VENCER_DIAS, TOP_N, DashboardCache
+from data_versions import ensure_table_versions, get_versions
+from migrations import drop_schema, upgrade
+from lookups import lookup_cache
+from exchange import BASE_CURRENCY, ExchangeRateError, gasto_totals
+from rollups import camion_summary, period_summary, viaje_summary
+from scheduling import DEFAULT_OPEN_TRIP_HOURS, RESOURCE_MODELS, ScheduleConflict, available_resources, set_open_trip_hours
+from coberturas import coverage_periods, expiring, uncovered_viaje_to_dict, uncovered_viajes_query, uninsured
+from analytics import FREQUENCIES, GASTO_GROUPS, VIAJE_GROUPS, AnalyticsStore, gasto_series, viaje_series
+from informes import XLSX_MIMETYPE, ReportError, build_report_spooled, report_filename, report_tables, validate_report_params
+from report_cache import ReportCache
+from pagination import QueryParamError, keyset_page, order_keyset, parse_limit
+from report_jobs import JobQueueFull, ReportJobManager
+from photos import PhotoError, PhotoStore, migrate_inline_photos, resolve_photo_value
+from serialization import CHUNK_SIZE, JSON_MIMETYPE, NDJSON_MIMETYPE, dumps, iter_json_array, iter_ndjson, project, rows_to_dicts
+from sync import changes_since, current_state, on_commit, prune_tombstones
+from events import ChangeBroadcaster, TooManySubscribers
+from search import SEARCH_INDEXES, drop_search_index, ensure_search_index, parse_search_limit, search
 import os
+from datetime import datetime, timedelta
 from dateutil.parser import parse as parse_date
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError, OperationalError
 import threading
 import time
+from io import BytesIO
 
 # Simple in-memory status tracker for the reset operation
 reset_status = {
@@ -19,23 +46,270 @@ reset_lock = threading.Lock()
 
 # ----------------- App Initialization -----------------
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///cargoflow.db'
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# URI y perfil del motor configurables por entorno (ver config.py)
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JSON_SORT_KEYS'] = False # Mantiene el orden de las claves en la respuesta JSON
+# Directorio del almacén de fotos de camiones (direccionado por contenido)
+app.config['PHOTO_STORE_DIR'] = os.environ.get(
+    'CARGOFLOW_PHOTO_DIR', os.path.join(_BASE_DIR, 'fotos'))
+# Informes asíncronos: procesos trabajadores, límite de jobs activos y vida de los archivos (segundos)
+app.config['REPORT_JOBS_DIR'] = os.environ.get('CARGOFLOW_REPORT_JOBS_DIR', os.path.join(_BASE_DIR, 'report_jobs'))
+app.config['REPORT_JOB_WORKERS'] = int(os.environ.get('CARGOFLOW_REPORT_JOB_WORKERS', 2))
+app.config['REPORT_JOB_MAX_QUEUED'] = int(os.environ.get('CARGOFLOW_REPORT_JOB_MAX_QUEUED', 8))
+app.config['REPORT_JOB_TTL'] = int(os.environ.get('CARGOFLOW_REPORT_JOB_TTL', 3600))
+# Caché de informes generados (se descartan los menos usados al superar el tamaño máximo)
+app.config['REPORT_CACHE_DIR'] = os.environ.get('CARGOFLOW_REPORT_CACHE_DIR', os.path.join(_BASE_DIR, 'report_cache'))
+app.config['REPORT_CACHE_MAX_BYTES'] = int(os.environ.get('CARGOFLOW_REPORT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+# Días que se conservan los registros de filas eliminadas para ?since=
+app.config['TOMBSTONE_RETENTION_DAYS'] = int(os.environ.get('CARGOFLOW_TOMBSTONE_RETENTION_DAYS', 30))
+# Eventos SSE: eventos pendientes tolerados por cliente, eventos guardados para reanudar y máximo de clientes
+app.config['EVENTS_QUEUE_SIZE'] = int(os.environ.get('CARGOFLOW_EVENTS_QUEUE_SIZE', 256))
+app.config['EVENTS_HISTORY'] = int(os.environ.get('CARGOFLOW_EVENTS_HISTORY', 1024))
+app.config['EVENTS_MAX_CLIENTS'] = int(os.environ.get('CARGOFLOW_EVENTS_MAX_CLIENTS', 500))
+# Segundos que se reutiliza el dashboard calculado (las escrituras lo invalidan antes)
+app.config['DASHBOARD_CACHE_TTL'] = float(os.environ.get('CARGOFLOW_DASHBOARD_CACHE_TTL', 10))
+# Compresión de respuestas: tamaño mínimo a comprimir y memoria para cuerpos comprimidos por ETag
+app.config['COMPRESSION_MIN_SIZE'] = int(os.environ.get('CARGOFLOW_COMPRESSION_MIN_SIZE', 1024))
+app.config['COMPRESSION_CACHE_MAX_BYTES'] = int(os.environ.get('CARGOFLOW_COMPRESSION_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+# Segundos entre verificaciones del caché de tablas de referencia (las escrituras de este proceso lo invalidan antes)
+app.config['LOOKUP_CACHE_TTL'] = float(os.environ.get('CARGOFLOW_LOOKUP_CACHE_TTL', 5))
+# Copia columnar para /api/analytics: directorio de los segmentos y segundos entre verificaciones de cambios de otros procesos
+app.config['ANALYTICS_DIR'] = os.environ.get('CARGOFLOW_ANALYTICS_DIR', os.path.join(_BASE_DIR, 'analytics_data'))
+app.config['ANALYTICS_TTL'] = float(os.environ.get('CARGOFLOW_ANALYTICS_TTL', 5))
+# Duración supuesta (horas) de un viaje sin fecha de fin para el control de superposición (ver scheduling.py)
+app.config['OPEN_TRIP_HOURS'] = float(os.environ.get('CARGOFLOW_OPEN_TRIP_HOURS', DEFAULT_OPEN_TRIP_HOURS))
+# Métricas: umbral de consultas lentas (ms), archivo opcional para registrarlas y ?_profile=1 (0 lo desactiva)
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('CARGOFLOW_SLOW_QUERY_MS', 200))
+app.config['SLOW_QUERY_LOG'] = os.environ.get('CARGOFLOW_SLOW_QUERY_LOG') or None
+app.config['PROFILE_REQUESTS'] = os.environ.get('CARGOFLOW_PROFILE_REQUESTS', '1') != '0'
 
 # Configurar CORS para permitir que el frontend (en otro dominio/puerto) se comunique con el backend.
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor'])
 
 # Inicializar la app con la instancia de la base de datos de database.py
 db.init_app(app)
+with app.app_context():
+    # WAL, busy_timeout, caché, etc. en cada conexión nueva (sólo SQLite)
+    install_sqlite_pragmas(db.engine)
+
+# Latencia, tamaño y consultas SQL por endpoint para /api/metrics (ver metrics.py).
+# Se registra antes que la compresión para medir los bytes que realmente se envían.
+metrics = Metrics(slow_query_ms=app.config['SLOW_QUERY_MS'])
+with app.app_context():
+    install_metrics(app, db.engine, metrics, profile_enabled=app.config['PROFILE_REQUESTS'],
+                    slow_query_log=app.config['SLOW_QUERY_LOG'])
+
+def photo_store():
+    return PhotoStore(app.config['PHOTO_STORE_DIR'])
+
+def report_cache():
+    return ReportCache(app.config['REPORT_CACHE_DIR'], app.config['REPORT_CACHE_MAX_BYTES'])
+
+dashboard_cache = DashboardCache(ttl=app.config['DASHBOARD_CACHE_TTL'])
+lookup_cache.ttl = app.config['LOOKUP_CACHE_TTL']
+set_open_trip_hours(app.config['OPEN_TRIP_HOURS'])
+compressed_bodies = CompressedBodyCache(app.config['COMPRESSION_CACHE_MAX_BYTES'])
+
+@app.after_request
+def _compress(response):
+    # gzip/brotli negociado según Accept-Encoding (ver compression.py)
+    return compress_response(response, request, compressed_bodies, app.config['COMPRESSION_MIN_SIZE'])
+
+@on_commit
+def _invalidate_lookups(changes):
+    # Altas y bajas de tipos de gasto (endpoints propios o importaciones).
+    if any(change['entity'] == 'tiposDeGasto' for change in changes):
+        lookup_cache.invalidate()
+
+# Notificaciones de cambios: cada commit que escribe entidades se publica en /api/events.
+change_events = ChangeBroadcaster(queue_size=app.config['EVENTS_QUEUE_SIZE'],
+                                  history=app.config['EVENTS_HISTORY'],
+                                  max_subscribers=app.config['EVENTS_MAX_CLIENTS'])
+on_commit(change_events.publish)
+
+# Series de tiempo de /api/analytics: los commits marcan la copia para leer los cambios en la próxima consulta.
+analytics_store = AnalyticsStore(app.config['ANALYTICS_DIR'], ttl=app.config['ANALYTICS_TTL'])
+on_commit(analytics_store.mark_stale)
+
+_report_jobs = None
+_report_jobs_lock = threading.Lock()
+
+def report_jobs():
+    """Administrador de informes asíncronos (se crea con el primer uso)."""
+    global _report_jobs
+    with _report_jobs_lock:
+        if _report_jobs is None:
+            _report_jobs = ReportJobManager(
+                # URL ya resuelta por Flask-SQLAlchemy (las rutas SQLite relativas van a instance/)
+                db.engine.url.render_as_string(hide_password=False),
+                app.config['REPORT_JOBS_DIR'],
+                max_workers=app.config['REPORT_JOB_WORKERS'],
+                max_queued=app.config['REPORT_JOB_MAX_QUEUED'],
+                ttl=app.config['REPORT_JOB_TTL'],
+            )
+        return _report_jobs
+
+# ----------------- Preparación de datos de entrada -----------------
+# Normalizan el JSON recibido antes de crear o actualizar un modelo. Las usan
+# tanto los endpoints individuales como /api/batch.
+
+def _prepare_camion(data, creating=False):
+    # La foto llega como data URL; en la fila sólo se guarda la clave del almacén.
+    if 'foto' in data:
+        data['foto'] = resolve_photo_value(photo_store(), data['foto'])
+    return data
+
+def _prepare_viaje(data, creating=False):
+    # Asegurarse que los campos vacíos de fecha sean None
+    if 'fechaFin' in data and not data['fechaFin']:
+        data['fechaFin'] = None
+    return data
+
+def _prepare_gasto(data, creating=False):
+    # Parsear fecha si viene como ISO string desde el frontend
+    if 'fecha' in data:
+        if data['fecha']:
+            try:
+                data['fecha'] = parse_date(data['fecha'])
+            except Exception:
+                data['fecha'] = None
+        else:
+            data['fecha'] = None
+    elif creating:
+        data['fecha'] = None
+    return data
+
+# ----------------- Helpers de listados -----------------
+
+def _parse_fecha_arg(name):
+    """Lee un parámetro de fecha opcional de la query string."""
+    raw = request.args.get(name)
+    if not raw:
+        return None
+    try:
+        return parse_date(raw)
+    except (ValueError, OverflowError):
+        raise QueryParamError(f'Formato de fecha inválido en {name}. Use YYYY-MM-DD')
+
+def _filter_hasta(query, column, name='hasta'):
+    """Filtra `column` hasta el parámetro `name`. Una fecha sin hora incluye todo
+    ese día (como en /api/gastos/resumen): se compara con el día siguiente."""
+    hasta = _parse_fecha_arg(name)
+    if hasta is None:
+        return query
+    # Con otra hora por defecto, la hora cambia sólo si el parámetro no la trae.
+    if parse_date(request.args[name], default=datetime(2000, 1, 1, 23)).hour != hasta.hour:
+        return query.filter(column < hasta.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1))
+    return query.filter(column <= hasta)
+
+def _parse_int_arg(name):
+    raw = request.args.get(name)
+    if raw is None or raw == '':
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        raise QueryParamError(f'El parámetro {name} debe ser un número entero')
+
+def _wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best_match([JSON_MIMETYPE, NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+def _stream_response(query, model):
+    """Envía todas las filas de `query` en bloques (array JSON o NDJSON) a medida
+    que se leen, seleccionando sólo las columnas de la proyección de `model`."""
+    if request.args.get('since'):
+        return _changes_response(query, model)
+    keys, query = project(query, model)
+    rows = query.yield_per(CHUNK_SIZE)
+    if _wants_ndjson():
+        return Response(stream_with_context(iter_ndjson(keys, rows)), mimetype=NDJSON_MIMETYPE)
+    return Response(stream_with_context(iter_json_array(keys, rows)), mimetype=JSON_MIMETYPE)
+
+def _changes_response(query, model):
+    """Respuesta de `?since=<versión>`: filas cambiadas y claves eliminadas desde esa versión."""
+    since = _parse_int_arg('since')
+    if since < 0:
+        raise QueryParamError('El parámetro since no puede ser negativo')
+    keys, query = project(query, model)
+    changes = changes_since(db.session, model, query, since)
+    return Response(dumps({
+        'items': rows_to_dicts(keys, changes['rows']),
+        'deleted': changes['deleted'],
+        'version': changes['version'],
+        'reset': changes['reset'],
+    }), mimetype=JSON_MIMETYPE)
+
+def _list_response(query, sort_col, key_col, descending=True):
+    """Serializa un listado, paginado por cursor si se pide `limit` o `cursor`.
+
+    Sin esos parámetros se mantiene la respuesta original (lista completa,
+    enviada en bloques); con ellos se responde {'items': [...], 'nextCursor': ...}.
+    En NDJSON cada fila va en una línea y el cursor en la cabecera X-Next-Cursor.
+    """
+    model = sort_col.class_
+    if request.args.get('since'):
+        return _changes_response(order_keyset(query, sort_col, key_col, descending), model)
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        return _stream_response(order_keyset(query, sort_col, key_col, descending), model)
+    limit = parse_limit(request.args.get('limit'))
+    keys, query = project(query, model)
+    rows, next_cursor = keyset_page(query, sort_col, key_col, limit,
+                                    cursor=request.args.get('cursor'), descending=descending)
+    if _wants_ndjson():
+        response = Response(iter_ndjson(keys, rows), mimetype=NDJSON_MIMETYPE)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+    return Response(dumps({'items': rows_to_dicts(keys, rows), 'nextCursor': next_cursor}),
+                    mimetype=JSON_MIMETYPE)
+
+def _search_response(entity):
+    """Responde con las coincidencias de `q` (ordenadas por relevancia) o None si no hay `q`."""
+    term = request.args.get('q')
+    if not term:
+        return None
+    results = search(db.session, entity, term, parse_search_limit(request.args.get('limit')))
+    return Response(dumps([obj.to_dict() for obj in results]), mimetype=JSON_MIMETYPE)
+
+@app.errorhandler(QueryParamError)
+def handle_query_param_error(e):
+    return jsonify({'error': str(e)}), 400
+
+@app.errorhandler(ScheduleConflict)
+def handle_schedule_conflict(e):
+    db.session.rollback()
+    return jsonify({'error': str(e), 'conflictos': e.conflicts}), 409
+
+@app.errorhandler(ExchangeRateError)
+def handle_exchange_rate_error(e):
+    return jsonify({'error': str(e)}), 400
+
+@app.errorhandler(PhotoError)
+def handle_photo_error(e):
+    return jsonify({'error': str(e)}), 400
+
+@app.errorhandler(OperationalError)
+def handle_operational_error(e):
+    # SQLite con otra escritura en curso más allá de busy_timeout: es transitorio, se puede reintentar.
+    db.session.rollback()
+    if 'database is locked' in str(e.orig):
+        return jsonify({'error': 'Base de datos ocupada (database is locked), reintentar'}), 503, {'Retry-After': '1'}
+    raise e
 
 # ----------------- API Endpoints -----------------
 
 # --- Choferes ---
 @app.route('/api/choferes', methods=['GET'])
 def get_choferes():
-    choferes = Chofer.query.all()    
-    return jsonify([chofer.to_dict() for chofer in choferes])
+    found = _search_response('choferes')
+    if found is not None:
+        return found
+    return _list_response(Chofer.query, Chofer.id, Chofer.id, descending=False)
 
 @app.route('/api/choferes', methods=['POST'])
 def add_chofer():
@@ -64,12 +338,14 @@ def delete_chofer(id):
 # --- Camiones ---
 @app.route('/api/camiones', methods=['GET'])
 def get_camiones():
-    camiones = Camion.query.all()
-    return jsonify([camion.to_dict() for camion in camiones])
+    found = _search_response('camiones')
+    if found is not None:
+        return found
+    return _list_response(Camion.query, Camion.dominio, Camion.dominio, descending=False)
 
 @app.route('/api/camiones', methods=['POST'])
 def add_camion():
-    data = request.json
+    data = _prepare_camion(request.json)
     new_camion = Camion(**data)
     db.session.add(new_camion)
     db.session.commit()
@@ -78,7 +354,7 @@ def add_camion():
 @app.route('/api/camiones/<string:dominio>', methods=['PUT'])
 def update_camion(dominio):
     camion = Camion.query.get_or_404(dominio)
-    data = request.json
+    data = _prepare_camion(request.json)
     for key, value in data.items():
         setattr(camion, key, value)
     db.session.commit()
@@ -91,11 +367,30 @@ def delete_camion(dominio):
     db.session.commit()
     return jsonify({'message': 'Camión eliminado'}), 200
 
+# --- Fotos ---
+@app.route('/api/fotos/<string:key>', methods=['GET'])
+def get_foto(key):
+    """Sirve una foto del almacén. `?size=thumb` devuelve la miniatura.
+    Como la clave es el hash del contenido, la respuesta es cacheable para siempre."""
+    try:
+        found = photo_store().locate(key, thumbnail=request.args.get('size') == 'thumb')
+    except PhotoError:
+        found = None
+    if found is None:
+        return jsonify({'error': 'Foto no encontrada'}), 404
+    path, mimetype = found
+    response = send_file(path, mimetype=mimetype, etag=os.path.basename(path),
+                         conditional=True, max_age=31536000)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 # --- Acoplados ---
 @app.route('/api/acoplados', methods=['GET'])
 def get_acoplados():
-    acoplados = Acoplado.query.all()
-    return jsonify([acoplado.to_dict() for acoplado in acoplados])
+    found = _search_response('acoplados')
+    if found is not None:
+        return found
+    return _list_response(Acoplado.query, Acoplado.dominio, Acoplado.dominio, descending=False)
 
 @app.route('/api/acoplados', methods=['POST'])
 def add_acoplado():
@@ -124,15 +419,30 @@ def delete_acoplado(dominio):
 # --- Viajes ---
 @app.route('/api/viajes', methods=['GET'])
 def get_viajes():
-    viajes = Viaje.query.order_by(Viaje.fecha_inicio.desc()).all()
-    return jsonify([viaje.to_dict() for viaje in viajes])
+    """Lista viajes. Filtros opcionales: estado, desde, hasta (sobre fecha_inicio),
+    chofer_id, camion_dominio, acoplado_dominio. Paginación con limit/cursor."""
+    query = Viaje.query
+    estado = request.args.get('estado')
+    if estado:
+        query = query.filter(Viaje.estado == estado)
+    desde = _parse_fecha_arg('desde')
+    if desde:
+        query = query.filter(Viaje.fecha_inicio >= desde)
+    query = _filter_hasta(query, Viaje.fecha_inicio)
+    chofer_id = _parse_int_arg('chofer_id')
+    if chofer_id is not None:
+        query = query.filter(Viaje.chofer_id == chofer_id)
+    camion_dominio = request.args.get('camion_dominio')
+    if camion_dominio:
+        query = query.filter(Viaje.camion_dominio == camion_dominio)
+    acoplado_dominio = request.args.get('acoplado_dominio')
+    if acoplado_dominio:
+        query = query.filter(Viaje.acoplado_dominio == acoplado_dominio)
+    return _list_response(query, Viaje.fecha_inicio, Viaje.id)
 
 @app.route('/api/viajes', methods=['POST'])
 def add_viaje():
-    data = request.json
-    # Asegurarse que los campos vacíos de fecha sean None
-    if 'fechaFin' in data and not data['fechaFin']:
-        data['fechaFin'] = None
+    data = _prepare_viaje(request.json)
     new_viaje = Viaje(**data)
     db.session.add(new_viaje)
     db.session.commit()
@@ -141,9 +451,7 @@ def add_viaje():
 @app.route('/api/viajes/<int:id>', methods=['PUT'])
 def update_viaje(id):
     viaje = Viaje.query.get_or_404(id)
-    data = request.json
-    if 'fechaFin' in data and not data['fechaFin']:
-        data['fechaFin'] = None
+    data = _prepare_viaje(request.json)
     for key, value in data.items():
         setattr(viaje, key, value)
     db.session.commit()
@@ -156,11 +464,30 @@ def delete_viaje(id):
     db.session.commit()
     return jsonify({'message': 'Viaje eliminado'}), 200
 
+@app.route('/api/disponibilidad', methods=['GET'])
+def get_disponibilidad():
+    """Choferes, camiones y acoplados sin viajes entre desde y hasta (sin hasta:
+    desde `desde` en adelante). `tipo` restringe a choferes, camiones o acoplados
+    (separados por coma). Ver scheduling.py."""
+    desde = _parse_fecha_arg('desde')
+    if desde is None:
+        raise QueryParamError('Falta el parámetro desde')
+    hasta = _parse_fecha_arg('hasta')
+    if hasta is not None and hasta <= desde:
+        raise QueryParamError('hasta debe ser posterior a desde')
+    kinds = [kind.strip() for kind in (request.args.get('tipo') or ','.join(RESOURCE_MODELS)).split(',') if kind.strip()]
+    unknown = [kind for kind in kinds if kind not in RESOURCE_MODELS]
+    if unknown:
+        raise QueryParamError(f'tipo debe ser uno de: {", ".join(RESOURCE_MODELS)}')
+    return jsonify(available_resources(db.session, desde, hasta, kinds))
+
 # --- Pólizas ---
 @app.route('/api/polizas', methods=['GET'])
 def get_polizas():
-    polizas = Poliza.query.order_by(Poliza.fin_vigencia.asc()).all()
-    return jsonify([poliza.to_dict() for poliza in polizas])
+    found = _search_response('polizas')
+    if found is not None:
+        return found
+    return _list_response(Poliza.query, Poliza.fin_vigencia, Poliza.id, descending=False)
 
 @app.route('/api/polizas', methods=['POST'])
 def add_poliza():
@@ -186,23 +513,91 @@ def delete_poliza(id):
     db.session.commit()
     return jsonify({'message': 'Póliza eliminada'}), 200
 
+# --- Coberturas (ver coberturas.py) ---
+@app.route('/api/coberturas', methods=['GET'])
+def get_coberturas():
+    """Períodos continuos cubiertos por pólizas, opcionalmente de un `dominio`."""
+    return jsonify(coverage_periods(db.session, request.args.get('dominio') or None))
+
+@app.route('/api/coberturas/por-vencer', methods=['GET'])
+def get_coberturas_por_vencer():
+    """Vehículos cuya cobertura vigente termina en los próximos `dias` días."""
+    dias = _parse_int_arg('dias')
+    if dias is None:
+        dias = POR_VENCER_DIAS
+    if dias < 0:
+        raise QueryParamError('El parámetro dias no puede ser negativo')
+    fecha = _parse_fecha_arg('fecha')
+    return jsonify(expiring(db.session, fecha.date() if fecha else None, dias))
+
+@app.route('/api/coberturas/sin-seguro', methods=['GET'])
+def get_vehiculos_sin_seguro():
+    """Camiones y acoplados sin cobertura en `fecha` (por defecto, hoy)."""
+    fecha = _parse_fecha_arg('fecha')
+    return jsonify(uninsured(db.session, fecha.date() if fecha else None))
+
+@app.route('/api/coberturas/viajes-sin-cobertura', methods=['GET'])
+def get_viajes_sin_cobertura():
+    """Viajes cuyo camión o acoplado no estuvo cubierto durante todo el viaje,
+    paginados por cursor (filtros opcionales desde/hasta sobre fecha_inicio)."""
+    query = _filter_hasta(uncovered_viajes_query(db.session, _parse_fecha_arg('desde')), Viaje.fecha_inicio)
+    rows, next_cursor = keyset_page(query, Viaje.fecha_inicio, Viaje.id, parse_limit(request.args.get('limit')),
+                                    cursor=request.args.get('cursor'))
+    return jsonify({'items': [uncovered_viaje_to_dict(row) for row in rows], 'nextCursor': next_cursor})
+
 # --- Gastos ---
+def _filter_gastos(query):
+    """Filtros opcionales de gastos: viaje_id, tipo_id, moneda, desde, hasta (sobre fecha)."""
+    viaje_id = _parse_int_arg('viaje_id')
+    if viaje_id is not None:
+        query = query.filter(Gasto.viaje_id == viaje_id)
+    tipo_id = _parse_int_arg('tipo_id')
+    if tipo_id is not None:
+        query = query.filter(Gasto.tipo_id == tipo_id)
+    moneda = request.args.get('moneda')
+    if moneda:
+        query = query.filter(Gasto.moneda == moneda)
+    desde = _parse_fecha_arg('desde')
+    if desde:
+        query = query.filter(Gasto.fecha >= desde)
+    query = _filter_hasta(query, Gasto.fecha)
+    return query
+
 @app.route('/api/gastos', methods=['GET'])
 def get_gastos():
-    gastos = Gasto.query.order_by(Gasto.fecha.desc()).all()
-    return jsonify([gasto.to_dict() for gasto in gastos])
+    """Lista gastos con los filtros de _filter_gastos. Paginación con limit/cursor."""
+    return _list_response(_filter_gastos(Gasto.query), Gasto.fecha, Gasto.id)
+
+@app.route('/api/gastos/totales', methods=['GET'])
+def get_gastos_totales():
+    """Totales por moneda y consolidados en `moneda_reporte` (por defecto la moneda
+    base), con los mismos filtros que el listado de gastos."""
+    moneda_reporte = (request.args.get('moneda_reporte') or BASE_CURRENCY).strip().upper()
+    return jsonify(gasto_totals(db.session, _filter_gastos(Gasto.query), moneda_reporte))
+
+@app.route('/api/gastos/resumen', methods=['GET'])
+def get_gastos_resumen():
+    """Totales de gastos leídos de los resúmenes (ver rollups.py):
+    con viaje_id, por moneda del viaje; con camion_dominio, por mes y moneda;
+    si no, del período desde/hasta (días, inclusive) por moneda, tipo y día,
+    consolidados en `moneda_reporte`."""
+    desde = _parse_fecha_arg('desde')
+    hasta = _parse_fecha_arg('hasta')
+    desde = desde.date() if desde else None
+    hasta = hasta.date() if hasta else None
+    viaje_id = _parse_int_arg('viaje_id')
+    if viaje_id is not None:
+        return jsonify(viaje_summary(db.session, viaje_id))
+    camion_dominio = request.args.get('camion_dominio')
+    if camion_dominio:
+        return jsonify(camion_summary(db.session, camion_dominio, desde, hasta))
+    moneda_reporte = (request.args.get('moneda_reporte') or BASE_CURRENCY).strip().upper()
+    tipo_nombres = lookup_cache.get(db.session).tipo_nombres
+    return jsonify(period_summary(db.session, moneda_reporte, desde, hasta, tipo_nombres=tipo_nombres))
 
 @app.route('/api/gastos', methods=['POST'])
 def add_gasto():
-    data = request.json
-    # Parsear fecha si viene como ISO string desde el frontend
-    if 'fecha' in data and data['fecha']:
-        try:
-            data['fecha'] = parse_date(data['fecha'])
-        except Exception:
-            data['fecha'] = None
-    else:
-        data['fecha'] = None
+    data = _prepare_gasto(request.json, creating=True)
     new_gasto = Gasto(**data)
     db.session.add(new_gasto)
     db.session.commit()
@@ -211,16 +606,7 @@ def add_gasto():
 @app.route('/api/gastos/<int:id>', methods=['PUT'])
 def update_gasto(id):
     gasto = Gasto.query.get_or_404(id)
-    data = request.json
-    # Aceptar fecha como ISO string y parsearla
-    if 'fecha' in data:
-        if data['fecha']:
-            try:
-                data['fecha'] = parse_date(data['fecha'])
-            except Exception:
-                data['fecha'] = None
-        else:
-            data['fecha'] = None
+    data = _prepare_gasto(request.json)
     for key, value in data.items():
         setattr(gasto, key, value)
     db.session.commit()
@@ -233,11 +619,153 @@ def delete_gasto(id):
     db.session.commit()
     return jsonify({'message': 'Gasto eliminado'}), 200
     
+# --- Importación masiva ---
+def _import_response(entity):
+    """Importa un CSV/XLSX enviado como multipart (campo `file`) o en el cuerpo del request."""
+    upload = request.files.get('file')
+    try:
+        if upload is not None:
+            fmt = detect_format(upload.filename, upload.mimetype, request.args.get('format'))
+            stream = upload.stream
+        else:
+            fmt = detect_format(None, request.mimetype, request.args.get('format'))
+            stream = BytesIO(request.get_data())
+        summary = run_import(db.session, entity, stream, fmt)
+    except ImportFileError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'inserted': e.inserted}), 400
+    return jsonify(summary), 200
+
+@app.route('/api/gastos/import', methods=['POST'])
+def import_gastos():
+    """Columnas: monto, fecha, descripcion, viajeId, tipoId (o tipo por nombre), moneda."""
+    return _import_response('gastos')
+
+@app.route('/api/viajes/import', methods=['POST'])
+def import_viajes():
+    """Columnas: origen, destino, fechaInicio, fechaFin, choferId, camionDominio, acopladoDominio, estado."""
+    return _import_response('viajes')
+
+# --- Operaciones en lote ---
+# entidad -> (modelo, preparación de datos, mensaje al eliminar)
+BATCH_ENTITIES = {
+    'choferes': (Chofer, None, 'Chofer eliminado'),
+    'camiones': (Camion, _prepare_camion, 'Camión eliminado'),
+    'acoplados': (Acoplado, None, 'Acoplado eliminado'),
+    'viajes': (Viaje, _prepare_viaje, 'Viaje eliminado'),
+    'polizas': (Poliza, None, 'Póliza eliminada'),
+    'gastos': (Gasto, _prepare_gasto, 'Gasto eliminado'),
+}
+MAX_BATCH_OPERATIONS = 1000
+
+class BatchOperationError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def _apply_batch_operation(operation):
+    """Aplica una operación (sin confirmar la transacción) y devuelve su resultado."""
+    if not isinstance(operation, dict):
+        raise BatchOperationError('Cada operación debe ser un objeto')
+    op = operation.get('op')
+    entity = operation.get('entity')
+    if entity not in BATCH_ENTITIES:
+        raise BatchOperationError(f'Entidad desconocida: {entity}')
+    model, prepare, deleted_message = BATCH_ENTITIES[entity]
+    data = operation.get('data') or {}
+    if not isinstance(data, dict):
+        raise BatchOperationError('data debe ser un objeto')
+
+    if op == 'create':
+        if prepare is not None:
+            data = prepare(data, creating=True)
+        try:
+            obj = model(**data)
+        except TypeError as e:
+            raise BatchOperationError(f'Campos inválidos: {e}')
+        db.session.add(obj)
+        db.session.flush()
+        return {'op': op, 'entity': entity, 'data': obj.to_dict()}
+
+    if op not in ('update', 'delete'):
+        raise BatchOperationError(f'Operación desconocida: {op}')
+    key = operation.get('id')
+    # Clave entera (viajes, gastos...) o dominio (camiones, acoplados).
+    if model.__mapper__.primary_key[0].type.python_type is int:
+        valid = isinstance(key, int) and not isinstance(key, bool)
+    else:
+        valid = isinstance(key, str) and key.strip() != ''
+    if not valid:
+        raise BatchOperationError(f'id faltante o inválido para {op} de {entity}')
+    obj = db.session.get(model, key)
+    if obj is None:
+        raise BatchOperationError(f'{entity} {operation.get("id")} no encontrado', 404)
+    if op == 'delete':
+        db.session.delete(obj)
+        db.session.flush()
+        return {'op': op, 'entity': entity, 'id': operation.get('id'), 'message': deleted_message}
+    if prepare is not None:
+        data = prepare(data)
+    for key, value in data.items():
+        setattr(obj, key, value)
+    db.session.flush()
+    return {'op': op, 'entity': entity, 'data': obj.to_dict()}
+
+def _constraint_name(error):
+    """Restricción violada, sin la sentencia ni los parámetros (que van sólo al log)."""
+    constraint = getattr(getattr(error.orig, 'diag', None), 'constraint_name', None)  # PostgreSQL
+    if constraint:
+        return constraint
+    message = str(error.orig).splitlines()[0] if error.orig is not None else ''
+    # SQLite: "UNIQUE constraint failed: choferes.identificacion", "FOREIGN KEY constraint failed"
+    return message if 'constraint failed' in message else None
+
+@app.route('/api/batch', methods=['POST'])
+def apply_batch():
+    """Aplica una lista ordenada de operaciones en una única transacción.
+
+    Body: {'operations': [{'op': 'create' | 'update' | 'delete', 'entity': 'viajes',
+    'id': <clave, para update/delete>, 'data': {...}}, ...]}
+    Si alguna operación falla no se aplica ninguna y se informa su posición.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'El cuerpo debe ser un objeto JSON con operations'}), 400
+    operations = payload.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'Se requiere una lista operations no vacía'}), 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({'error': f'Máximo {MAX_BATCH_OPERATIONS} operaciones por lote'}), 400
+
+    results = []
+    for index, operation in enumerate(operations):
+        try:
+            results.append(_apply_batch_operation(operation))
+        except IntegrityError as e:
+            db.session.rollback()
+            app.logger.exception('Lote: la operación %d violó una restricción de integridad', index)
+            constraint = _constraint_name(e)
+            message = f'La operación {index} viola una restricción de integridad'
+            if constraint:
+                message += f': {constraint}'
+            return jsonify({'error': message, 'index': index, 'restriccion': constraint}), 400
+        except OperationalError:
+            # Base ocupada u otro error del motor: lo maneja handle_operational_error.
+            db.session.rollback()
+            raise
+        except Exception as e:
+            db.session.rollback()
+            status = getattr(e, 'status', 400)
+            return jsonify({'error': str(e), 'index': index}), status
+    db.session.commit()
+    return jsonify({'results': results}), 200
+
 # --- Tipos de Gasto ---
 @app.route('/api/tiposDeGasto', methods=['GET'])
 def get_tipos_de_gasto():
-    tipos = TipoDeGasto.query.order_by(TipoDeGasto.nombre).all()
-    return jsonify([t.to_dict() for t in tipos])
+    if request.args.get('since'):
+        return _changes_response(TipoDeGasto.query.order_by(TipoDeGasto.nombre), TipoDeGasto)
+    return _lookup_response('tiposDeGasto')
 
 @app.route('/api/tiposDeGasto', methods=['POST'])
 def add_tipo_de_gasto():
@@ -254,21 +782,197 @@ def delete_tipo_de_gasto(id):
     db.session.commit()
     return jsonify({'message': 'Tipo de gasto eliminado'}), 200
 
+# --- Tipos de Cambio ---
+def _validate_tipo_de_cambio(data, cambio=None):
+    """Valida una cotización; devuelve los valores normalizados o un mensaje de error."""
+    values = {}
+    moneda = data.get('moneda', cambio.moneda if cambio else None)
+    moneda = str(moneda or '').strip().upper()
+    if moneda not in lookup_cache.get(db.session).monedas:
+        return None, 'Moneda inexistente'
+    if moneda == BASE_CURRENCY:
+        return None, f'{BASE_CURRENCY} es la moneda base: su cotización es siempre 1'
+    values['moneda'] = moneda
+    if 'fecha' in data or cambio is None:
+        try:
+            values['fecha'] = parse_date(data['fecha']).date()
+        except (KeyError, TypeError, ValueError, OverflowError):
+            return None, 'Fecha inválida. Use YYYY-MM-DD'
+    if 'tasa' in data or cambio is None:
+        try:
+            values['tasa'] = float(data['tasa'])
+        except (KeyError, TypeError, ValueError):
+            return None, 'La tasa debe ser un número'
+        if not values['tasa'] > 0:
+            return None, 'La tasa debe ser mayor que cero'
+    fecha = values.get('fecha', cambio.fecha if cambio else None)
+    existing = TipoDeCambio.query.filter_by(moneda=moneda, fecha=fecha).first()
+    if existing is not None and existing is not cambio:
+        return None, f'Ya existe una cotización de {moneda} para {fecha.isoformat()}'
+    return values, None
+
+@app.route('/api/tiposDeCambio', methods=['GET'])
+def get_tipos_de_cambio():
+    """Cotizaciones, por moneda y fecha. Filtro opcional: moneda."""
+    query = TipoDeCambio.query
+    moneda = request.args.get('moneda')
+    if moneda:
+        query = query.filter(TipoDeCambio.moneda == moneda.upper())
+    cambios = query.order_by(TipoDeCambio.moneda, TipoDeCambio.fecha).all()
+    return jsonify([c.to_dict() for c in cambios])
+
+@app.route('/api/tiposDeCambio', methods=['POST'])
+def add_tipo_de_cambio():
+    values, error = _validate_tipo_de_cambio(request.json or {})
+    if error:
+        return jsonify({'error': error}), 400
+    new_cambio = TipoDeCambio(**values)
+    db.session.add(new_cambio)
+    db.session.commit()
+    return jsonify(new_cambio.to_dict()), 201
+
+@app.route('/api/tiposDeCambio/<int:id>', methods=['PUT'])
+def update_tipo_de_cambio(id):
+    cambio = TipoDeCambio.query.get_or_404(id)
+    values, error = _validate_tipo_de_cambio(request.json or {}, cambio)
+    if error:
+        return jsonify({'error': error}), 400
+    for key, value in values.items():
+        setattr(cambio, key, value)
+    db.session.commit()
+    return jsonify(cambio.to_dict())
+
+@app.route('/api/tiposDeCambio/<int:id>', methods=['DELETE'])
+def delete_tipo_de_cambio(id):
+    cambio = TipoDeCambio.query.get_or_404(id)
+    db.session.delete(cambio)
+    db.session.commit()
+    return jsonify({'message': 'Tipo de cambio eliminado'}), 200
+
 # --- Lookups (Read-only) ---
+def _lookup_response(name):
+    """Tabla de referencia desde el caché en memoria (ver lookups.py), con ETag."""
+    lookups = lookup_cache.get(db.session)
+    response = Response(lookups.bodies[name], mimetype=JSON_MIMETYPE)
+    response.set_etag(lookups.etags[name])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 @app.route('/api/currencies', methods=['GET'])
 def get_currencies():
-    currencies = Currency.query.all()
-    return jsonify([c.to_dict() for c in currencies])
+    return _lookup_response('currencies')
 
 @app.route('/api/vehiculoEstados', methods=['GET'])
 def get_vehiculo_estados():
-    estados = VehiculoEstado.query.all()
-    return jsonify([e.to_dict() for e in estados])
+    return _lookup_response('vehiculoEstados')
 
 @app.route('/api/viajeEstados', methods=['GET'])
 def get_viaje_estados():
-    estados = ViajeEstado.query.all()
-    return jsonify([e.to_dict() for e in estados])
+    return _lookup_response('viajeEstados')
+
+# --- Carga inicial ---
+@app.route('/api/bootstrap', methods=['GET'])
+def get_bootstrap():
+    """Datos de referencia y primera página de cada listado (ver bootstrap.py).
+    `limit` fija el tamaño de las páginas."""
+    limit = parse_limit(request.args.get('limit'))
+    begin_snapshot(db.session)
+    try:
+        etag = bootstrap_etag(db.session, limit)
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = Response(dumps(compute_bootstrap(db.session, limit)), mimetype=JSON_MIMETYPE)
+    finally:
+        db.session.rollback()
+    response.set_etag(etag, weak=True)
+    # Siempre se revalida: la recarga sin cambios cuesta un 304.
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# --- Métricas ---
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Métricas de pedidos y consultas SQL en formato de texto de Prometheus."""
+    return Response(metrics.render(), mimetype=PROMETHEUS_MIMETYPE)
+
+@app.route('/api/metrics/consultas-lentas', methods=['GET'])
+def get_slow_queries():
+    """Últimas consultas que superaron SLOW_QUERY_MS, de la más reciente a la más antigua."""
+    return jsonify({'umbralMs': metrics.slow_query_ms, 'items': metrics.recent_slow_queries()})
+
+# --- Dashboard ---
+@app.route('/api/dashboard', methods=['GET'])
+def get_dashboard():
+    """Indicadores del dashboard y las primeras `top` filas de cada alerta."""
+    top_n = _parse_int_arg('top')
+    top_n = TOP_N if top_n is None else max(0, min(top_n, MAX_TOP_N))
+    return jsonify(dashboard_cache.get(db.session, top_n))
+
+# --- Analytics ---
+def _analytics_args(groups):
+    freq = request.args.get('freq') or 'month'
+    if freq not in FREQUENCIES:
+        raise QueryParamError(f'freq debe ser uno de: {", ".join(FREQUENCIES)}')
+    by = request.args.get('by') or None
+    if by is not None and by not in groups:
+        raise QueryParamError(f'by debe ser uno de: {", ".join(groups)}')
+    desde = _parse_fecha_arg('desde')
+    hasta = _parse_fecha_arg('hasta')
+    return freq, by, desde.date() if desde else None, hasta.date() if hasta else None
+
+@app.route('/api/analytics/gastos', methods=['GET'])
+def get_analytics_gastos():
+    """Cantidad y total de gastos por período (freq) y grupo (by), convertidos a
+    `moneda_reporte`. Se calcula sobre la copia columnar (ver analytics.py)."""
+    freq, by, desde, hasta = _analytics_args(GASTO_GROUPS)
+    moneda_reporte = (request.args.get('moneda_reporte') or BASE_CURRENCY).strip().upper()
+    snapshot = analytics_store.snapshot(db.session)
+    tipo_nombres = lookup_cache.get(db.session).tipo_nombres if by == 'tipo' else None
+    return jsonify(gasto_series(snapshot, freq, by, desde, hasta, moneda_reporte, tipo_nombres))
+
+@app.route('/api/analytics/viajes', methods=['GET'])
+def get_analytics_viajes():
+    """Viajes por período (freq, según fecha de inicio) y grupo (by); `top` deja
+    los grupos con más viajes."""
+    freq, by, desde, hasta = _analytics_args(VIAJE_GROUPS)
+    top = _parse_int_arg('top')
+    snapshot = analytics_store.snapshot(db.session)
+    return jsonify(viaje_series(snapshot, freq, by, desde, hasta, top))
+
+# --- Eventos ---
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """Server-Sent Events con los cambios confirmados (ver events.py).
+    Acepta Last-Event-ID (o ?lastEventId=) para reanudar."""
+    raw = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    try:
+        last_event_id = int(raw) if raw else None
+    except ValueError:
+        raise QueryParamError('Last-Event-ID inválido')
+    version, _ = current_state(db.session)
+    try:
+        subscriber = change_events.subscribe(last_event_id, version)
+    except TooManySubscribers as e:
+        return jsonify({'error': str(e)}), 503
+    # Sin stream_with_context: la conexión a la base se libera al terminar la vista.
+    return Response(change_events.stream(subscriber), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# --- Búsqueda ---
+@app.route('/api/search', methods=['GET'])
+def search_all():
+    """Busca `q` en choferes, camiones, acoplados y pólizas.
+    `entidades` (separadas por coma) restringe la búsqueda; `limit` es por entidad."""
+    term = request.args.get('q', '')
+    requested = request.args.get('entidades')
+    entities = [e for e in requested.split(',') if e] if requested else list(SEARCH_INDEXES)
+    unknown = [e for e in entities if e not in SEARCH_INDEXES]
+    if unknown:
+        return jsonify({'error': f'Entidades desconocidas: {", ".join(unknown)}'}), 400
+    limit = parse_search_limit(request.args.get('limit'))
+    return Response(dumps({entity: [obj.to_dict() for obj in search(db.session, entity, term, limit)]
+                           for entity in entities}), mimetype=JSON_MIMETYPE)
 
     # --- Admin: reset database (drops all tables, recreates and seeds) ---
 @app.route('/api/reset', methods=['POST'])
@@ -291,9 +995,16 @@ def reset_database():
         with app.app_context():
             try:
                 db.session.close()
-                db.drop_all()
-                db.create_all()
+                drop_search_index(db.engine)
+                drop_schema(db.engine)
+                upgrade(db.engine)
+                ensure_search_index(db.engine)
+                ensure_table_versions(db.session)
+                change_events.reset()
                 init_db()
+                dashboard_cache.clear()
+                lookup_cache.invalidate()
+                analytics_store.invalidate()
                 with reset_lock:
                     reset_status['last_error'] = None
                     reset_status['finished_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
@@ -323,354 +1034,129 @@ def get_reset_status():
 
 
 # --- Informes ---
-@app.route('/api/informes/viajes-excel', methods=['GET'])
-def informe_datos_permanentes_excel():
-    """Genera un archivo Excel con datos de viajes y su información asociada (chofer, camión, acoplado)"""
+def _report_response(tipo, params):
+    """Envía el informe desde el caché, generándolo sólo si alguna de sus tablas cambió.
+
+    La clave del caché (tipo, parámetros y versiones de las tablas) es también
+    el ETag, así que una descarga repetida sin cambios responde 304.
+    """
     try:
-        import pandas as pd
-        from io import BytesIO
-        from flask import send_file
-        
-        # Obtener viajes con información relacionada
-        viajes_query = db.session.query(
-            Viaje.id.label('viaje_id'),
-            Viaje.origen,
-            Viaje.destino,
-            Viaje.fecha_inicio,
-            Viaje.fecha_fin,
-            Viaje.estado.label('viaje_estado'),
-            # Datos del chofer
-            Chofer.id.label('chofer_id'),
-            Chofer.nombre.label('chofer_nombre'),
-            Chofer.apellido.label('chofer_apellido'),
-            Chofer.nacionalidad.label('chofer_nacionalidad'),
-            Chofer.identificacion.label('chofer_identificacion'),
-            Chofer.identificacion_laboral.label('chofer_identificacion_laboral'),
-            Chofer.telefono.label('chofer_telefono'),
-            Chofer.email.label('chofer_email'),
-            # Datos del camión
-            Camion.dominio.label('camion_dominio'),
-            Camion.marca.label('camion_marca'),
-            Camion.modelo.label('camion_modelo'),
-            Camion.año.label('camion_año'),
-            Camion.color.label('camion_color'),
-            Camion.tipo.label('camion_tipo'),
-            Camion.chasis.label('camion_chasis'),
-            Camion.estado.label('camion_estado'),
-            # Datos del acoplado
-            Acoplado.dominio.label('acoplado_dominio'),
-            Acoplado.marca.label('acoplado_marca'),
-            Acoplado.modelo.label('acoplado_modelo'),
-            Acoplado.año.label('acoplado_año'),
-            Acoplado.color.label('acoplado_color'),
-            Acoplado.tipo.label('acoplado_tipo'),
-            Acoplado.chasis.label('acoplado_chasis'),
-            Acoplado.estado.label('acoplado_estado')
-        ).outerjoin(Chofer, Viaje.chofer_id == Chofer.id
-        ).outerjoin(Camion, Viaje.camion_dominio == Camion.dominio
-        ).outerjoin(Acoplado, Viaje.acoplado_dominio == Acoplado.dominio
-        ).order_by(Viaje.fecha_inicio.asc()).all()
-        
-        if not viajes_query:
-            return jsonify({'error': 'No se encontraron viajes para generar el informe'}), 404
-        
-        # Convertir a lista de diccionarios
-        viajes_data = []
-        for row in viajes_query:
-            viajes_data.append({
-                # Información del viaje
-                'ID Viaje': row.viaje_id,
-                'Origen': row.origen,
-                'Destino': row.destino,
-                'Fecha Inicio': row.fecha_inicio.strftime('%Y-%m-%d %H:%M:%S') if row.fecha_inicio else '',
-                'Fecha Fin': row.fecha_fin.strftime('%Y-%m-%d %H:%M:%S') if row.fecha_fin else '',
-                
-                # Información del chofer
-                'Chofer Nombre': row.chofer_nombre or '',
-                'Chofer Apellido': row.chofer_apellido or '',
-                'Chofer Nacionalidad': row.chofer_nacionalidad or '',
-                'Chofer Identificación': row.chofer_identificacion or '',
-                'Chofer ID Laboral': row.chofer_identificacion_laboral or '',
-                'Chofer Teléfono': row.chofer_telefono or '',
-                'Chofer Email': row.chofer_email or '',
-                
-                # Información del camión
-                'Camión Dominio': row.camion_dominio or '',
-                'Camión Marca': row.camion_marca or '',
-                'Camión Modelo': row.camion_modelo or '',
-                'Camión Año': row.camion_año or '',
-                'Camión Color': row.camion_color or '',
-                'Camión Tipo': row.camion_tipo or '',
-                'Camión Chasis': row.camion_chasis or '',
-                
-                # Información del acoplado
-                'Acoplado Dominio': row.acoplado_dominio or '',
-                'Acoplado Marca': row.acoplado_marca or '',
-                'Acoplado Modelo': row.acoplado_modelo or '',
-                'Acoplado Año': row.acoplado_año or '',
-                'Acoplado Color': row.acoplado_color or '',
-                'Acoplado Tipo': row.acoplado_tipo or '',
-                'Acoplado Chasis': row.acoplado_chasis or ''
-            })
-        
-        # Convertir a DataFrame
-        df_viajes = pd.DataFrame(viajes_data)
-        
-        # Crear archivo Excel en memoria
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df_viajes.to_excel(writer, sheet_name='Viajes', index=False)
-            
-            # Añadir hoja de resumen
-            resumen_data = {
-                'Concepto': [
-                    'Total Viajes',
-                    'Viajes con Chofer Asignado',
-                    'Viajes con Camión Asignado',
-                    'Viajes con Acoplado Asignado',
-                    'Viajes (con todos los datos)'
-                ],
-                'Cantidad': [
-                    len(viajes_data),
-                    len([v for v in viajes_data if v['Chofer Nombre']]),
-                    len([v for v in viajes_data if v['Camión Dominio']]),
-                    len([v for v in viajes_data if v['Acoplado Dominio']]),
-                    len([v for v in viajes_data if v['Chofer Nombre'] and v['Camión Dominio'] and v['Acoplado Dominio']])
-                ]
-            }
-            df_resumen = pd.DataFrame(resumen_data)
-            df_resumen.to_excel(writer, sheet_name='Resumen', index=False)
-        
-        output.seek(0)
-        
-        filename = f'viaje_{time.strftime("%Y%m%d_%H%M%S")}.xlsx'
-        
-        response = make_response(send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        ))
-        
-        # Agregar headers para evitar caché
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        
-        return response
-        
+        params = validate_report_params(tipo, params)
+        versions = get_versions(db.session, report_tables(tipo))
+        key = ReportCache.make_key(tipo, params, versions)
+        if key in request.if_none_match:
+            response = make_response('', 304)
+        else:
+            cache = report_cache()
+            path = cache.get(key)
+            if path is None:
+                output = build_report_spooled(db.session, tipo, params)
+                with output:
+                    path = cache.put(key, output)
+            response = send_file(path, mimetype=XLSX_MIMETYPE, as_attachment=True,
+                                 download_name=report_filename(tipo, params))
+    except ReportError as e:
+        return jsonify({'error': str(e)}), e.status
     except Exception as e:
         return jsonify({'error': f'Error generando informe: {str(e)}'}), 500
 
+    response.set_etag(key)
+    # Se puede guardar, pero hay que revalidar siempre con el ETag.
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/api/informes/viajes-excel', methods=['GET'])
+def informe_datos_permanentes_excel():
+    """Genera un archivo Excel con datos de viajes y su información asociada (chofer, camión, acoplado)"""
+    return _report_response('viajes', {})
+
 @app.route('/api/informes/gastos-viaje-excel/<int:viaje_id>', methods=['GET'])
 def informe_gastos_viaje_excel(viaje_id):
     """Genera un archivo Excel con los gastos de un viaje específico"""
-    try:
-        import pandas as pd
-        from io import BytesIO
-        from flask import send_file
-        
-        # Verificar que el viaje existe
-        viaje = Viaje.query.get_or_404(viaje_id)
-        
-        # Obtener gastos del viaje con información adicional
-        gastos_query = db.session.query(
-            Gasto.id,
-            Gasto.monto,
-            Gasto.fecha,
-            Gasto.descripcion,
-            Gasto.moneda,
-            TipoDeGasto.nombre.label('tipo_gasto'),
-            Viaje.origen,
-            Viaje.destino,
-            Chofer.nombre.label('chofer_nombre'),
-            Chofer.apellido.label('chofer_apellido'),
-            Camion.dominio.label('camion_dominio'),
-            Camion.marca.label('camion_marca'),
-            Camion.modelo.label('camion_modelo'),
-            Acoplado.dominio.label('acoplado_dominio'),
-            Acoplado.marca.label('acoplado_marca'),
-            Acoplado.modelo.label('acoplado_modelo')
-        ).join(TipoDeGasto, Gasto.tipo_id == TipoDeGasto.id
-        ).join(Viaje, Gasto.viaje_id == Viaje.id
-        ).outerjoin(Chofer, Viaje.chofer_id == Chofer.id
-        ).outerjoin(Camion, Viaje.camion_dominio == Camion.dominio
-        ).outerjoin(Acoplado, Viaje.acoplado_dominio == Acoplado.dominio
-        ).filter(Gasto.viaje_id == viaje_id).all()
-        
-        if not gastos_query:
-            return jsonify({'error': 'No se encontraron gastos para este viaje'}), 404
-        
-        # Convertir a DataFrame
-        gastos_data = []
-        for row in gastos_query:
-            gastos_data.append({
-                'ID Gasto': row.id,
-                'Fecha': row.fecha.strftime('%Y-%m-%d %H:%M:%S') if row.fecha else '',
-                'Tipo de Gasto': row.tipo_gasto,
-                'Descripción': row.descripcion or '',
-                'Monto': row.monto,
-                'Moneda': row.moneda,
-                'Viaje - Origen': row.origen,
-                'Viaje - Destino': row.destino,
-                'Chofer': f"{row.chofer_nombre or ''} {row.chofer_apellido or ''}".strip(),
-                'Camión': f"{row.camion_dominio or ''} - {row.camion_marca or ''} {row.camion_modelo or ''}".strip(),
-                'Acoplado': f"{row.acoplado_dominio or ''} - {row.acoplado_marca or ''} {row.acoplado_modelo or ''}".strip()
-            })
-        
-        df_gastos = pd.DataFrame(gastos_data)
-        
-        # Crear archivo Excel en memoria
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df_gastos.to_excel(writer, sheet_name='Gastos del Viaje', index=False)
-            
-            # Añadir hoja de resumen
-            resumen_data = {
-                'Concepto': ['Viaje ID', 'Origen', 'Destino', 'Total Gastos', 'Cantidad de Gastos'],
-                'Valor': [
-                    viaje_id,
-                    viaje.origen,
-                    viaje.destino,
-                    len(gastos_data),
-                    f"{sum([g['Monto'] for g in gastos_data]):.2f}"
-                ]
-            }
-            df_resumen = pd.DataFrame(resumen_data)
-            df_resumen.to_excel(writer, sheet_name='Resumen', index=False)
-        
-        output.seek(0)
-        
-        filename = f'Gastos por Viaje_{viaje_id}_{time.strftime("%Y%m%d_%H%M%S")}.xlsx'
-        
-        response = make_response(send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        ))
-        
-        # Agregar headers para evitar caché
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        
-        return response
-        
-    except Exception as e:
-        return jsonify({'error': f'Error generando informe: {str(e)}'}), 500
+    return _report_response('gastos-viaje', {
+        'viaje_id': viaje_id,
+        'moneda_reporte': request.args.get('moneda_reporte'),
+    })
 
 @app.route('/api/informes/gastos-periodo-excel', methods=['GET'])
 def informe_gastos_periodo_excel():
     """Genera un archivo Excel con gastos de un período específico"""
+    return _report_response('gastos-periodo', {
+        'fecha_inicio': request.args.get('fecha_inicio'),
+        'fecha_fin': request.args.get('fecha_fin'),
+        'moneda_reporte': request.args.get('moneda_reporte'),
+    })
+
+# --- Informes asíncronos ---
+@app.route('/api/informes/jobs', methods=['POST'])
+def enqueue_report_job():
+    """Encola un informe. Body: {'tipo': 'viajes' | 'gastos-viaje' | 'gastos-periodo', 'params': {...}}"""
+    data = request.json or {}
     try:
-        import pandas as pd
-        from io import BytesIO
-        from flask import send_file
-        from datetime import datetime
-        
-        # Obtener parámetros de fecha
-        fecha_inicio = request.args.get('fecha_inicio')
-        fecha_fin = request.args.get('fecha_fin')
-        
-        if not fecha_inicio or not fecha_fin:
-            return jsonify({'error': 'Se requieren fecha_inicio y fecha_fin como parámetros'}), 400
-        
-        try:
-            fecha_inicio_dt = parse_date(fecha_inicio)
-            fecha_fin_dt = parse_date(fecha_fin)
-        except:
-            return jsonify({'error': 'Formato de fecha inválido. Use YYYY-MM-DD'}), 400
-        
-        # Obtener gastos del período
-        gastos_query = db.session.query(
-            Gasto.id,
-            Gasto.monto,
-            Gasto.fecha,
-            Gasto.descripcion,
-            Gasto.moneda,
-            TipoDeGasto.nombre.label('tipo_gasto'),
-            Viaje.id.label('viaje_id'),
-            Viaje.origen,
-            Viaje.destino,
-            Chofer.nombre.label('chofer_nombre'),
-            Chofer.apellido.label('chofer_apellido')
-        ).join(TipoDeGasto, Gasto.tipo_id == TipoDeGasto.id
-        ).join(Viaje, Gasto.viaje_id == Viaje.id
-        ).outerjoin(Chofer, Viaje.chofer_id == Chofer.id
-        ).filter(
-            Gasto.fecha >= fecha_inicio_dt,
-            Gasto.fecha <= fecha_fin_dt
-        ).order_by(Gasto.fecha.desc()).all()
-        
-        if not gastos_query:
-            return jsonify({'error': f'No se encontraron gastos entre {fecha_inicio} y {fecha_fin}'}), 404
-        
-        # Convertir a DataFrame
-        gastos_data = []
-        for row in gastos_query:
-            gastos_data.append({
-                'ID Gasto': row.id,
-                'Fecha': row.fecha.strftime('%Y-%m-%d %H:%M:%S') if row.fecha else '',
-                'Tipo de Gasto': row.tipo_gasto,
-                'Descripción': row.descripcion or '',
-                'Monto': row.monto,
-                'Moneda': row.moneda,
-                'ID Viaje': row.viaje_id,
-                'Origen': row.origen,
-                'Destino': row.destino,
-                'Chofer': f"{row.chofer_nombre or ''} {row.chofer_apellido or ''}".strip()
-            })
-        
-        df_gastos = pd.DataFrame(gastos_data)
-        
-        # Crear archivo Excel en memoria
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df_gastos.to_excel(writer, sheet_name='Gastos por Período', index=False)
-            
-            # Añadir hoja de resumen por tipo de gasto
-            resumen_por_tipo = df_gastos.groupby('Tipo de Gasto')['Monto'].agg(['count', 'sum']).reset_index()
-            resumen_por_tipo.columns = ['Tipo de Gasto', 'Cantidad', 'Total']
-            resumen_por_tipo.to_excel(writer, sheet_name='Resumen por Tipo', index=False)
-            
-            # Añadir hoja de resumen por moneda
-            resumen_por_moneda = df_gastos.groupby('Moneda')['Monto'].agg(['count', 'sum']).reset_index()
-            resumen_por_moneda.columns = ['Moneda', 'Cantidad', 'Total']
-            resumen_por_moneda.to_excel(writer, sheet_name='Resumen por Moneda', index=False)
-        
-        output.seek(0)
-        
-        filename = f'Gastos por Periodo_{fecha_inicio}_{fecha_fin}_{time.strftime("%Y%m%d_%H%M%S")}.xlsx'
-        
-        response = make_response(send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        ))
-        
-        # Agregar headers para evitar caché
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        
-        return response
-        
-    except Exception as e:
-        return jsonify({'error': f'Error generando informe: {str(e)}'}), 500
+        params = validate_report_params(data.get('tipo'), data.get('params'))
+        job = report_jobs().submit(data['tipo'], params)
+    except ReportError as e:
+        return jsonify({'error': str(e)}), e.status
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 429
+    response = jsonify(job)
+    response.headers['Location'] = f"/api/informes/jobs/{job['id']}"
+    return response, 202
+
+@app.route('/api/informes/jobs', methods=['GET'])
+def list_report_jobs():
+    return jsonify(report_jobs().list())
+
+@app.route('/api/informes/jobs/<string:job_id>', methods=['GET'])
+def get_report_job(job_id):
+    job = report_jobs().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Informe no encontrado'}), 404
+    return jsonify(job)
+
+@app.route('/api/informes/jobs/<string:job_id>', methods=['DELETE'])
+def cancel_report_job(job_id):
+    job = report_jobs().cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Informe no encontrado'}), 404
+    return jsonify(job), 202
+
+@app.route('/api/informes/jobs/<string:job_id>/download', methods=['GET'])
+def download_report_job(job_id):
+    found = report_jobs().artifact(job_id)
+    if found is None:
+        job = report_jobs().get(job_id)
+        if job is None:
+            return jsonify({'error': 'Informe no encontrado'}), 404
+        return jsonify({'error': 'El informe no está listo', 'status': job['status']}), 409
+    path, filename = found
+    return send_file(path, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=filename)
 
 
 # ----------------- Main Execution -----------------
 if __name__ == '__main__':
     # Usar el contexto de la aplicación para interactuar con la base de datos
     with app.app_context():
-        # Si el archivo de la base de datos no existe, créalo y llena los datos iniciales.
-        if not os.path.exists('cargoflow.db'):
+        # Si la base de datos todavía no tiene tablas, créalas y llena los datos iniciales.
+        # (Flask-SQLAlchemy ubica las rutas SQLite relativas dentro de instance/,
+        # así que no alcanza con buscar el archivo en el directorio actual.)
+        if not inspect(db.engine).has_table(Viaje.__tablename__):
             print("Base de datos no encontrada. Creando y poblando con datos iniciales...")
-            db.create_all()
+            upgrade(db.engine)
             init_db()
             print("Base de datos creada y poblada exitosamente.")
+        # Aplicar las migraciones pendientes (tablas e índices nuevos) a una base existente.
+        for number, name in upgrade(db.engine):
+            print(f"Migración {number} aplicada: {name}")
+        ensure_table_versions(db.session)
+        # Purgar los registros de bajas más viejos que el período de retención.
+        prune_tombstones(db.session, app.config['TOMBSTONE_RETENTION_DAYS'])
+        # Crear (y poblar) el índice de búsqueda si la base no lo tiene todavía.
+        ensure_search_index(db.engine)
+        # Pasar al almacén de fotos las que todavía estén en base64 dentro de la fila.
+        migrated = migrate_inline_photos(db.session, photo_store(), Camion)
+        if migrated:
+            print(f"{migrated} fotos de camiones movidas al almacén de fotos.")
     
     # Iniciar el servidor de desarrollo de Flask
     app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
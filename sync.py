@@ -0,0 +1,189 @@
+# sync.py
+
+"""Sincronización incremental de listados (`?since=<versión>`).
+
+Un contador global (`sync_state`) numera cada flush que escribe filas de las
+entidades sincronizadas. Antes del flush, cada fila nueva o modificada recibe
+ese número en `version` (y la hora en `updated_at`), y cada fila eliminada deja
+un registro en `tombstones`. Así un cliente que ya tiene los datos hasta la
+versión N pide sólo lo que cambió después:
+
+    GET /api/viajes?since=N -> {'items': [...], 'deleted': [...], 'version': M, 'reset': false}
+
+El cliente aplica primero `deleted` y después `items` (una fila puede haberse
+eliminado y vuelto a crear), y guarda `version` para la próxima consulta.
+`reset` indica que `since` es anterior al historial disponible (por un reset
+de la base o por tombstones ya purgados): `items` trae entonces la tabla completa.
+
+El UPDATE del contador toma el lock de escritura, así que las versiones se
+asignan en el mismo orden en que se confirman las transacciones.
+Las escrituras que no pasan por el ORM (cargas masivas) deben usar
+`stamp_rows` para numerar sus filas y `record_change` para notificarlas.
+
+Después de cada commit, los cambios (entidad, clave, operación, versión) se
+entregan a las funciones registradas con `on_commit` (ver events.py).
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from database import (Acoplado, Camion, Chofer, Gasto, Poliza, SyncState, TipoDeGasto,
+                      Tombstone, Viaje)
+
+# modelo -> nombre de la entidad en la API
+SYNC_ENTITIES = {
+    Chofer: 'choferes',
+    Camion: 'camiones',
+    Acoplado: 'acoplados',
+    Viaje: 'viajes',
+    Poliza: 'polizas',
+    TipoDeGasto: 'tiposDeGasto',
+    Gasto: 'gastos',
+}
+SYNC_MODELS = tuple(SYNC_ENTITIES)
+_SYNCED_TABLES = {model.__tablename__ for model in SYNC_MODELS}
+# Cambios de la transacción en curso, en session.info
+_PENDING_KEY = 'sync_pending'
+_CHANGES_KEY = 'sync_changes'
+_commit_listeners = []
+_STATE = SyncState.__table__
+_TOMBSTONES = Tombstone.__table__
+
+
+def _initial_version():
+    # Basado en el reloj, como los contadores de data_versions: después de un
+    # reset nunca se repite una versión ya entregada.
+    return int(time.time() * 1_000_000)
+
+
+def next_version(connection):
+    """Incrementa el contador global y devuelve el nuevo valor."""
+    result = connection.execute(
+        _STATE.update().where(_STATE.c.id == 1).values(version=_STATE.c.version + 1))
+    if result.rowcount == 0:
+        version = _initial_version()
+        connection.execute(_STATE.insert().values(id=1, version=version, floor=version))
+        return version
+    return connection.execute(select(_STATE.c.version).where(_STATE.c.id == 1)).scalar()
+
+
+def current_state(session):
+    """Devuelve (versión actual, piso del historial); (0, 0) si todavía no hubo escrituras."""
+    row = session.execute(select(_STATE.c.version, _STATE.c.floor).where(_STATE.c.id == 1)).first()
+    return (row.version, row.floor) if row else (0, 0)
+
+
+def stamp_rows(connection, rows):
+    """Numera con una versión nueva las filas (dicts) de una inserción masiva."""
+    version = next_version(connection)
+    now = datetime.now()
+    for row in rows:
+        row['version'] = version
+        row['updated_at'] = now
+    return version
+
+
+def _primary_key(obj):
+    return inspect(obj).mapper.primary_key_from_instance(obj)[0]
+
+
+def _row_key(obj):
+    return str(_primary_key(obj))
+
+
+def on_commit(callback):
+    """Registra `callback(changes)`, llamado después de cada commit que escribió
+    entidades sincronizadas. `changes` es una lista de dicts
+    {'entity', 'key', 'op', 'version'} en el orden en que se escribieron."""
+    _commit_listeners.append(callback)
+    return callback
+
+
+def record_change(session, version, entity, key, op):
+    """Agrega un cambio a los que se notificarán al confirmar la transacción
+    (para escrituras que no pasan por el ORM)."""
+    session.info.setdefault(_CHANGES_KEY, []).append(
+        {'entity': entity, 'key': key, 'op': op, 'version': version})
+
+
+@event.listens_for(Session, 'before_flush')
+def _stamp_changes(session, flush_context, instances):
+    changed = [obj for obj in session.new if obj.__table__.name in _SYNCED_TABLES]
+    changed += [obj for obj in session.dirty
+                if obj.__table__.name in _SYNCED_TABLES
+                and session.is_modified(obj, include_collections=False)]
+    deleted = [obj for obj in session.deleted if obj.__table__.name in _SYNCED_TABLES]
+    if not changed and not deleted:
+        return
+    version = next_version(session.connection())
+    now = datetime.now()
+    pending = session.info.setdefault(_PENDING_KEY, [])
+    for obj in changed:
+        obj.version = version
+        obj.updated_at = now
+        pending.append((version, obj, 'create' if obj in session.new else 'update'))
+    for obj in deleted:
+        session.add(Tombstone(table_name=obj.__table__.name, row_key=_row_key(obj),
+                              version=version, deleted_at=now))
+        pending.append((version, obj, 'delete'))
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    # Las claves autoincrementales recién existen después del flush.
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        for version, obj, op in pending:
+            record_change(session, version, SYNC_ENTITIES[type(obj)], _primary_key(obj), op)
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_commit(session):
+    changes = session.info.pop(_CHANGES_KEY, None)
+    if changes:
+        for callback in _commit_listeners:
+            callback(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_CHANGES_KEY, None)
+
+
+def changes_since(session, model, query, since):
+    """Filas de `query` (filtrada y proyectada por el llamador) cambiadas después
+    de `since`, claves eliminadas, nueva versión y si hace falta recarga total."""
+    # La versión se lee antes que las filas: lo que se escriba en el medio puede
+    # llegar dos veces, pero nunca se pierde.
+    version, floor = current_state(session)
+    if since < floor:
+        return {'rows': query.all(), 'deleted': [], 'version': version, 'reset': True}
+    key_type = inspect(model).primary_key[0].type.python_type
+    deleted = session.execute(
+        select(_TOMBSTONES.c.row_key)
+        .where(_TOMBSTONES.c.table_name == model.__tablename__, _TOMBSTONES.c.version > since)
+        .order_by(_TOMBSTONES.c.version)).scalars()
+    return {
+        'rows': query.filter(model.version > since).all(),
+        'deleted': [key_type(key) for key in dict.fromkeys(deleted)],
+        'version': version,
+        'reset': False,
+    }
+
+
+def prune_tombstones(session, max_age_days):
+    """Elimina los tombstones más viejos que `max_age_days` y sube el piso del
+    historial en consecuencia. Devuelve la cantidad eliminada."""
+    cutoff = datetime.now() - timedelta(days=max_age_days)
+    newest = session.execute(
+        select(func.max(_TOMBSTONES.c.version)).where(_TOMBSTONES.c.deleted_at < cutoff)).scalar()
+    if newest is None:
+        return 0
+    result = session.execute(_TOMBSTONES.delete().where(_TOMBSTONES.c.version <= newest))
+    session.execute(_STATE.update().where(_STATE.c.id == 1, _STATE.c.floor < newest).values(floor=newest))
+    session.commit()
+    return result.rowcount
@@ -0,0 +1,46 @@
+# tests/conftest.py
+
+"""La API sobre una base SQLite temporal, recreada y poblada con init_db() en cada test."""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# server.py lee la configuración del entorno al importarse.
+_WORKDIR = tempfile.mkdtemp(prefix='cargoflow-tests-')
+os.environ['CARGOFLOW_DATABASE_URI'] = f"sqlite:///{os.path.join(_WORKDIR, 'cargoflow.db')}"
+for _name, _folder in (('PHOTO_DIR', 'fotos'), ('REPORT_JOBS_DIR', 'report_jobs'),
+                       ('REPORT_CACHE_DIR', 'report_cache'), ('ANALYTICS_DIR', 'analytics_data')):
+    os.environ[f'CARGOFLOW_{_name}'] = os.path.join(_WORKDIR, _folder)
+
+import server  # noqa: E402
+from server import app, db  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture
+def client():
+    # Lo mismo que /api/reset, pero en este hilo.
+    with app.app_context():
+        db.session.close()
+        server.drop_search_index(db.engine)
+        server.drop_schema(db.engine)
+        server.upgrade(db.engine)
+        server.ensure_search_index(db.engine)
+        server.ensure_table_versions(db.session)
+        server.change_events.reset()
+        server.init_db()
+        server.dashboard_cache.clear()
+        server.lookup_cache.invalidate()
+        server.analytics_store.invalidate()
+        db.session.remove()
+    return app.test_client()
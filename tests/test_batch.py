@@ -0,0 +1,39 @@
+# tests/test_batch.py
+
+
+def test_batch_rejects_non_object_body(client):
+    response = client.post('/api/batch', json=[{'op': 'create', 'entity': 'gastos', 'data': {}}])
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_batch_integrity_error_hides_statement(client):
+    choferes = client.get('/api/choferes').get_json()
+    chofer = choferes[0]
+    data = {'nombre': 'Otro', 'apellido': 'Chofer', 'identificacion': chofer['identificacion']}
+    response = client.post('/api/batch', json={'operations': [
+        {'op': 'create', 'entity': 'choferes', 'data': {**data, 'identificacion': 'NUEVA-1'}},
+        {'op': 'create', 'entity': 'choferes', 'data': data},
+    ]})
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['index'] == 1
+    assert 'choferes.identificacion' in body['error']
+    assert 'INSERT' not in body['error'] and chofer['identificacion'] not in body['error']
+    assert len(client.get('/api/choferes').get_json()) == len(choferes)
+
+
+def test_batch_update_requires_valid_id(client):
+    for key in (None, 'abc', True):
+        operation = {'op': 'update', 'entity': 'gastos', 'data': {'monto': 1}}
+        if key is not None:
+            operation['id'] = key
+        response = client.post('/api/batch', json={'operations': [
+            {'op': 'create', 'entity': 'choferes', 'data': {'nombre': 'A', 'apellido': 'B', 'identificacion': 'X-1'}},
+            operation,
+        ]})
+        assert response.status_code == 400
+        assert response.get_json()['index'] == 1
+        assert 'id' in response.get_json()['error']
+    response = client.post('/api/batch', json={'operations': [{'op': 'delete', 'entity': 'camiones', 'id': 5}]})
+    assert response.status_code == 400
@@ -0,0 +1,58 @@
+# tests/test_bulk_import.py
+
+import io
+
+from bulk_import import BATCH_SIZE
+
+
+def _upload(client, content, filename='gastos.csv'):
+    data = {'file': (io.BytesIO(content), filename)}
+    return client.post('/api/gastos/import', data=data, content_type='multipart/form-data')
+
+
+def _viaje_id(client):
+    return client.get('/api/viajes?limit=1').get_json()['items'][0]['id']
+
+
+def test_import_csv_cp1252(client):
+    viaje_id = _viaje_id(client)
+    content = (f'monto;viaje_id;tipo;moneda;descripción\n'
+               f'1500;{viaje_id};Peaje;PYG;Peaje en Itá\n').encode('cp1252')
+    response = _upload(client, content)
+    assert response.status_code == 200
+    assert response.get_json()['inserted'] == 1
+    gastos = client.get(f'/api/gastos?viaje_id={viaje_id}').get_json()
+    assert 'Peaje en Itá' in [g['descripcion'] for g in gastos]
+
+
+def test_import_invalid_encoding_rejected_before_commit(client, monkeypatch):
+    monkeypatch.setattr('bulk_import.CSV_ENCODINGS', ('utf-8-sig',))
+    viaje_id = _viaje_id(client)
+    before = len(client.get('/api/gastos').get_json())
+    rows = ''.join(f'{i},{viaje_id},Peaje,PYG\n' for i in range(BATCH_SIZE + 10))
+    content = ('monto,viaje_id,tipo,moneda\n' + rows).encode('utf-8') + 'Itá,1,Peaje,PYG\n'.encode('cp1252')
+    response = _upload(client, content)
+    assert response.status_code == 400
+    assert response.get_json()['inserted'] == 0
+    assert len(client.get('/api/gastos').get_json()) == before
+
+
+def test_import_unreadable_row_reports_committed_rows(client):
+    viaje_id = _viaje_id(client)
+    rows = ''.join(f'{i},{viaje_id},Peaje,PYG\n' for i in range(BATCH_SIZE))
+    # Un campo más largo que csv.field_size_limit() hace fallar al lector.
+    content = ('monto,viaje_id,tipo,moneda\n' + rows + f'1,{viaje_id},Peaje,{"x" * 200_000}\n').encode('utf-8')
+    response = _upload(client, content)
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['inserted'] == BATCH_SIZE
+    assert f'Fila {BATCH_SIZE + 2}' in body['error']
+
+
+def test_import_summary_keys(client):
+    viaje_id = _viaje_id(client)
+    content = f'monto,viaje_id,tipo,moneda\n10,{viaje_id},Peaje,PYG\nx,{viaje_id},Peaje,PYG\n'.encode('utf-8')
+    body = _upload(client, content).get_json()
+    assert body['inserted'] == 1 and body['rejected'] == 1
+    assert body['errorsTruncated'] is False
+    assert 'errors_truncated' not in body
@@ -0,0 +1,25 @@
+# tests/test_coberturas.py
+
+import importlib.util
+import os
+
+from conftest import ROOT
+
+
+def test_module_does_not_shadow_coverage_tool():
+    spec = importlib.util.find_spec('coverage')
+    assert spec is None or os.path.dirname(os.path.abspath(spec.origin)) != ROOT
+
+
+def test_coberturas_endpoint(client):
+    response = client.get('/api/coberturas')
+    assert response.status_code == 200
+    assert isinstance(response.get_json(), list)
+
+
+def test_por_vencer_window_shared_with_dashboard():
+    import coberturas
+    import dashboard
+
+    assert coberturas.POR_VENCER_DIAS is dashboard.POR_VENCER_DIAS
+    assert coberturas.expiring.__defaults__[-1] == dashboard.POR_VENCER_DIAS
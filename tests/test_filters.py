@@ -0,0 +1,28 @@
+# tests/test_filters.py
+
+from datetime import date
+
+
+def _ids(response):
+    body = response.get_json()
+    return {item['id'] for item in (body['items'] if isinstance(body, dict) else body)}
+
+
+def test_hasta_date_only_includes_whole_day(client):
+    viaje = client.post('/api/viajes', json={'origen': 'Asunción', 'destino': 'Encarnación',
+                                             'fechaInicio': '2030-01-15T10:00', 'estado': 'Programado'}).get_json()
+    gasto = client.post('/api/gastos', json={'monto': 100, 'viajeId': viaje['id'], 'tipoId': 1,
+                                             'moneda': 'PYG', 'fecha': '2030-01-15T18:30'}).get_json()
+    for suffix in ('', '&limit=50'):
+        assert viaje['id'] in _ids(client.get(f'/api/viajes?desde=2030-01-15&hasta=2030-01-15{suffix}'))
+        assert viaje['id'] not in _ids(client.get(f'/api/viajes?desde=2030-01-14&hasta=2030-01-14{suffix}'))
+        assert viaje['id'] not in _ids(client.get(f'/api/viajes?desde=2030-01-15&hasta=2030-01-15T09:00{suffix}'))
+        assert gasto['id'] in _ids(client.get(f'/api/gastos?desde=2030-01-15&hasta=2030-01-15{suffix}'))
+        assert gasto['id'] not in _ids(client.get(f'/api/gastos?desde=2030-01-15&hasta=2030-01-15T18:00{suffix}'))
+
+
+def test_hasta_today_includes_seed_trips(client):
+    hoy = date.today().isoformat()
+    todos = client.get('/api/viajes').get_json()
+    de_hoy = {v['id'] for v in todos if (v['fechaInicio'] or '')[:10] <= hoy}
+    assert de_hoy and _ids(client.get(f'/api/viajes?hasta={hoy}')) == de_hoy
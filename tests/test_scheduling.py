@@ -0,0 +1,29 @@
+# tests/test_scheduling.py
+
+from datetime import datetime, timedelta
+
+from scheduling import DEFAULT_OPEN_TRIP_HOURS
+
+
+def _viaje(client, inicio, **resources):
+    return client.post('/api/viajes', json={'origen': 'Asunción', 'destino': 'Encarnación',
+                                            'fechaInicio': inicio.isoformat(timespec='minutes'),
+                                            'estado': 'Programado', **resources})
+
+
+def test_open_trip_blocks_only_its_default_length(client):
+    abierto = next(v for v in client.get('/api/viajes').get_json()
+                   if v['fechaFin'] is None and v['choferId'] is not None and v['camionDominio'])
+    inicio = datetime.fromisoformat(abierto['fechaInicio'])
+    resources = {'choferId': abierto['choferId'], 'camionDominio': abierto['camionDominio']}
+
+    response = _viaje(client, inicio + timedelta(hours=DEFAULT_OPEN_TRIP_HOURS - 1), **resources)
+    assert response.status_code == 409
+
+    despues = inicio + timedelta(hours=DEFAULT_OPEN_TRIP_HOURS + 1)
+    libres = client.get(f'/api/disponibilidad?desde={despues.isoformat(timespec="minutes")}').get_json()
+    assert abierto['choferId'] in [c['id'] for c in libres['choferes']]
+    assert abierto['camionDominio'] in [c['dominio'] for c in libres['camiones']]
+
+    response = _viaje(client, despues, **resources)
+    assert response.status_code == 201
@@ -0,0 +1,31 @@
+# tests/test_search.py
+
+import pytest
+
+
+@pytest.mark.parametrize('path', ['/api/search?q=a', '/api/choferes?q=a'])
+@pytest.mark.parametrize('limit', ['abc', '-1', '0'])
+def test_search_rejects_invalid_limit(client, path, limit):
+    response = client.get(f'{path}&limit={limit}')
+    assert response.status_code == 400
+    assert 'limit' in response.get_json()['error']
+
+
+def test_search_returns_raw_utf8(client):
+    client.post('/api/choferes', json={'nombre': 'Ñandú', 'apellido': 'Peña', 'identificacion': 'ÑP-1'})
+    for path in ('/api/search?q=Peña', '/api/choferes?q=Peña'):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert 'Peña'.encode('utf-8') in response.data
+        assert b'\\u00f1' not in response.data
+
+
+def test_rebuild_entry_point(client, capsys):
+    import search
+
+    dominio = client.get('/api/camiones?limit=1').get_json()['items'][0]['dominio']
+    assert search.main(['search.py', 'rebuild']) == 0
+    assert 'camiones_fts: reconstruido' in capsys.readouterr().out
+    dominios = [c['dominio'] for c in client.get(f'/api/search?q={dominio}').get_json()['camiones']]
+    assert dominio in dominios
+    assert search.main(['search.py']) == 2